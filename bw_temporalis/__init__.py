@@ -1,5 +1,7 @@
 __all__ = (
     "__version__",
+    "build_timelines",
+    "CharacterizedAccumulator",
     "check_database_exchanges",
     "easy_datetime_distribution",
     "easy_timedelta_distribution",
@@ -7,10 +9,18 @@ __all__ = (
     "FixedTD",
     "IncongruentDistribution",
     "loader_registry",
+    "LookupCache",
+    "MemorySink",
+    "monte_carlo_timeline",
+    "ParquetSink",
+    "read_timeline",
     "TDAware",
     "TemporalDistribution",
     "TemporalisLCA",
     "Timeline",
+    "TimelineCube",
+    "TimelineSink",
+    "write_timeline",
 )
 
 
@@ -21,7 +31,12 @@ from .temporal_distribution import (
     TDAware,
 )
 from .timeline import Timeline
-from .lca import TemporalisLCA
+from .cube import TimelineCube
+from .arrow import read_timeline, write_timeline
+from .sinks import CharacterizedAccumulator, MemorySink, ParquetSink, TimelineSink
+from .lca import LookupCache, TemporalisLCA
+from .batch import build_timelines
+from .montecarlo import monte_carlo_timeline
 from .utils import (
     IncongruentDistribution,
     check_database_exchanges,
@@ -0,0 +1,265 @@
+import shutil
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+from .timeline import Timeline
+
+# Suffixes of Arrow IPC (Feather version 2) files; anything else is read as Parquet
+IPC_SUFFIXES = (".arrow", ".feather", ".ipc")
+
+PARTITION_KEYS = ("year", "flow")
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError:
+        raise ImportError("`pyarrow` required for this function")
+    return pa, ds
+
+
+def timeline_schema(pa, partition_by: str | None = None):
+    """Arrow schema of timeline rows, with the columns of `Timeline.build_dataframe`"""
+    fields = [
+        ("date", pa.timestamp("s")),
+        ("amount", pa.float64()),
+        ("flow", pa.int64()),
+        ("activity", pa.int64()),
+    ]
+    if partition_by == "year":
+        fields.append(("year", pa.int64()))
+    return pa.schema(fields)
+
+
+def timeline_record_batch(
+    pa,
+    date: np.ndarray,
+    amount: np.ndarray,
+    flow: np.ndarray,
+    activity: np.ndarray,
+    partition_by: str | None = None,
+):
+    """Arrow record batch of timeline columns; Numpy arrays are wrapped without copying where possible"""
+    date = np.asarray(date).astype("datetime64[s]")
+    arrays = [pa.array(date), pa.array(amount), pa.array(flow), pa.array(activity)]
+    if partition_by == "year":
+        arrays.append(pa.array(date.astype("datetime64[Y]").astype(np.int64) + 1970))
+    return pa.RecordBatch.from_arrays(arrays, schema=timeline_schema(pa, partition_by))
+
+
+def check_partition_by(partition_by: str | None) -> None:
+    if partition_by is not None and partition_by not in PARTITION_KEYS:
+        raise ValueError(
+            f"Unknown partition key {partition_by}; must be one of {PARTITION_KEYS}"
+        )
+
+
+def prepare_dataset_directory(directory: Path | str, overwrite: bool = False) -> None:
+    """
+    Make sure `directory` is empty before a partitioned dataset is written to it.
+
+    Files of an earlier dataset would otherwise be read together with the new one. A non-empty
+    directory raises `ValueError`, unless `overwrite` is true, in which case it is deleted.
+    """
+    directory = Path(directory)
+    if directory.is_dir() and any(directory.iterdir()):
+        if not overwrite:
+            raise ValueError(
+                f"Directory {directory} is not empty; pass `overwrite=True` to replace it"
+            )
+        shutil.rmtree(directory)
+    elif directory.exists() and not directory.is_dir():
+        raise ValueError(f"{directory} is a file, not a directory")
+
+
+def write_partitioned_batches(
+    batches: Iterable, directory: Path | str, partition_by: str, basename: str = "part"
+) -> None:
+    """
+    Write record batches to a Hive-partitioned Parquet dataset, with one directory per `year` or `flow`.
+
+    Existing files with other base names are kept, so a dataset can be written in several calls.
+    """
+    pa, ds = _import_pyarrow()
+    ds.write_dataset(
+        batches,
+        base_dir=str(directory),
+        basename_template=basename + "-{i}.parquet",
+        format="parquet",
+        schema=timeline_schema(pa, partition_by),
+        partitioning=ds.partitioning(
+            pa.schema([(partition_by, pa.int64())]), flavor="hive"
+        ),
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def write_timeline(
+    timeline: Timeline,
+    filepath: Path | str,
+    partition_by: str | None = None,
+    batch_size: int = 1_000_000,
+    overwrite: bool = False,
+) -> None:
+    """
+    Write the rows of a `Timeline` to Parquet or Arrow IPC, without building a DataFrame.
+
+    Rows are written in batches of `batch_size` points directly from the timeline columns (see
+    `Timeline.columns`), in the order they were added, not sorted by date. Use `ParquetSink` to write
+    while the timeline is built instead.
+
+    Requires `pyarrow`.
+
+    Parameters
+    ----------
+    timeline : Timeline
+        Timeline to write.
+    filepath : Path | str
+        Output file. Files ending with `.arrow`, `.feather`, or `.ipc` are written as uncompressed Arrow
+        IPC, which can be memory-mapped when read; other files as Parquet. With `partition_by`, a
+        directory.
+    partition_by : str, optional
+        Write a Hive-partitioned Parquet dataset with one directory per `"year"` or `"flow"`.
+    batch_size : int
+        Number of points per record batch (and Parquet row group).
+    overwrite : bool
+        With `partition_by`, delete the directory if it isn't empty instead of raising `ValueError`.
+        Single files are always replaced.
+    """
+    pa, ds = _import_pyarrow()
+    check_partition_by(partition_by)
+    columns = timeline.columns
+
+    def batches() -> Iterator:
+        for start in range(0, len(columns["date"]), batch_size):
+            yield timeline_record_batch(
+                pa,
+                *(
+                    columns[label][start : start + batch_size]
+                    for label in ("date", "amount", "flow", "activity")
+                ),
+                partition_by=partition_by,
+            )
+
+    filepath = Path(filepath)
+    if partition_by is not None:
+        prepare_dataset_directory(filepath, overwrite=overwrite)
+        write_partitioned_batches(batches(), filepath, partition_by)
+    elif filepath.suffix in IPC_SUFFIXES:
+        with pa.ipc.new_file(filepath, timeline_schema(pa)) as writer:
+            for batch in batches():
+                writer.write_batch(batch)
+    else:
+        import pyarrow.parquet as pq
+
+        with pq.ParquetWriter(filepath, timeline_schema(pa)) as writer:
+            for batch in batches():
+                writer.write_batch(batch)
+
+
+def timeline_dataset(filepath: Path | str):
+    """
+    Open timeline rows written by `write_timeline` or `ParquetSink` as a `pyarrow.dataset.Dataset`.
+
+    Nothing is read until the dataset is scanned. Arrow IPC files are memory-mapped.
+    """
+    pa, ds = _import_pyarrow()
+    from pyarrow import fs
+
+    filepath = Path(filepath)
+    partitioning = None
+    if filepath.is_dir():
+        # Partition values are database ids or years; inferring their type would read large
+        # ids as strings
+        keys = {path.name.split("=")[0] for path in filepath.iterdir() if path.is_dir()}
+        partitioning = ds.partitioning(
+            pa.schema([(key, pa.int64()) for key in PARTITION_KEYS if key in keys]),
+            flavor="hive",
+        )
+    return ds.dataset(
+        str(filepath),
+        format="ipc" if filepath.suffix in IPC_SUFFIXES else "parquet",
+        partitioning=partitioning,
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def read_timeline(
+    filepath: Path | str,
+    date: tuple | None = None,
+    flow: Iterable[int] | None = None,
+    activity: Iterable[int] | None = None,
+) -> pd.DataFrame:
+    """
+    Read timeline rows written by `write_timeline` or `ParquetSink`, keeping only the selected rows.
+
+    The selection is pushed down to the file reader, so Parquet row groups and partition directories
+    whose statistics exclude it are skipped, and only matching rows are converted to Pandas.
+
+    Requires `pyarrow`.
+
+    Parameters
+    ----------
+    filepath : Path | str
+        File or partitioned directory.
+    date : tuple, optional
+        `(start, end)` of the dates to read; inclusive of the start, exclusive of the end. Either can be
+        `None`.
+    flow, activity : Iterable[int], optional
+        Ids to read.
+
+    Returns
+    -------
+    A Pandas DataFrame with the columns of `Timeline.build_dataframe`, sorted by date.
+    """
+    pa, ds = _import_pyarrow()
+    dataset = timeline_dataset(filepath)
+    has_year = "year" in dataset.schema.names
+
+    expression = None
+
+    def add(condition):
+        nonlocal expression
+        expression = condition if expression is None else expression & condition
+
+    if date is not None:
+        start, end = date
+        if start is not None:
+            start = np.datetime64(start, "s")
+            add(ds.field("date") >= pa.scalar(start, type=pa.timestamp("s")))
+            if has_year:
+                add(
+                    ds.field("year")
+                    >= int(start.astype("datetime64[Y]").astype(int)) + 1970
+                )
+        if end is not None:
+            end = np.datetime64(end, "s")
+            add(ds.field("date") < pa.scalar(end, type=pa.timestamp("s")))
+            if has_year:
+                add(
+                    ds.field("year")
+                    <= int(end.astype("datetime64[Y]").astype(int)) + 1970
+                )
+    if flow is not None:
+        add(ds.field("flow").isin([int(x) for x in flow]))
+    if activity is not None:
+        add(ds.field("activity").isin([int(x) for x in activity]))
+
+    df = dataset.to_table(
+        columns=["date", "amount", "flow", "activity"], filter=expression
+    ).to_pandas()
+    df = pd.DataFrame(
+        {
+            "date": pd.Series(data=df["date"].to_numpy(), dtype="datetime64[s]"),
+            "amount": pd.Series(data=df["amount"].to_numpy(), dtype="float64"),
+            "flow": pd.Series(data=df["flow"].to_numpy(), dtype="int64"),
+            "activity": pd.Series(data=df["activity"].to_numpy(), dtype="int64"),
+        }
+    )
+    df.sort_values(by="date", ascending=True, inplace=True, kind="stable")
+    df.reset_index(drop=True, inplace=True)
+    return df
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import bw2data as bd
+from bw2calc import LCA
+
+from .lca import LookupCache, TemporalisLCA
+from .timeline import Timeline
+
+
+def build_timelines(
+    demands: list[dict],
+    method: tuple,
+    max_workers: int | None = None,
+    build_timeline_kwargs: dict | None = None,
+    **kwargs: Any,
+) -> list[Timeline]:
+    """
+    Calculate a `Timeline` for each of many functional units from the same databases.
+
+    Compared to creating a separate `LCA` and `TemporalisLCA` for each demand, this shares:
+
+    * The `LCA` object and its matrices. The technosphere matrix is factorized once, and the
+      factorization is reused by every graph traversal.
+    * The scan of `static` databases.
+    * The database exchange lookups and deserialized temporal distributions (see `LookupCache`).
+
+    The `LCA` object loads the databases needed by all demands, so they don't have to share a
+    database. Graph traversal changes the state of the shared `LCA` object, so it is always done one
+    demand at a time. Each `TemporalisLCA` keeps a copy of the score of its own demand, and building
+    the timelines only reads the shared matrices, so with `max_workers` each timeline is built in a
+    worker thread while the next demand is traversed.
+
+    Parameters
+    ----------
+    demands : list[dict]
+        Functional units, in any form accepted by `bw2calc.LCA`, e.g. `{node: 1}`.
+    method : tuple
+        Impact assessment method used for graph traversal cutoffs.
+    max_workers : int, optional
+        Number of threads for building timelines in parallel.
+    build_timeline_kwargs : dict, optional
+        Arguments passed to each `TemporalisLCA.build_timeline` call.
+    kwargs
+        Arguments passed to each `TemporalisLCA`, e.g. `starting_datetime` or `cutoff`.
+
+    Returns
+    -------
+    List of `Timeline` instances, in the same order as `demands`.
+
+    """
+    if not demands:
+        return []
+    build_timeline_kwargs = build_timeline_kwargs or {}
+    lookup_cache = LookupCache()
+
+    # Load the data of all demands, as they can come from independent databases
+    demand_ids, data_objs, remapping_dicts = bd.prepare_lca_inputs(
+        demands=demands, method=method
+    )
+    lca = LCA(
+        demand_ids[0],
+        data_objs=data_objs,
+        remapping_dicts=remapping_dicts,
+    )
+    lca.lci(factorize=True)
+    lca.lcia()
+
+    def traverse(index: int, demand: dict) -> TemporalisLCA:
+        if index:
+            lca.lcia(demand=demand)
+        return TemporalisLCA(lca, lookup_cache=lookup_cache, **kwargs)
+
+    if not max_workers or max_workers == 1:
+        return [
+            traverse(index, demand).build_timeline(**build_timeline_kwargs)
+            for index, demand in enumerate(demand_ids)
+        ]
+
+    # Timelines are built in worker threads while the next demand is traversed
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(traverse(index, demand).build_timeline, **build_timeline_kwargs)
+            for index, demand in enumerate(demand_ids)
+        ]
+        return [future.result() for future in futures]
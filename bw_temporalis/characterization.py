@@ -0,0 +1,201 @@
+from functools import partial
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+# Results of FFT convolution smaller than this fraction of the largest possible value are round-off
+# noise, and are set to zero
+FFT_NOISE_TOLERANCE = 1e-12
+
+
+def vectorized(characterization_function: Callable) -> Callable:
+    """
+    Mark a characterization function as taking whole arrays instead of a single row.
+
+    A vectorized characterization function is called once for all selected rows of a timeline,
+    with the keyword arguments `date` (datetime64[s]), `amount`, `flow`, and `activity`, which are
+    one-dimensional Numpy arrays of the same length. It returns a Pandas DataFrame, or a
+    dictionary of arrays, with the columns `date`, `amount`, `flow`, and `activity`.
+
+    Functions which aren't marked are called once per row (see `rowwise_adapter`).
+    """
+    characterization_function.vectorized = True
+    return characterization_function
+
+
+def is_vectorized(characterization_function: Callable) -> bool:
+    """Is `characterization_function`, or the function wrapped by a `functools.partial`, vectorized?"""
+    while isinstance(characterization_function, partial):
+        characterization_function = characterization_function.func
+    return getattr(characterization_function, "vectorized", False)
+
+
+def rowwise_adapter(characterization_function: Callable) -> Callable:
+    """
+    Wrap a row-wise characterization function, which takes one row of `Timeline.df` as a Pandas
+    Series and returns a DataFrame, as a vectorized one.
+    """
+
+    @vectorized
+    def adapted(
+        date: np.ndarray,
+        amount: np.ndarray,
+        flow: np.ndarray,
+        activity: np.ndarray,
+    ) -> pd.DataFrame:
+        df = pd.DataFrame(
+            {
+                "date": pd.Series(data=date, dtype="datetime64[s]"),
+                "amount": pd.Series(data=amount, dtype="float64"),
+                "flow": pd.Series(data=flow, dtype="int64"),
+                "activity": pd.Series(data=activity, dtype="int64"),
+            }
+        )
+        if not len(df):
+            return df
+        return pd.concat([characterization_function(row) for _, row in df.iterrows()])
+
+    return adapted
+
+
+def broadcast_multipliers(
+    date: np.ndarray,
+    amount: np.ndarray,
+    flow: np.ndarray,
+    activity: np.ndarray,
+    multipliers: np.ndarray,
+    step: str = "Y",
+) -> dict[str, np.ndarray]:
+    """
+    Characterize all rows with the same time series of `multipliers` per unit amount.
+
+    Row `i` gives `len(multipliers)` result rows with `date[i] + j * step` and
+    `amount[i] * multipliers[j]`, calculated as one `(rows, len(multipliers))` broadcast instead
+    of a loop over rows.
+
+    Parameters
+    ----------
+    date, amount, flow, activity : numpy.ndarray
+        Timeline columns.
+    multipliers : numpy.ndarray
+        Characterized amount per unit emission for each time step.
+    step : str
+        Numpy time unit of one step, e.g. `"Y"` or `"D"`.
+
+    Returns
+    -------
+    Dictionary with the result columns `date`, `amount`, `flow`, and `activity`, ordered by input
+    row and then time step.
+    """
+    steps = np.arange(len(multipliers), dtype=f"timedelta64[{step}]").astype(
+        "timedelta64[s]"
+    )
+    return {
+        "date": (
+            np.asarray(date).astype("datetime64[s]")[:, None] + steps[None, :]
+        ).ravel(),
+        "amount": (
+            np.asarray(amount, dtype=np.float64)[:, None] * multipliers[None, :]
+        ).ravel(),
+        "flow": np.repeat(flow, len(multipliers)),
+        "activity": np.repeat(activity, len(multipliers)),
+    }
+
+
+def convolve_kernel(
+    emissions: np.ndarray, kernel: np.ndarray, method: str = "fft"
+) -> np.ndarray:
+    """
+    Full discrete convolution of a binned emission series with a characterization kernel.
+
+    `method` is passed to `scipy.signal.convolve`; the default `"fft"` costs `O(T log T)` for `T`
+    time bins, independent of the kernel length. Use `"direct"` for exact sums of products. FFT
+    round-off noise is removed, so bins without any contribution are exactly zero.
+    """
+    if not len(emissions) or not len(kernel):
+        return np.zeros(0)
+    result = signal.convolve(emissions, kernel, mode="full", method=method)
+    if method != "direct":
+        tolerance = FFT_NOISE_TOLERANCE * np.abs(emissions).sum() * np.abs(kernel).max()
+        result[np.abs(result) < tolerance] = 0
+    return result
+
+
+def characterize_binned(
+    date: np.ndarray,
+    amount: np.ndarray,
+    flow: np.ndarray,
+    kernels: dict[int, np.ndarray],
+    resolution: str = "Y",
+    method: str = "fft",
+) -> pd.DataFrame:
+    """
+    Characterize emissions by binning each flow onto a regular time grid and convolving with its kernel.
+
+    Characterization with a linear, time-invariant impulse response (such as the radiative forcing of
+    `bw_temporalis.lcia.radiative_forcing_kernel`) only depends on the emitted amount per time bin, so
+    the cost is one convolution per flow instead of one kernel per emission row.
+
+    Emissions are binned by calendar period, and an emission in bin `b` contributes `kernel[j]` to bin
+    `b + j`. With yearly resolution, this is the same as `bw_temporalis.lcia.characterize_per_year`.
+    It is not the same as characterizing each row with `Timeline.characterize_dataframe` and summing per
+    calendar year: row-wise functions step `j` times 365.2425 days from the emission date, which can
+    land in the previous or next calendar year for emissions close to the start or end of a year. The
+    totals per flow are the same.
+
+    Parameters
+    ----------
+    date, amount, flow : numpy.ndarray
+        Timeline columns.
+    kernels : dict[int, numpy.ndarray]
+        Characterized amount per unit emission for each time bin after the emission, per flow id. Rows of
+        other flows are ignored.
+    resolution : str
+        Numpy time unit of the grid and kernels, e.g. `"Y"`, `"M"`, or `"D"`. Emissions are placed at the
+        start of their bin.
+    method : str
+        Convolution method; see `convolve_kernel`.
+
+    Returns
+    -------
+    A Pandas DataFrame, sorted by date and flow, with the columns `date` (datetime64[s], start of each
+    bin), `amount`, and `flow`.
+    """
+    flow = np.asarray(flow)
+    mask = np.isin(flow, list(kernels))
+    bins = np.asarray(date)[mask].astype(f"datetime64[{resolution}]").astype(np.int64)
+    amount, flow = np.asarray(amount, dtype=np.float64)[mask], flow[mask]
+    flows = [f for f in kernels if np.any(flow == f)]
+
+    if not len(bins):
+        first, num_bins = 0, 0
+    else:
+        first = int(bins.min())
+        num_bins = int(bins.max()) - first + max(len(kernels[f]) for f in flows)
+    result = np.zeros((len(flows), num_bins))
+    for row, f in enumerate(flows):
+        selected = flow == f
+        emissions = np.bincount(bins[selected] - first, weights=amount[selected])
+        characterized = convolve_kernel(emissions, np.asarray(kernels[f]), method)
+        result[row, : len(characterized)] = characterized
+
+    df = pd.DataFrame(
+        {
+            "date": pd.Series(
+                data=np.tile(
+                    (np.arange(num_bins) + first).astype(f"datetime64[{resolution}]"),
+                    len(flows),
+                ).astype("datetime64[s]"),
+                dtype="datetime64[s]",
+            ),
+            "amount": pd.Series(data=result.ravel(), dtype="float64"),
+            "flow": pd.Series(
+                data=np.repeat(np.array(flows, dtype=np.int64), num_bins), dtype="int64"
+            ),
+        }
+    )
+    df.sort_values(by=["date", "flow"], ascending=True, inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    return df
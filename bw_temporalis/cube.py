@@ -0,0 +1,148 @@
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+AXES = ("date", "flow", "activity")
+
+
+class TimelineCube:
+    """
+    Sparse three-dimensional array of timeline amounts, with the axes time bin × flow × activity.
+
+    Stored in coordinate (COO) format: one integer code per axis and an amount for each nonzero cell. The
+    labels of each axis are sorted, so codes follow date, flow id, and activity id order. Create with
+    `Timeline.to_cube`.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        Integer array with shape `(3, nnz)`; axis codes of each cell. Cells must be unique.
+    amount : numpy.ndarray
+        Amount of each cell.
+    labels : tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]
+        Date (`datetime64[s]`; start of each bin), flow id, and activity id of each code.
+
+    Attributes
+    ----------
+    shape : tuple[int, int, int]
+    """
+
+    def __init__(
+        self,
+        coords: np.ndarray,
+        amount: np.ndarray,
+        labels: tuple[np.ndarray, np.ndarray, np.ndarray],
+    ):
+        self.coords = np.asarray(coords, dtype=np.int64)
+        self.amount = np.asarray(amount, dtype=np.float64)
+        self.labels = tuple(labels)
+        self.shape = tuple(len(label) for label in self.labels)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "TimelineCube":
+        """Build from a DataFrame with the columns `date`, `flow`, `activity`, and `amount`; duplicates are summed"""
+        codes, labels = zip(
+            *(pd.factorize(df[axis].to_numpy(), sort=True) for axis in AXES)
+        )
+        shape = tuple(len(label) for label in labels)
+        if not len(df):
+            return cls(np.zeros((3, 0), dtype=np.int64), np.zeros(0), labels)
+        flat = np.ravel_multi_index(codes, shape)
+        unique, inverse = np.unique(flat, return_inverse=True)
+        amount = np.bincount(inverse, weights=df["amount"].to_numpy())
+        return cls(np.vstack(np.unravel_index(unique, shape)), amount, labels)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.amount)
+
+    def _axis(self, axis: int | str) -> int:
+        return AXES.index(axis) if isinstance(axis, str) else axis
+
+    def sum(
+        self, axis: int | str | Iterable[int | str] | None = None
+    ) -> sparse.csr_matrix | np.ndarray | float:
+        """
+        Sum over one or more axes, given by number or name (`"date"`, `"flow"`, `"activity"`).
+
+        Returns
+        -------
+        A SciPy sparse CSR matrix if two axes remain, a dense Numpy array if one axis remains, or a float if
+        all axes are summed.
+        """
+        if axis is None:
+            return float(self.amount.sum())
+        if isinstance(axis, (int, str)):
+            axis = [axis]
+        summed = {self._axis(a) for a in axis}
+        kept = [a for a in range(3) if a not in summed]
+        if not kept:
+            return float(self.amount.sum())
+        if len(kept) == 2:
+            # Duplicate coordinates are summed by the conversion to CSR
+            return sparse.coo_matrix(
+                (self.amount, (self.coords[kept[0]], self.coords[kept[1]])),
+                shape=(self.shape[kept[0]], self.shape[kept[1]]),
+            ).tocsr()
+        return np.bincount(
+            self.coords[kept[0]], weights=self.amount, minlength=self.shape[kept[0]]
+        )
+
+    def select(
+        self,
+        date: slice | None = None,
+        flow: Iterable[int] | None = None,
+        activity: Iterable[int] | None = None,
+    ) -> "TimelineCube":
+        """
+        Subset of the cube. Axis codes are kept, so results of `sum` have the same shape as for the full cube.
+
+        Parameters
+        ----------
+        date : slice, optional
+            Range of dates; e.g. `slice(np.datetime64("2030-01-01"), None)`. Inclusive of the start, exclusive
+            of the end.
+        flow, activity : Iterable[int], optional
+            Ids to keep.
+        """
+        mask = np.ones(self.nnz, dtype=bool)
+        if date is not None:
+            dates = self.labels[0][self.coords[0]]
+            if date.start is not None:
+                mask &= dates >= np.datetime64(date.start, "s")
+            if date.stop is not None:
+                mask &= dates < np.datetime64(date.stop, "s")
+        for index, ids in ((1, flow), (2, activity)):
+            if ids is not None:
+                mask &= np.isin(self.labels[index][self.coords[index]], list(ids))
+        return TimelineCube(self.coords[:, mask], self.amount[mask], self.labels)
+
+    def matrix(self, date_index: int) -> sparse.csr_matrix:
+        """Flow × activity matrix of one time bin, as a SciPy sparse matrix"""
+        mask = self.coords[0] == date_index
+        return sparse.csr_matrix(
+            (self.amount[mask], (self.coords[1, mask], self.coords[2, mask])),
+            shape=self.shape[1:],
+        )
+
+    def to_dense(self) -> np.ndarray:
+        dense = np.zeros(self.shape)
+        dense[tuple(self.coords)] = self.amount
+        return dense
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Nonzero cells as a Pandas DataFrame with the columns `date`, `flow`, `activity`, and `amount`"""
+        return pd.DataFrame(
+            {
+                "date": pd.Series(
+                    data=self.labels[0][self.coords[0]], dtype="datetime64[s]"
+                ),
+                "flow": pd.Series(data=self.labels[1][self.coords[1]], dtype="int64"),
+                "activity": pd.Series(
+                    data=self.labels[2][self.coords[2]], dtype="int64"
+                ),
+                "amount": pd.Series(data=self.amount, dtype="float64"),
+            }
+        )
@@ -1,10 +1,20 @@
+import hashlib
 import json
+import multiprocessing
+import sys
+import tempfile
+import threading
+import time
 import warnings
 from collections import defaultdict
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from heapq import heappop, heappush
-from typing import Union
+from itertools import count
+from numbers import Number
+from pathlib import Path
+from typing import Any, Union
 
 import bw2data as bd
 import numpy as np
@@ -12,10 +22,42 @@ from bw2calc import LCA
 from bw2data.backends import ActivityDataset as AD
 from bw2data.backends import Exchange
 from bw2data.backends import ExchangeDataset as ED
+from bw2data.backends import sqlite3_lci_db
 from bw_graph_tools import NewNodeEachVisitGraphTraversal
+from bw_graph_tools.graph_traversal import Edge, Flow, Node
+from scipy.sparse.linalg import spsolve
 
+from .sinks import MemorySink, ParquetSink, TimelineSink
+from .storage import (
+    distributions_from_arrays,
+    distributions_to_arrays,
+    hash_matrix,
+    is_storable,
+    load_arrays,
+    load_cached_traversal,
+    load_checkpoint,
+    save_cached_traversal,
+    save_checkpoint,
+)
 from .temporal_distribution import TDAware, TemporalDistribution
 from .timeline import Timeline
+from .utils import chunks
+
+# Number of points to keep when simplifying pending distributions in
+# memory-bounded depth-first traversal
+SIMPLIFY_THRESHOLD = 100
+
+# Number of independent subtrees to create per worker in parallel timeline
+# construction; more subtrees give better load balancing
+SUBTREES_PER_WORKER = 4
+
+# State of a forked worker process, set by `_init_forked_worker` in the child only
+_WORKER_STATE = None
+
+# Sorted database ids of activities in `static` databases, keyed by the current
+# project and the names and modification timestamps of those databases; see
+# `static_activity_ids`
+_STATIC_IDS_CACHE = {}
 
 
 class MultipleTechnosphereExchanges(Exception):
@@ -28,6 +70,157 @@ class NoExchange:
     pass
 
 
+class LookupCache:
+    """
+    Database lookups which can be shared between `TemporalisLCA` instances built from the same databases.
+
+    Attributes
+    ----------
+    static_activity_indices : tuple | None
+        `(matrix mapper, static databases key, matrix indices)` of the last
+        translation of static database ids into matrix indices. `None` until first needed.
+    exchanges : dict[tuple[int, int], list[ExchangeDataset]]
+        Exchanges between `(input_id, output_id)` database ids.
+    distributions : dict[int, TemporalDistribution | TDAware]
+        Temporal distributions deserialized from JSON, keyed by exchange id.
+    """
+
+    def __init__(self):
+        self.static_activity_indices = None
+        self.exchanges = {}
+        self.distributions = {}
+
+
+class SpilledDistributions:
+    """A contiguous run of depth-first stack entries whose temporal distributions were written to disk.
+
+    Distributions are stored with `storage.distributions_to_arrays`, so all must be storable (see
+    `storage.is_storable`)."""
+
+    def __init__(
+        self,
+        filepath: Path,
+        entries: list[tuple[TemporalDistribution, Node]],
+    ):
+        self.filepath = filepath
+        self.nodes = [node for _, node in entries]
+        np.savez(filepath, **distributions_to_arrays([td for td, _ in entries], ""))
+
+    def load(self) -> list[tuple[TemporalDistribution, Node]]:
+        arrays = load_arrays(self.filepath)
+        self.filepath.unlink()
+        return list(zip(distributions_from_arrays(arrays, ""), self.nodes))
+
+
+def _static_databases_key() -> tuple[str, tuple[tuple[str, str | None], ...]]:
+    # Database names and ids are only unique within a project
+    return bd.projects.current, tuple(
+        (name, bd.databases[name].get("modified"))
+        for name in sorted(bd.databases)
+        if bd.databases[name].get("static")
+    )
+
+
+def static_activity_ids() -> np.ndarray:
+    """Sorted database ids of all activities in databases marked as `static`.
+
+    The ids are cached, and only queried again when the current project changes,
+    when a database is marked or unmarked as `static`, or when a static database
+    is modified."""
+    key = _static_databases_key()
+    if key not in _STATIC_IDS_CACHE:
+        _STATIC_IDS_CACHE.clear()
+        names = [name for name, _ in key[1]]
+        ids = (
+            [obj[0] for obj in AD.select(AD.id).where(AD.database << names).tuples()]
+            if names
+            else []
+        )
+        _STATIC_IDS_CACHE[key] = np.unique(np.array(ids, dtype=np.int64))
+    return _STATIC_IDS_CACHE[key]
+
+
+def _check_scheduler(
+    scheduler: str, memory_budget: int | None, memory_overflow: str
+) -> None:
+    if scheduler not in ("heap", "wavefront", "depth_first"):
+        raise ValueError(f"Unknown scheduler {scheduler}")
+    if memory_budget is not None and scheduler != "depth_first":
+        raise ValueError("`memory_budget` requires the `depth_first` scheduler")
+    if memory_overflow not in ("spill", "simplify"):
+        raise ValueError(f"Unknown `memory_overflow` value {memory_overflow}")
+
+
+def _earliest_offset(value: Any) -> float:
+    """Earliest relative time, in seconds, of an exchange value"""
+    if isinstance(value, Number):
+        return 0.0
+    elif type(value) is TemporalDistribution and np.issubdtype(
+        value.date.dtype, np.timedelta64
+    ):
+        return float(value.date.astype(np.int64).min())
+    return -np.inf
+
+
+def _td_nbytes(td: TemporalDistribution) -> int:
+    return td.date.nbytes + td.amount.nbytes
+
+
+def _process_executor_unavailable(sink: TimelineSink | None) -> str | None:
+    """Reason why the default `"process"` executor can't be used, or `None`.
+
+    Forking is only the default on Linux; on macOS system frameworks and
+    Accelerate-backed numpy can crash or hang in forked children. Forking is
+    only safe from a single-threaded process, which excludes calls from a
+    worker thread, such as in `build_timelines`, and Jupyter kernels. Sinks
+    may not be picklable. Forked workers need their own SQLite connection, so
+    the parent connection can't be in a transaction."""
+    if sink is not None:
+        return "a `sink` is given"
+    if not sys.platform.startswith("linux"):
+        return "`fork` is only used by default on Linux"
+    if (
+        threading.current_thread() is not threading.main_thread()
+        or threading.active_count() > 1
+    ):
+        return "other threads are running"
+    if sqlite3_lci_db.db.in_transaction():
+        return "the database connection is in a transaction"
+    return None
+
+
+def _init_forked_worker(
+    tlca: "TemporalisLCA",
+    partitions: list[list[tuple[TemporalDistribution, Node]]],
+    kwargs: dict,
+) -> None:
+    """Initializer of forked worker processes. The arguments are inherited via
+    `fork`, not pickled."""
+    global _WORKER_STATE
+    _WORKER_STATE = (tlca, partitions, kwargs)
+
+
+def _build_forked_partial_timeline(index: int) -> tuple[Timeline, int, dict]:
+    """Worker function for process pools; see `_init_forked_worker`. Only
+    `index` and the results are pickled.
+
+    Returns the partial `Timeline`, the number of convolutions, and the jitter
+    shifts drawn in the worker, which the parent merges back."""
+    tlca, partitions, kwargs = _WORKER_STATE
+    start_convolutions = tlca.convolution_count
+    known_shifts = set(tlca.jitter_shifts)
+    timeline = tlca._build_partial_timeline(partitions[index], **kwargs)
+    return (
+        timeline,
+        tlca.convolution_count - start_convolutions,
+        {
+            key: value
+            for key, value in tlca.jitter_shifts.items()
+            if key not in known_shifts
+        },
+    )
+
+
 class TemporalisLCA:
     """
     Calculate an LCA using graph traversal, with edges using temporal distributions.
@@ -73,6 +266,17 @@ class TemporalisLCA:
         The unique id of the functional unit. Strongly recommended to leave as default.
     graph_traversal : bw_graph_tools.NewNodeEachVisitGraphTraversal
         Optional subclass of `NewNodeEachVisitGraphTraversal` for advanced usage
+    cache_traversal : bool
+        Store the graph traversal results on disk, and reuse them when the functional unit, LCA
+        matrices, traversal settings, and database modification times are unchanged.
+    cache_dir : Path | str, optional
+        Directory for `cache_traversal`. Defaults to the `bw_temporalis` directory of the current project.
+    lookup_cache : LookupCache, optional
+        Share database lookups with other instances using the same databases. See `build_timelines`.
+    end_datetime : datetime.datetime | str, optional
+        End of the time horizon. Emissions after this point in time are left out of the `Timeline`,
+        and supply chain branches whose emissions can only happen after it aren't expanded. Their
+        score is reported in `Timeline.outside_horizon_score`.
 
     """
 
@@ -89,132 +293,1334 @@ class TemporalisLCA:
         graph_traversal: (
             NewNodeEachVisitGraphTraversal | None
         ) = NewNodeEachVisitGraphTraversal,
+        cache_traversal: bool | None = False,
+        cache_dir: Path | str | None = None,
+        lookup_cache: LookupCache | None = None,
+        end_datetime: datetime | str | None = None,
     ):
         self.lca_object = lca_object
+        # Copied, as the `LCA` object can be recalculated for another demand while this
+        # instance builds its timeline; see `build_timelines`
+        self.score = float(lca_object.score)
+        self.lookup_cache = lookup_cache or LookupCache()
         self.unique_id = functional_unit_unique_id
+        self.end_datetime = (
+            None if end_datetime is None else np.datetime64(end_datetime, "s")
+        )
         self.t0 = TemporalDistribution(
             np.array([np.datetime64(starting_datetime)]),
             np.array([1]),
         )
 
-        if static_activity_indices is None:
-            static_activity_indices = set()
-
-        for db in bd.databases:
-            if bd.databases[db].get("static"):
-                static_activity_indices.update(
-                    obj[0] for obj in AD.select(AD.id).where(AD.database == db).tuples()
-                )
-
         # Translate database indices to matrix indices which `graph_traversal` expects
         static_activity_indices = {
-            self.lca_object.dicts.activity[x] for x in static_activity_indices
+            self.lca_object.dicts.activity[x] for x in static_activity_indices or []
         }
+        static_activity_indices.update(self._static_database_indices())
 
-        print("Starting graph traversal")
-        gt = graph_traversal.calculate(
-            lca_object=lca_object,
-            static_activity_indices=static_activity_indices,
-            max_calc=max_calc,
-            cutoff=cutoff,
-            biosphere_cutoff=biosphere_cutoff,
-            separate_biosphere_flows=True,
-            skip_coproducts=skip_coproducts,
-            functional_unit_unique_id=functional_unit_unique_id,
-        )
+        traversal_settings = {
+            "static_activity_indices": static_activity_indices,
+            "max_calc": max_calc,
+            "cutoff": cutoff,
+            "biosphere_cutoff": biosphere_cutoff,
+            "separate_biosphere_flows": True,
+            "skip_coproducts": skip_coproducts,
+            "functional_unit_unique_id": functional_unit_unique_id,
+        }
+
+        gt = None
+        if cache_traversal:
+            if cache_dir is None:
+                cache_dir = bd.projects.request_directory("bw_temporalis")
+            cache_key, cache_state = self._traversal_cache_key(
+                graph_traversal=graph_traversal, **traversal_settings
+            )
+            gt = load_cached_traversal(cache_dir, cache_key, cache_state)
+            if gt is not None:
+                print("Using cached graph traversal")
+
+        if gt is None:
+            print("Starting graph traversal")
+            gt = graph_traversal.calculate(lca_object=lca_object, **traversal_settings)
+            if cache_traversal:
+                save_cached_traversal(cache_dir, cache_key, cache_state, gt)
         print("Calculation count:", gt["calculation_count"])
-        self.nodes = gt["nodes"]
-        self.edges = gt["edges"]
+        self.calculation_count = gt["calculation_count"]
+        self._set_traversal(nodes=gt["nodes"], edges=gt["edges"], flows=gt["flows"])
+
+    def _static_database_indices(self) -> set[int]:
+        """Matrix indices of the activities in `static` databases which are in the technosphere matrix"""
+        mapper = self.lca_object.technosphere_mm.col_mapper
+        key = _static_databases_key()
+        cached = self.lookup_cache.static_activity_indices
+        if cached is not None and cached[0] is mapper and cached[1] == key:
+            return cached[2]
+        ids = static_activity_ids()
+        indices = mapper.map_array(ids) if len(ids) else ids
+        indices = set(indices[indices >= 0].tolist())
+        self.lookup_cache.static_activity_indices = (mapper, key, indices)
+        return indices
+
+    def _traversal_cache_key(
+        self, graph_traversal: type, **traversal_settings: Any
+    ) -> tuple[str, str]:
+        """Return the cache `key` (what is calculated) and `state` (what it is calculated from)"""
+        settings = dict(traversal_settings)
+        settings["static_activity_indices"] = sorted(
+            int(x) for x in settings["static_activity_indices"]
+        )
+        key = {
+            "demand": sorted(
+                (int(k), float(v)) for k, v in self.lca_object.demand.items()
+            ),
+            "method": getattr(self.lca_object, "method", None),
+            # Characterization matrices can be given without a `method`
+            "characterization": hash_matrix(self.lca_object.characterization_matrix),
+            "graph_traversal": f"{graph_traversal.__module__}.{graph_traversal.__qualname__}",
+            "settings": settings,
+        }
+        state = {
+            "databases": {
+                name: bd.databases[name].get("modified")
+                for name in sorted(bd.databases)
+            },
+            "matrices": [
+                hash_matrix(getattr(self.lca_object, label))
+                for label in (
+                    "technosphere_matrix",
+                    "biosphere_matrix",
+                    "characterization_matrix",
+                )
+            ],
+        }
+        return tuple(
+            hashlib.sha256(json.dumps(obj, default=str).encode()).hexdigest()[:32]
+            for obj in (key, state)
+        )
+
+    def _set_traversal(
+        self, nodes: dict[int, Node], edges: list[Edge], flows: list[Flow]
+    ) -> None:
+        self.nodes = nodes
+        self.edges = edges
         self.edge_mapping = defaultdict(list)
         for edge in self.edges:
             self.edge_mapping[edge.consumer_unique_id].append(edge)
 
-        self.flows = gt["flows"]
+        self.flows = flows
         self.flow_mapping = defaultdict(list)
         for flow in self.flows:
             self.flow_mapping[flow.activity_unique_id].append(flow)
 
-    def build_timeline(self, node_timeline: bool | None = False) -> Timeline:
-        heap = []
-        timeline = Timeline()
+        # Earliest emission offset in the supply chain of each node; see `_subtree_offsets`
+        self.subtree_offsets = None
+        # Biosphere exchange counts per node for `node_timeline`; see `_node_flow_counts`
+        self.node_flow_counts = None
+        # Production amounts and date shifts of the current sample; see `resample`
+        self.production_amounts = None
+        self.jitter = None
+        self.jitter_shifts = {}
+        # Number of multiplications of a temporal distribution by an edge value
+        self.convolution_count = 0
+        # Unfinished heap and timeline from a budgeted `build_timeline` call
+        self.frontier = None
+        self.timeline = None
+
+    @classmethod
+    def from_checkpoint(
+        cls,
+        filepath: Path | str,
+        lca_object: LCA,
+        lookup_cache: LookupCache | None = None,
+    ) -> "TemporalisLCA":
+        """
+        Create an instance from a checkpoint written by `build_timeline`, without repeating the graph traversal.
 
+        Parameters
+        ----------
+        filepath : Path | str
+            Checkpoint file
+        lca_object : bw2calc.LCA
+            The same LCA as used for the checkpointed calculation. Its matrices are needed for the remaining edges.
+        lookup_cache : LookupCache, optional
+            Share database lookups with other instances using the same databases.
+
+        """
+        data = load_checkpoint(filepath)
+        obj = cls.__new__(cls)
+        obj.lca_object = lca_object
+        obj.score = float(lca_object.score)
+        obj.lookup_cache = lookup_cache or LookupCache()
+        obj.unique_id = data["unique_id"]
+        obj.end_datetime = data["end_datetime"]
+        obj.t0 = data["t0"]
+        obj._set_traversal(
+            nodes=data["nodes"], edges=data["edges"], flows=data["flows"]
+        )
+        obj.convolution_count = data["convolution_count"]
+        obj.calculation_count = data["calculation_count"]
+        obj.frontier = data["heap"]
+        obj.timeline = data["timeline"]
+        obj.checkpoint_node_timeline = data["node_timeline"]
+        return obj
+
+    @classmethod
+    def resume(
+        cls,
+        filepath: Path | str,
+        lca_object: LCA,
+        lookup_cache: LookupCache | None = None,
+        **kwargs: Any,
+    ) -> Timeline:
+        """
+        Continue an interrupted `build_timeline` call from its last checkpoint.
+
+        Checkpointing continues to `filepath` unless another `checkpoint` is given. The resumed
+        timeline keeps the aggregation of the checkpointed one; `sink` and `aggregate` can't be
+        given.
+
+        Parameters
+        ----------
+        filepath : Path | str
+            Checkpoint file
+        lca_object : bw2calc.LCA
+            The same LCA as used for the checkpointed calculation.
+        lookup_cache : LookupCache, optional
+            Share database lookups with other instances using the same databases.
+        kwargs
+            Other arguments passed to `build_timeline`, such as budgets or `checkpoint_interval`.
+
+        """
+        obj = cls.from_checkpoint(filepath, lca_object, lookup_cache=lookup_cache)
+        kwargs.setdefault("checkpoint", filepath)
+        kwargs.setdefault("node_timeline", obj.checkpoint_node_timeline)
+        if bool(kwargs["node_timeline"]) != obj.checkpoint_node_timeline:
+            raise ValueError(
+                "`node_timeline` must be the same as in the checkpointed calculation"
+            )
+        return obj.build_timeline(resume=True, **kwargs)
+
+    def build_timeline(
+        self,
+        node_timeline: bool | None = False,
+        scheduler: str | None = "heap",
+        memory_budget: int | None = None,
+        memory_overflow: str | None = "spill",
+        max_workers: int | None = None,
+        executor: str | None = None,
+        max_seconds: float | None = None,
+        max_convolutions: int | None = None,
+        max_points: int | None = None,
+        resume: bool | None = False,
+        checkpoint: Path | str | None = None,
+        checkpoint_interval: float | None = 600,
+        propagation_cutoff: float | None = None,
+        sink: TimelineSink | None = None,
+        aggregate: str | None = None,
+    ) -> Timeline:
+        """
+        Propagate temporal distributions through the traversed supply chain graph.
+
+        Parameters
+        ----------
+        node_timeline : bool
+            Experimental. Store one `NodeTD` per visited node instead of one `FlowTD` per biosphere flow.
+        scheduler : str
+            Order in which traversal nodes are processed. One of:
+
+            * `"heap"`: Priority queue ordered by the cumulative score of the consuming node (default). With a
+              budget or `checkpoint`, nodes with the largest absolute cumulative score are processed first.
+            * `"wavefront"`: Process the graph one depth level at a time. Edges with numeric values are
+              propagated for all pending distributions of a level in a single vectorized
+              multiplication, and each level is released as soon as the next one has been built.
+            * `"depth_first"`: Stack-based traversal. Only the distributions along the current path and
+              their siblings are pending at any time, so peak memory doesn't grow with the width of the
+              supply chain.
+        memory_budget : int, optional
+            Only for `"depth_first"`. Maximum number of bytes of pending temporal distributions to keep
+            in memory.
+        memory_overflow : str
+            Only for `"depth_first"`. What to do when `memory_budget` is exceeded. `"spill"` writes the
+            pending distributions furthest from being processed to a temporary directory, and loads them
+            again when they are needed; this doesn't change the result. Distributions of other classes
+            than `TemporalDistribution` and `FixedTD` stay in memory. `"simplify"` calls
+            `TemporalDistribution.simplify` on pending distributions with more than
+            `SIMPLIFY_THRESHOLD` points, losing some temporal resolution, and spills if that isn't
+            enough.
+        max_workers : int, optional
+            Build the timeline in parallel with this many workers. The supply chain is expanded from
+            the functional unit until there are enough independent subtrees, which are then shared
+            out between workers by cumulative score. Each worker builds a partial `Timeline` with the
+            given `scheduler`, and the partial timelines are merged.
+        executor : str, optional
+            Either `"thread"` or `"process"`. Propagation is pure Python, so because of the GIL
+            **threads don't make timeline construction faster**; they only help when a custom
+            `TemporalDistribution` or `sink` releases the GIL. Process pools use `fork`, so the
+            traversal tables and the LCA matrices are shared with the workers without copying. The
+            default is `"process"` on Linux. It falls back to `"thread"`, with a warning, on other
+            platforms, when a `sink` is given, as sinks are not necessarily picklable, when called
+            from a multi-threaded program such as a Jupyter kernel, as forking isn't safe while
+            other threads run, and inside a database transaction. `"process"` raises a
+            `ValueError` inside a database transaction, as workers need their own connection.
+        max_seconds : float, optional
+            Only for `"heap"`. Stop after this many seconds of wall-clock time.
+        max_convolutions : int, optional
+            Only for `"heap"`. Stop after this many multiplications of temporal distributions by edge
+            values.
+        max_points : int, optional
+            Only for `"heap"`. Stop once the timeline has this many more `(date, amount)` points.
+        resume : bool
+            Continue the unfinished timeline of the last budgeted call, with a new budget. The
+            unfinished timeline keeps its `sink` and aggregation, so `sink` and `aggregate` can't
+            be given.
+        checkpoint : Path | str, optional
+            Only for `"heap"`. File to periodically write the traversal tables, the heap, and the
+            partial timeline to, in a compressed binary format. Written every `checkpoint_interval`
+            seconds and when a budget is exhausted, and deleted when the timeline is complete. Use
+            `TemporalisLCA.resume` to continue from a checkpoint. Edges with temporal distributions
+            other than `TemporalDistribution` and `FixedTD` are rejected before the timeline is built.
+        checkpoint_interval : float
+            Seconds between checkpoints.
+        propagation_cutoff : float, optional
+            Fraction of the total LCIA score, in range `(0, 1)`. Unlike the traversal `cutoff`, this
+            applies to the propagated temporal distributions: a producer is not pushed when the
+            score of its supply chain for the amount in its distribution is below this fraction. The
+            skipped score is added to `Timeline.remainder` at the time of the consumer, so it can
+            still be accounted for without a temporal distribution of its own.
+        sink : TimelineSink, optional
+            Pass biosphere flow temporal distributions to this sink as they are produced, instead of
+            storing them in `Timeline.data`. For example, `CharacterizedAccumulator` directly builds a
+            characterized time series per flow. Parallel workers each fill a sink from
+            `sink.spawn()`, which are merged into `sink`. Not compatible with `node_timeline` or
+            `checkpoint`.
+        aggregate : str, optional
+            One of `"flow"`, `"activity"`, or `"flow+activity"`. Sum flow temporal distributions
+            into one distribution per key as they arrive, instead of keeping one `FlowTD` per
+            visited node and flow. See `Timeline`. Not compatible with `node_timeline` or `sink`.
+
+        Returns
+        -------
+        `Timeline`. The scheduler only changes the order of `Timeline.data`, not its content.
+
+        If a budget was exhausted, the returned timeline is partial: `Timeline.complete` is `False`
+        and `Timeline.unexplored_score` is the sum of the cumulative scores of the nodes which were
+        not processed. As nodes are processed in descending order of contribution, this is the most
+        complete timeline possible for the budget. The remaining heap is stored in `self.frontier`;
+        call again with `resume=True` to continue.
+
+        """
         if node_timeline:
             warnings.warn(
                 """This functionality is experimental, and will change.
 You have been warned."""
             )
 
-        for edge in self.edge_mapping[self.unique_id]:
-            node = self.nodes[edge.producer_unique_id]
-            heappush(
-                heap,
-                (
-                    1 / node.cumulative_score,
-                    self.t0 * edge.amount,
-                    node,
+        _check_scheduler(scheduler, memory_budget, memory_overflow)
+        if executor not in (None, "thread", "process"):
+            raise ValueError(f"Unknown executor {executor}")
+        if max_workers and max_workers > 1 and executor is None:
+            reason = _process_executor_unavailable(sink)
+            if reason is not None:
+                warnings.warn(
+                    f"Building the timeline with threads as {reason}; threads don't "
+                    "make timeline construction faster. Pass `executor` to silence "
+                    "this warning."
+                )
+            executor = "thread" if reason else "process"
+        if executor == "process" and isinstance(sink, ParquetSink):
+            raise ValueError("`ParquetSink` can't be used with the process executor")
+        if executor == "process" and sqlite3_lci_db.db.in_transaction():
+            raise ValueError(
+                "The process executor can't be used inside a database transaction"
+            )
+        budgeted = any(
+            x is not None for x in (max_seconds, max_convolutions, max_points)
+        )
+        if (budgeted or resume or checkpoint) and (scheduler != "heap" or max_workers):
+            raise ValueError(
+                "Budgets, checkpoints, and `resume` require the serial `heap` scheduler"
+            )
+
+        if self.end_datetime is not None:
+            self._subtree_offsets()
+        if node_timeline:
+            self._node_flow_counts()
+
+        if sink is not None and (node_timeline or checkpoint):
+            raise ValueError(
+                "`sink` can't be used with `node_timeline` or `checkpoint`"
+            )
+        if aggregate is not None and node_timeline:
+            raise ValueError("`aggregate` can't be used with `node_timeline`")
+        if checkpoint:
+            self._check_checkpoint_distributions()
+
+        if resume:
+            if self.frontier is None:
+                raise ValueError("No unfinished timeline to resume")
+            if sink is not None or aggregate is not None:
+                raise ValueError(
+                    "`sink` and `aggregate` can't be changed when resuming a timeline"
+                )
+            return self._build_heap_timeline(
+                heap=self.frontier,
+                timeline=self.timeline,
+                node_timeline=node_timeline,
+                max_seconds=max_seconds,
+                max_convolutions=max_convolutions,
+                max_points=max_points,
+                checkpoint=checkpoint,
+                checkpoint_interval=checkpoint_interval,
+                propagation_cutoff=propagation_cutoff,
+            )
+        elif budgeted or checkpoint:
+            return self._build_heap_timeline(
+                heap=self._new_heap(
+                    self._functional_unit_frontier(), by_contribution=True
                 ),
+                timeline=Timeline(sink=sink, aggregate=aggregate),
+                node_timeline=node_timeline,
+                max_seconds=max_seconds,
+                max_convolutions=max_convolutions,
+                max_points=max_points,
+                checkpoint=checkpoint,
+                checkpoint_interval=checkpoint_interval,
+                propagation_cutoff=propagation_cutoff,
             )
 
-        while heap:
-            _, td, node = heappop(heap)
-            if node_timeline:
-                num_flows, num_flows_td = 0, 0
-                for flow in self.flow_mapping.get(node.unique_id, []):
-                    for exchange in self.get_biosphere_exchanges(
-                        flow.flow_datapackage_id, node.activity_datapackage_id
-                    ):
-                        if exchange.data.get("temporal_distribution"):
-                            num_flows_td += 1
-                        num_flows += 1
-                timeline.add_node_temporal_distribution(
-                    td=td,
-                    activity=node.activity_datapackage_id,
-                    num_flows=num_flows,
-                    num_flows_td=num_flows_td,
+        timeline = Timeline(sink=sink, aggregate=aggregate)
+
+        kwargs = {
+            "node_timeline": node_timeline,
+            "scheduler": scheduler,
+            "memory_budget": memory_budget,
+            "memory_overflow": memory_overflow,
+            "propagation_cutoff": propagation_cutoff,
+            "sink": sink,
+            "aggregate": aggregate,
+        }
+        frontier = self._functional_unit_frontier()
+
+        if not max_workers or max_workers == 1:
+            for td, node in self._schedule(frontier, timeline=timeline, **kwargs):
+                self._add_node_to_timeline(
+                    td=td, node=node, timeline=timeline, node_timeline=node_timeline
                 )
-            else:
-                for flow in self.flow_mapping.get(node.unique_id, []):
-                    for exchange in self.get_biosphere_exchanges(
-                        flow.flow_datapackage_id, node.activity_datapackage_id
-                    ):
-                        value = self._exchange_value(
-                            exchange=exchange,
-                            row_id=flow.flow_datapackage_id,
-                            col_id=node.activity_datapackage_id,
-                            matrix_label="biosphere_matrix",
-                        )
-                        timeline.add_flow_temporal_distribution(
-                            td=(td * value).simplify(),
-                            flow=flow.flow_datapackage_id,
-                            activity=node.activity_datapackage_id,
-                        )
+            return timeline
+
+        partitions = self._partition_frontier(
+            frontier,
+            num_partitions=max_workers,
+            timeline=timeline,
+            node_timeline=node_timeline,
+            propagation_cutoff=propagation_cutoff,
+        )
+        for partial in self._build_partial_timelines(
+            partitions, max_workers=max_workers, executor=executor, **kwargs
+        ):
+            timeline.extend(partial)
+        return timeline
+
+    def iter_timeline(
+        self,
+        scheduler: str | None = "heap",
+        memory_budget: int | None = None,
+        memory_overflow: str | None = "spill",
+        propagation_cutoff: float | None = None,
+    ) -> Iterator[tuple[int, int, TemporalDistribution]]:
+        """
+        Generate the biosphere flow temporal distributions of `build_timeline` as they are produced.
+
+        Nothing is kept after a record has been yielded, so results can be written out or reduced
+        while the supply chain is still being explored. To push records to a `TimelineSink`
+        instead, use `build_timeline(sink=...)`.
+
+        Parameters
+        ----------
+        scheduler, memory_budget, memory_overflow, propagation_cutoff
+            See `build_timeline`.
 
-            for edge in self.edge_mapping[node.unique_id]:
-                row_id = self.nodes[edge.producer_unique_id].activity_datapackage_id
-                col_id = node.activity_datapackage_id
-                exchange = self.get_technosphere_exchange(
-                    input_id=row_id,
-                    output_id=col_id,
+        Returns
+        -------
+        Generator of `(flow, activity, TemporalDistribution)` tuples. The generator's return value
+        (`StopIteration.value`) is a `Timeline` without `data`, which holds `remainder` and
+        `outside_horizon_score`.
+
+        """
+        _check_scheduler(scheduler, memory_budget, memory_overflow)
+        if self.end_datetime is not None:
+            self._subtree_offsets()
+
+        buffer = MemorySink()
+        timeline = Timeline(sink=buffer)
+        for td, node in self._schedule(
+            self._functional_unit_frontier(),
+            scheduler=scheduler,
+            memory_budget=memory_budget,
+            memory_overflow=memory_overflow,
+            propagation_cutoff=propagation_cutoff,
+            timeline=timeline,
+        ):
+            self._add_node_to_timeline(
+                td=td, node=node, timeline=timeline, node_timeline=False
+            )
+            yield from buffer.records
+            buffer.records.clear()
+        timeline.sink = None
+        return timeline
+
+    def _build_heap_timeline(
+        self,
+        heap: list,
+        timeline: Timeline,
+        node_timeline: bool,
+        max_seconds: float | None = None,
+        max_convolutions: int | None = None,
+        max_points: int | None = None,
+        checkpoint: Path | str | None = None,
+        checkpoint_interval: float | None = 600,
+        propagation_cutoff: float | None = None,
+    ) -> Timeline:
+        self.frontier, self.timeline = heap, timeline
+        start_time = last_checkpoint = time.perf_counter()
+        start_convolutions = self.convolution_count
+        points = 0
+
+        for td, node in self._heap_schedule(
+            heap,
+            propagation_cutoff=propagation_cutoff,
+            timeline=timeline,
+            by_contribution=True,
+        ):
+            points_before = timeline.points_added
+            self._add_node_to_timeline(
+                td=td, node=node, timeline=timeline, node_timeline=node_timeline
+            )
+            points += timeline.points_added - points_before
+            if (
+                checkpoint
+                and heap
+                and time.perf_counter() - last_checkpoint >= checkpoint_interval
+            ):
+                save_checkpoint(checkpoint, self, node_timeline=node_timeline)
+                last_checkpoint = time.perf_counter()
+            if (
+                (
+                    max_seconds is not None
+                    and time.perf_counter() - start_time >= max_seconds
                 )
-                value = (
-                    self._exchange_value(
-                        exchange=exchange,
-                        row_id=row_id,
-                        col_id=col_id,
-                        matrix_label="technosphere_matrix",
+                or (
+                    max_convolutions is not None
+                    and self.convolution_count - start_convolutions >= max_convolutions
+                )
+                or (max_points is not None and points >= max_points)
+            ):
+                break
+
+        timeline.complete = not heap
+        timeline.unexplored_score = float(
+            sum(node.cumulative_score for _, _, _, node in heap)
+        )
+        if timeline.complete:
+            self.frontier = self.timeline = None
+            if checkpoint and Path(checkpoint).exists():
+                Path(checkpoint).unlink()
+        elif checkpoint:
+            save_checkpoint(checkpoint, self, node_timeline=node_timeline)
+        return timeline
+
+    def _schedule(
+        self,
+        frontier: list[tuple[TemporalDistribution, Node]],
+        scheduler: str = "heap",
+        memory_budget: int | None = None,
+        memory_overflow: str = "spill",
+        propagation_cutoff: float | None = None,
+        timeline: Timeline | None = None,
+        **kwargs: Any,
+    ) -> Iterator[tuple[TemporalDistribution, Node]]:
+        propagation = {"propagation_cutoff": propagation_cutoff, "timeline": timeline}
+        if scheduler == "heap":
+            return self._heap_schedule(self._new_heap(frontier), **propagation)
+        elif scheduler == "wavefront":
+            return self._wavefront_schedule(frontier, **propagation)
+        else:
+            return self._depth_first_schedule(
+                frontier,
+                memory_budget=memory_budget,
+                memory_overflow=memory_overflow,
+                **propagation,
+            )
+
+    def _build_partial_timeline(
+        self,
+        frontier: list[tuple[TemporalDistribution, Node]],
+        node_timeline: bool = False,
+        sink: TimelineSink | None = None,
+        aggregate: str | None = None,
+        **kwargs: Any,
+    ) -> Timeline:
+        timeline = Timeline(
+            sink=None if sink is None else sink.spawn(), aggregate=aggregate
+        )
+        for td, node in self._schedule(frontier, timeline=timeline, **kwargs):
+            self._add_node_to_timeline(
+                td=td, node=node, timeline=timeline, node_timeline=node_timeline
+            )
+        return timeline
+
+    def _partition_frontier(
+        self,
+        frontier: list[tuple[TemporalDistribution, Node]],
+        num_partitions: int,
+        timeline: Timeline,
+        node_timeline: bool,
+        propagation_cutoff: float | None = None,
+    ) -> list[list[tuple[TemporalDistribution, Node]]]:
+        """Split the supply chain into independent subtrees.
+
+        Normally the functional unit has a single input, so we expand the
+        largest frontier nodes (adding their flows to `timeline`) until there
+        are enough subtrees. The subtrees are then assigned greedily to the
+        partition with the lowest total cumulative score."""
+        frontier = list(frontier)
+        while 0 < len(frontier) < num_partitions * SUBTREES_PER_WORKER:
+            index = max(
+                range(len(frontier)),
+                key=lambda i: abs(frontier[i][1].cumulative_score),
+            )
+            td, node = frontier.pop(index)
+            self._add_node_to_timeline(
+                td=td, node=node, timeline=timeline, node_timeline=node_timeline
+            )
+            frontier.extend(
+                self._propagate(
+                    td,
+                    node,
+                    propagation_cutoff=propagation_cutoff,
+                    timeline=timeline,
+                )
+            )
+
+        partitions = [[] for _ in range(num_partitions)]
+        loads = [0.0] * num_partitions
+        for td, node in sorted(
+            frontier, key=lambda pair: abs(pair[1].cumulative_score), reverse=True
+        ):
+            index = loads.index(min(loads))
+            partitions[index].append((td, node))
+            loads[index] += abs(node.cumulative_score)
+        return [partition for partition in partitions if partition]
+
+    def _build_partial_timelines(
+        self,
+        partitions: list[list[tuple[TemporalDistribution, Node]]],
+        max_workers: int,
+        executor: str,
+        **kwargs: Any,
+    ) -> list[Timeline]:
+        if executor == "thread":
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                return list(
+                    pool.map(
+                        lambda partition: self._build_partial_timeline(
+                            partition, **kwargs
+                        ),
+                        partitions,
                     )
-                    / node.reference_product_production_amount
                 )
-                producer = self.nodes[edge.producer_unique_id]
+
+        try:
+            context = multiprocessing.get_context("fork")
+        except ValueError:
+            raise ValueError("Process executor requires the `fork` start method")
+        # Children must open their own SQLite connection; `build_timeline` has
+        # checked that no transaction is open
+        connected = not sqlite3_lci_db.db.is_closed()
+        sqlite3_lci_db.db.close()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=context,
+                initializer=_init_forked_worker,
+                initargs=(self, partitions, kwargs),
+            ) as pool:
+                results = list(
+                    pool.map(_build_forked_partial_timeline, range(len(partitions)))
+                )
+        finally:
+            if connected:
+                sqlite3_lci_db.db.connect(reuse_if_open=True)
+
+        timelines = []
+        for timeline, convolution_count, jitter_shifts in results:
+            self.convolution_count += convolution_count
+            for key, value in jitter_shifts.items():
+                self.jitter_shifts.setdefault(key, value)
+            timelines.append(timeline)
+        return timelines
+
+    def _functional_unit_frontier(self) -> list[tuple[TemporalDistribution, Node]]:
+        return [
+            (self.t0 * edge.amount, self.nodes[edge.producer_unique_id])
+            for edge in self.edge_mapping[self.unique_id]
+        ]
+
+    @staticmethod
+    def _heap_priority(node: Node, consumer: Node, by_contribution: bool) -> float:
+        """Heap key of `node`, pushed by `consumer`. Budgeted builds process the largest contributions
+        first; otherwise nodes are ordered by the cumulative score of their consumer."""
+        if by_contribution:
+            return -abs(node.cumulative_score)
+        return 1 / consumer.cumulative_score
+
+    def _new_heap(
+        self,
+        frontier: list[tuple[TemporalDistribution, Node]],
+        by_contribution: bool = False,
+    ) -> list:
+        heap = []
+        for index, (td, node) in enumerate(frontier):
+            heappush(
+                heap,
+                (self._heap_priority(node, node, by_contribution), index, td, node),
+            )
+        return heap
+
+    def _heap_schedule(
+        self,
+        heap: list,
+        propagation_cutoff: float | None = None,
+        timeline: Timeline | None = None,
+        by_contribution: bool = False,
+    ) -> Iterator[tuple[TemporalDistribution, Node]]:
+        """Pop from `heap`, which is modified in place.
+
+        Children are pushed before the node is yielded, so that `heap` is
+        always a complete frontier when the consumer stops iterating."""
+        # The counter breaks ties between equal priorities, so we never fall back
+        # to comparing temporal distributions.
+        counter = count(max((entry[1] for entry in heap), default=-1) + 1)
+        while heap:
+            _, _, td, node = heappop(heap)
+            for producer_td, producer in self._propagate(
+                td, node, propagation_cutoff=propagation_cutoff, timeline=timeline
+            ):
                 heappush(
                     heap,
                     (
-                        1 / node.cumulative_score,
-                        (td * value).simplify(),
+                        self._heap_priority(producer, node, by_contribution),
+                        next(counter),
+                        producer_td,
                         producer,
                     ),
                 )
-        return timeline
+            yield td, node
+
+    def _wavefront_schedule(
+        self,
+        frontier: list[tuple[TemporalDistribution, Node]],
+        propagation_cutoff: float | None = None,
+        timeline: Timeline | None = None,
+    ) -> Iterator[tuple[TemporalDistribution, Node]]:
+        level = frontier
+        while level:
+            yield from level
+            level = self._propagate_level(
+                level, propagation_cutoff=propagation_cutoff, timeline=timeline
+            )
+
+    def _depth_first_schedule(
+        self,
+        frontier: list[tuple[TemporalDistribution, Node]],
+        memory_budget: int | None = None,
+        memory_overflow: str = "spill",
+        propagation_cutoff: float | None = None,
+        timeline: Timeline | None = None,
+    ) -> Iterator[tuple[TemporalDistribution, Node]]:
+        # Entries are either `(td, node)` tuples or `SpilledDistributions`
+        stack = list(reversed(frontier))
+        live = sum(_td_nbytes(td) for td, _ in stack)
+
+        with tempfile.TemporaryDirectory() as dirpath:
+            spill_counter = count()
+            while stack:
+                entry = stack.pop()
+                if isinstance(entry, SpilledDistributions):
+                    loaded = entry.load()
+                    live += sum(_td_nbytes(td) for td, _ in loaded)
+                    stack.extend(loaded)
+                    continue
+
+                td, node = entry
+                live -= _td_nbytes(td)
+                yield td, node
+
+                children = list(
+                    self._propagate(
+                        td,
+                        node,
+                        propagation_cutoff=propagation_cutoff,
+                        timeline=timeline,
+                    )
+                )
+                del td, entry
+                # Reversed so that children are processed in edge order
+                stack.extend(reversed(children))
+                live += sum(_td_nbytes(td) for td, _ in children)
+                del children
+
+                if memory_budget is not None and live > memory_budget:
+                    if memory_overflow == "simplify":
+                        live = self._simplify_stack(stack)
+                    if live > memory_budget:
+                        live = self._spill_stack(
+                            stack,
+                            live=live,
+                            target=memory_budget // 2,
+                            dirpath=Path(dirpath),
+                            counter=spill_counter,
+                        )
+
+    def _simplify_stack(self, stack: list) -> int:
+        live = 0
+        for index, entry in enumerate(stack):
+            if isinstance(entry, SpilledDistributions):
+                continue
+            td, node = entry
+            if len(td) > SIMPLIFY_THRESHOLD and type(td) is TemporalDistribution:
+                td = td.simplify(threshhold=SIMPLIFY_THRESHOLD)
+                stack[index] = (td, node)
+            live += _td_nbytes(td)
+        return live
+
+    @staticmethod
+    def _spill_stack(
+        stack: list, live: int, target: int, dirpath: Path, counter: count
+    ) -> int:
+        """Spill runs of in-memory entries, starting from the bottom of the stack,
+        until at most `target` bytes remain in memory. The top of the stack is
+        never spilled, and neither are distributions which can't be stored (see
+        `storage.is_storable`)."""
+
+        def spillable(entry) -> bool:
+            return not isinstance(entry, SpilledDistributions) and is_storable(entry[0])
+
+        index = 0
+        while live > target and index < len(stack) - 1:
+            if not spillable(stack[index]):
+                index += 1
+                continue
+            end = index
+            while end < len(stack) - 1 and spillable(stack[end]):
+                end += 1
+            run = stack[index:end]
+            live -= sum(_td_nbytes(td) for td, _ in run)
+            stack[index:end] = [
+                SpilledDistributions(
+                    filepath=dirpath / f"spill-{next(counter)}.npz", entries=run
+                )
+            ]
+            index += 1
+        return live
+
+    def _add_node_to_timeline(
+        self,
+        td: TemporalDistribution,
+        node: Node,
+        timeline: Timeline,
+        node_timeline: bool,
+    ) -> None:
+        if node_timeline:
+            num_flows, num_flows_td = self._node_flow_counts()[node.unique_id]
+            timeline.add_node_temporal_distribution(
+                td=td,
+                activity=node.activity_datapackage_id,
+                num_flows=int(num_flows),
+                num_flows_td=int(num_flows_td),
+            )
+        else:
+            for flow in self.flow_mapping.get(node.unique_id, []):
+                for exchange in self.get_biosphere_exchanges(
+                    flow.flow_datapackage_id, node.activity_datapackage_id
+                ):
+                    value = self._exchange_value(
+                        exchange=exchange,
+                        row_id=flow.flow_datapackage_id,
+                        col_id=node.activity_datapackage_id,
+                        matrix_label="biosphere_matrix",
+                    )
+                    self.convolution_count += 1
+                    flow_td = (td * value).simplify()
+                    if self.end_datetime is not None:
+                        flow_td = self._clip_flow_to_horizon(flow_td, flow, timeline)
+                        if flow_td is None:
+                            continue
+                    timeline.add_flow_temporal_distribution(
+                        td=flow_td,
+                        flow=flow.flow_datapackage_id,
+                        activity=node.activity_datapackage_id,
+                    )
+
+    def _node_flow_counts(self) -> np.ndarray:
+        """Number of biosphere exchanges, and of those with temporal distributions,
+        for the flows of each node, as an array with one `(num_flows, num_flows_td)`
+        row per node `unique_id`.
+
+        All exchanges for the `(flow, activity)` pairs in `self.flows` are read in
+        one scan of the exchange table, instead of once per visited node."""
+        if self.node_flow_counts is not None:
+            return self.node_flow_counts
+
+        pairs = {
+            (
+                flow.flow_datapackage_id,
+                self.nodes[flow.activity_unique_id].activity_datapackage_id,
+            )
+            for flow in self.flows
+            if flow.activity_unique_id != self.unique_id
+        }
+        ids = {x for pair in pairs for x in pair}
+        keys = {}
+        for chunk in chunks(sorted(ids)):
+            for id_, database, code in (
+                AD.select(AD.id, AD.database, AD.code).where(AD.id << chunk).tuples()
+            ):
+                keys[id_] = (database, code)
+        ids_by_key = {key: id_ for id_, key in keys.items()}
+
+        # Missing exchanges are counted once, like `NoExchange` in `get_biosphere_exchanges`
+        counts = {pair: [0, 0] for pair in pairs}
+        found = set()
+        output_codes = sorted({keys[activity][1] for _, activity in pairs})
+        for chunk in chunks(output_codes):
+            for data, input_database, input_code, output_database, output_code in (
+                ED.select(
+                    ED.data,
+                    ED.input_database,
+                    ED.input_code,
+                    ED.output_database,
+                    ED.output_code,
+                )
+                .where(ED.output_code << chunk)
+                .tuples()
+            ):
+                pair = (
+                    ids_by_key.get((input_database, input_code)),
+                    ids_by_key.get((output_database, output_code)),
+                )
+                if pair not in counts:
+                    continue
+                found.add(pair)
+                counts[pair][0] += 1
+                if data.get("temporal_distribution"):
+                    counts[pair][1] += 1
+        for pair in pairs.difference(found):
+            counts[pair][0] = 1
+
+        result = np.zeros((max(self.nodes, default=-1) + 1, 2), dtype=np.int64)
+        for flow in self.flows:
+            if flow.activity_unique_id != self.unique_id:
+                result[flow.activity_unique_id] += counts[
+                    (
+                        flow.flow_datapackage_id,
+                        self.nodes[flow.activity_unique_id].activity_datapackage_id,
+                    )
+                ]
+        self.node_flow_counts = result
+        return result
+
+    def _subtree_offsets(self) -> dict[int, float]:
+        """Earliest time, in seconds relative to each node, at which the node or
+        any emission in its supply chain can happen.
+
+        Edge values which aren't relative `TemporalDistribution` objects can shift
+        emissions arbitrarily, so supply chains containing them are `-inf`. Computed
+        once per traversal."""
+        if self.subtree_offsets is not None:
+            return self.subtree_offsets
+
+        offsets = {}
+        # The functional unit isn't an activity; its edges are handled by
+        # `_functional_unit_frontier`
+        stack = [
+            (unique_id, False)
+            for unique_id in self.nodes
+            if unique_id != self.unique_id
+        ]
+        while stack:
+            unique_id, children_done = stack.pop()
+            if unique_id in offsets:
+                continue
+            if not children_done:
+                stack.append((unique_id, True))
+                stack.extend(
+                    (edge.producer_unique_id, False)
+                    for edge in self.edge_mapping[unique_id]
+                    if edge.producer_unique_id not in offsets
+                )
+                continue
+            node = self.nodes[unique_id]
+            offset = 0.0
+            for flow in self.flow_mapping.get(unique_id, []):
+                for exchange in self.get_biosphere_exchanges(
+                    flow.flow_datapackage_id, node.activity_datapackage_id
+                ):
+                    value = self._exchange_value(
+                        exchange=exchange,
+                        row_id=flow.flow_datapackage_id,
+                        col_id=node.activity_datapackage_id,
+                        matrix_label="biosphere_matrix",
+                    )
+                    offset = min(offset, _earliest_offset(value))
+            for value, producer in self._edge_values(node):
+                offset = min(
+                    offset, _earliest_offset(value) + offsets[producer.unique_id]
+                )
+            offsets[unique_id] = offset
+
+        self.subtree_offsets = offsets
+        return offsets
+
+    def _clip_to_horizon(
+        self, td: TemporalDistribution, producer: Node, timeline: Timeline | None
+    ) -> TemporalDistribution | None:
+        """Drop the points of `td` whose supply chain can only emit after
+        `end_datetime`. Returns `None` if no points are left."""
+        offset = self._subtree_offsets()[producer.unique_id]
+        if (
+            offset == -np.inf
+            or type(td) is not TemporalDistribution
+            or not np.issubdtype(td.date.dtype, np.datetime64)
+        ):
+            return td
+        mask = td.date.astype(np.int64) + offset <= self.end_datetime.astype(np.int64)
+        if mask.all():
+            return td
+        if timeline is not None:
+            timeline.outside_horizon_score += self._supply_chain_score(
+                float(td.amount[~mask].sum()), producer
+            )
+        if not mask.any():
+            return None
+        return TemporalDistribution(date=td.date[mask], amount=td.amount[mask])
+
+    def _clip_flow_to_horizon(
+        self, td: TemporalDistribution, flow: Flow, timeline: Timeline
+    ) -> TemporalDistribution | None:
+        """Drop the points of a biosphere flow distribution after `end_datetime`.
+        Returns `None` if no points are left."""
+        if not np.issubdtype(td.date.dtype, np.datetime64):
+            return td
+        mask = td.date <= self.end_datetime
+        if mask.all():
+            return td
+        if flow.amount:
+            timeline.outside_horizon_score += (
+                float(td.amount[~mask].sum()) * flow.score / flow.amount
+            )
+        if not mask.any():
+            return None
+        return type(td)(date=td.date[mask], amount=td.amount[mask])
+
+    def _production_amount(self, node: Node) -> float:
+        if self.production_amounts is None:
+            return node.reference_product_production_amount
+        return self.production_amounts[node.unique_id]
+
+    def resample(
+        self, rng: np.random.Generator | None = None, jitter: float | None = None
+    ) -> None:
+        """
+        Draw new values for the matrices of the `LCA` object, keeping the graph traversal.
+
+        The `LCA` object must be created with `use_distributions=True` (or use arrays of
+        presamples) for the values to change. Edge values are always read from the current
+        matrices; after resampling, production amounts are also read from the technosphere
+        matrix instead of the traversal results. The supply amounts and scores of the traversal
+        nodes, edges, and flows are recalculated for the new sample, so `propagation_cutoff`,
+        heap priorities, `Timeline.unexplored_score`, and `Timeline.outside_horizon_score` use
+        the new values. The graph itself isn't traversed again.
+
+        Temporal distributions are not resampled: their parameters are fixed, and `jitter` only
+        shifts their dates.
+
+        Parameters
+        ----------
+        rng : numpy.random.Generator, optional
+            Random number generator for `jitter`.
+        jitter : float, optional
+            Standard deviation, in seconds, of a random shift applied to the dates of each
+            relative temporal distribution on an exchange. Each exchange gets one shift per
+            sample, drawn from its own random stream, seeded by `rng` and the exchange id. Shifts
+            are therefore independent between exchanges and the same in every worker of a
+            parallel `build_timeline`, whatever the order in which exchanges are reached.
+
+        """
+        next(self.lca_object)
+        self.score = float(self.lca_object.score)
+        self._rescore_traversal()
+        self.jitter = (
+            None
+            if jitter is None
+            else (int((rng or np.random.default_rng()).integers(2**63)), jitter)
+        )
+        self.jitter_shifts = {}
+        # Offsets depend on the jittered dates
+        self.subtree_offsets = None
+
+    def _rescore_traversal(self) -> None:
+        """Recalculate the amounts and scores of the traversal nodes, edges, and flows from the
+        current matrices, in traversal order.
+
+        Cumulative scores per unit of each product come from a single solve with the transposed
+        technosphere matrix. The graph itself is kept: nodes which would now be below the
+        traversal cutoff are not removed, and none are added."""
+        lca = self.lca_object
+        technosphere = lca.technosphere_matrix.tocsr()
+        biosphere = lca.biosphere_matrix.tocsr()
+        characterized = (lca.characterization_matrix @ biosphere).tocsr()
+        direct_scores = np.asarray(characterized.sum(axis=0)).ravel()
+        unit_scores = spsolve(technosphere.T.tocsc(), direct_scores)
+
+        def values(matrix, rows: list[int], cols: list[int]) -> list[float]:
+            return np.asarray(matrix[rows, cols]).ravel().tolist() if rows else []
+
+        root = self.nodes[self.unique_id]
+        root.cumulative_score = self.score
+        producers = [self.nodes[edge.producer_unique_id] for edge in self.edges]
+        consumers = [self.nodes[edge.consumer_unique_id] for edge in self.edges]
+        production = values(
+            technosphere,
+            [edge.product_index for edge in self.edges],
+            [producer.activity_index for producer in producers],
+        )
+        consumption = values(
+            technosphere,
+            [edge.product_index for edge in self.edges],
+            # Not used for the functional unit, which has no matrix column
+            [
+                0 if consumer is root else consumer.activity_index
+                for consumer in consumers
+            ],
+        )
+        self.production_amounts = {}
+        # Consumers are always created, and therefore rescored, before their edges
+        for edge, producer, consumer, produced, consumed in zip(
+            self.edges, producers, consumers, production, consumption
+        ):
+            if consumer is not root:
+                # The functional unit demand doesn't change
+                edge.amount = -consumer.supply_amount * consumed
+            producer.reference_product_production_amount = produced
+            self.production_amounts[producer.unique_id] = produced
+            producer.supply_amount = edge.amount / produced
+            producer.cumulative_score = float(
+                edge.amount * unit_scores[edge.product_index]
+            )
+            producer.direct_emissions_score = float(
+                producer.supply_amount * direct_scores[producer.activity_index]
+            )
+
+        flow_amounts = values(
+            biosphere,
+            [flow.flow_index for flow in self.flows],
+            [flow.activity_index for flow in self.flows],
+        )
+        flow_scores = values(
+            characterized,
+            [flow.flow_index for flow in self.flows],
+            [flow.activity_index for flow in self.flows],
+        )
+        flow_score_sums = defaultdict(float)
+        for flow, amount, score in zip(self.flows, flow_amounts, flow_scores):
+            supply_amount = self.nodes[flow.activity_unique_id].supply_amount
+            flow.amount = supply_amount * amount
+            flow.score = supply_amount * score
+            flow_score_sums[flow.activity_unique_id] += flow.score
+        for node in producers:
+            node.direct_emissions_score_outside_specific_flows = (
+                node.direct_emissions_score - flow_score_sums[node.unique_id]
+            )
+            node.remaining_cumulative_score_outside_specific_flows = (
+                node.cumulative_score - flow_score_sums[node.unique_id]
+            )
+
+    def _jittered(
+        self, td: TemporalDistribution, exchange_id: int
+    ) -> TemporalDistribution:
+        if type(td) is not TemporalDistribution or not np.issubdtype(
+            td.date.dtype, np.timedelta64
+        ):
+            return td
+        if exchange_id not in self.jitter_shifts:
+            seed, scale = self.jitter
+            rng = np.random.default_rng([seed, exchange_id])
+            self.jitter_shifts[exchange_id] = np.timedelta64(
+                int(round(rng.normal(0, scale))), "s"
+            )
+        return TemporalDistribution(
+            date=td.date + self.jitter_shifts[exchange_id], amount=td.amount
+        )
+
+    def _edge_values(self, node: Node) -> Iterator[tuple[Any, Node]]:
+        """Yield `(value, producer)` for each supply chain edge consumed by `node`.
+
+        `value` is the amount of the producer's reference product per unit of
+        `node` reference product, and is either a number or a temporal
+        distribution."""
+        col_id = node.activity_datapackage_id
+        for edge in self.edge_mapping[node.unique_id]:
+            producer = self.nodes[edge.producer_unique_id]
+            row_id = producer.activity_datapackage_id
+            exchange = self.get_technosphere_exchange(
+                input_id=row_id,
+                output_id=col_id,
+            )
+            value = self._exchange_value(
+                exchange=exchange,
+                row_id=row_id,
+                col_id=col_id,
+                matrix_label="technosphere_matrix",
+            ) / self._production_amount(node)
+            yield value, producer
+
+    def _check_checkpoint_distributions(self) -> None:
+        """Raise `ValueError` before building a checkpointed timeline if a supply chain edge has a
+        temporal distribution which can't be stored in a checkpoint (see `storage.is_storable`).
+
+        Pending distributions are products of the starting distribution and edge values, and products
+        of numbers and storable distributions are storable, so checking the edges is enough.
+        """
+        for node in self.nodes.values():
+            if node.unique_id == self.unique_id:
+                continue
+            for value, producer in self._edge_values(node):
+                if not (isinstance(value, Number) or is_storable(value)):
+                    raise ValueError(
+                        "Can't checkpoint temporal distribution of type {} on the edge from {} to {}".format(
+                            type(value),
+                            producer.activity_datapackage_id,
+                            node.activity_datapackage_id,
+                        )
+                    )
+
+    def _propagation_threshold(self, propagation_cutoff: float | None) -> float:
+        if not propagation_cutoff:
+            return 0.0
+        return propagation_cutoff * abs(self.score)
+
+    def _supply_chain_score(self, total: float, producer: Node) -> float:
+        """LCIA score of the supply chain of `producer` for `total` units of its reference product"""
+        if not producer.supply_amount:
+            return 0.0
+        return total / producer.supply_amount * producer.cumulative_score
+
+    def _add_static_remainder(
+        self,
+        td: TemporalDistribution,
+        score: float,
+        producer: Node,
+        timeline: Timeline | None,
+    ) -> None:
+        """Add the `score` of a skipped `producer` to `timeline` with the timing of its consumer `td`.
+
+        If the amounts of `td` sum to zero, its timing can't be scaled to `score`, which is added at
+        the first date of `td` instead."""
+        if timeline is None or not score:
+            return
+        if td.total:
+            remainder = td * (score / td.total)
+        else:
+            remainder = TemporalDistribution(
+                date=np.array([td.date.min()]), amount=np.array([score])
+            )
+        timeline.add_remainder_temporal_distribution(
+            td=remainder, activity=producer.activity_datapackage_id
+        )
+
+    def _propagate(
+        self,
+        td: TemporalDistribution,
+        node: Node,
+        propagation_cutoff: float | None = None,
+        timeline: Timeline | None = None,
+    ) -> Iterator[tuple[TemporalDistribution, Node]]:
+        threshold = self._propagation_threshold(propagation_cutoff)
+        for value, producer in self._edge_values(node):
+            self.convolution_count += 1
+            producer_td = (td * value).simplify()
+            if threshold:
+                score = self._supply_chain_score(producer_td.total, producer)
+                if abs(score) < threshold:
+                    self._add_static_remainder(td, score, producer, timeline)
+                    continue
+            if self.end_datetime is not None:
+                producer_td = self._clip_to_horizon(producer_td, producer, timeline)
+                if producer_td is None:
+                    continue
+            yield producer_td, producer
+
+    def _propagate_level(
+        self,
+        level: list[tuple[TemporalDistribution, Node]],
+        propagation_cutoff: float | None = None,
+        timeline: Timeline | None = None,
+    ) -> list[tuple[TemporalDistribution, Node]]:
+        """Same result as `_propagate` for each entry of `level`, but numeric edge
+        values are applied to all pending distributions of the level in one
+        vectorized multiplication.
+
+        Returns the next level, in the order of `level` and then of the edges."""
+        threshold = self._propagation_threshold(propagation_cutoff)
+        # `None` placeholders are filled by the batched multiplication
+        result, slots, parents, scalars = [], [], [], []
+        for parent, (td, node) in enumerate(level):
+            for value, producer in self._edge_values(node):
+                self.convolution_count += 1
+                if isinstance(value, Number) and type(td) is TemporalDistribution:
+                    if threshold:
+                        # Total is known without multiplying the distribution
+                        score = self._supply_chain_score(td.total * value, producer)
+                        if abs(score) < threshold:
+                            self._add_static_remainder(td, score, producer, timeline)
+                            continue
+                    slots.append(len(result))
+                    parents.append(parent)
+                    scalars.append(value)
+                    result.append((None, producer))
+                else:
+                    producer_td = (td * value).simplify()
+                    if threshold:
+                        score = self._supply_chain_score(producer_td.total, producer)
+                        if abs(score) < threshold:
+                            self._add_static_remainder(td, score, producer, timeline)
+                            continue
+                    result.append((producer_td, producer))
+
+        if scalars:
+            lengths = np.array([len(level[parent][0]) for parent in parents])
+            amounts = np.hstack(
+                [level[parent][0].amount for parent in parents]
+            ) * np.repeat(np.array(scalars, dtype=np.float64), lengths)
+            for slot, parent, amount in zip(
+                slots, parents, np.split(amounts, np.cumsum(lengths)[:-1])
+            ):
+                result[slot] = (
+                    TemporalDistribution(date=level[parent][0].date, amount=amount),
+                    result[slot][1],
+                )
+
+        if self.end_datetime is not None:
+            result = [
+                (clipped, producer)
+                for clipped, producer in (
+                    (self._clip_to_horizon(producer_td, producer, timeline), producer)
+                    for producer_td, producer in result
+                )
+                if clipped is not None
+            ]
+        return result
 
     def _exchange_value(
         self,
@@ -230,19 +1636,25 @@ You have been warned."""
         else:
             td = exchange.data.get("temporal_distribution")
             if isinstance(td, str) and "__loader__" in td:
-                data = json.loads(td)
                 try:
-                    td = loader_registry[td["__loader__"]](data)
+                    td = self.lookup_cache.distributions[exchange.id]
                 except KeyError:
-                    raise KeyError(
-                        "Can't find correct loader {} in `loader_registry`".format(
-                            td["__loader__"]
+                    data = json.loads(td)
+                    try:
+                        td = loader_registry[data["__loader__"]](data)
+                    except KeyError:
+                        raise KeyError(
+                            "Can't find correct loader {} in `loader_registry`".format(
+                                data["__loader__"]
+                            )
                         )
-                    )
+                    self.lookup_cache.distributions[exchange.id] = td
             elif not (isinstance(td, (TemporalDistribution, TDAware)) or td is None):
                 raise ValueError(
                     f"Can't understand value for `temporal_distribution` in exchange {exchange}"
                 )
+            if self.jitter is not None and td is not None:
+                td = self._jittered(td, exchange.id)
 
             sign = (
                 1
@@ -288,9 +1700,13 @@ You have been warned."""
             return td * amount
 
     def _exchange_iterator(self, input_id: int, output_id: int) -> list[ED]:
+        try:
+            return self.lookup_cache.exchanges[(input_id, output_id)]
+        except KeyError:
+            pass
         inp = AD.get(AD.id == input_id)
         outp = AD.get(AD.id == output_id)
-        return list(
+        exchanges = list(
             ED.select().where(
                 ED.input_code == inp.code,
                 ED.input_database == inp.database,
@@ -298,6 +1714,8 @@ You have been warned."""
                 ED.output_database == outp.database,
             )
         )
+        self.lookup_cache.exchanges[(input_id, output_id)] = exchanges
+        return exchanges
 
     def get_biosphere_exchanges(self, flow_id: int, activity_id: int) -> Iterable[ED]:
         exchanges = self._exchange_iterator(flow_id, activity_id)
@@ -1 +1,8 @@
-from .climate import characterize_co2, characterize_methane
+from .climate import (
+    characterize_co2,
+    characterize_co2_vectorized,
+    characterize_methane,
+    characterize_methane_vectorized,
+    characterize_per_year,
+    radiative_forcing_kernel,
+)
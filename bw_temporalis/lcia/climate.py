@@ -1,6 +1,169 @@
+from functools import lru_cache
+
 import numpy as np
 import pandas as pd
 
+from ..characterization import broadcast_multipliers, vectorized
+
+
+@lru_cache(maxsize=None)
+def radiative_forcing_kernel(
+    gas: str, period: int = 100, cumulative: bool = False
+) -> np.ndarray:
+    """
+    Radiative forcing per kilogram emitted for each year after the emission, in W/m2/kg.
+
+    Computed once per `(gas, period, cumulative)` and cached; the returned array is read-only.
+
+    Parameters
+    ----------
+    gas : str
+        `"co2"` or `"ch4"`.
+    period : int
+        Number of years.
+    cumulative : bool
+        Cumulative instead of marginal (yearly) forcing. The marginal forcing of the first year is zero,
+        as in `characterize_co2` and `characterize_methane`.
+    """
+    year = np.arange(period, dtype=np.float64)
+    if gas == "co2":
+        # functional variables and units (from publications listed in `characterize_co2`)
+        RE = 1.76e-15  # Radiative forcing (W/m2/kg)
+        alpha_0, alpha_1, alpha_2, alpha_3 = 0.2173, 0.2240, 0.2824, 0.2763
+        tau_1, tau_2, tau_3 = 394.4, 36.54, 4.304
+        decay_term = lambda alpha, tau: alpha * tau * (1 - np.exp(-year / tau))
+        kernel = RE * (
+            alpha_0 * year
+            + decay_term(alpha_1, tau_1)
+            + decay_term(alpha_2, tau_2)
+            + decay_term(alpha_3, tau_3)
+        )
+    elif gas == "ch4":
+        # functional variables and units (from publications listed in `characterize_methane`)
+        f1 = 0.5  # Unitless
+        f2 = 0.15  # Unitless
+        alpha = 1.27e-13  # Radiative forcing (W/m2/kg)
+        tau = 12.4  # Lifetime (years)
+        kernel = (1 + f1 + f2) * alpha * tau * (1 - np.exp(-year / tau))
+    else:
+        raise ValueError(f"Unknown gas {gas}; must be one of `co2`, `ch4`")
+    if not cumulative:
+        kernel = np.diff(kernel, prepend=kernel[:1])
+    kernel.flags.writeable = False
+    return kernel
+
+
+def characterize_per_year(
+    date: np.ndarray,
+    amount: np.ndarray,
+    flow: np.ndarray,
+    kernel: np.ndarray,
+) -> pd.DataFrame:
+    """
+    Sum characterized amounts per flow and calendar year, without creating a row for each input row and year.
+
+    An emission in calendar year `y` contributes `amount * kernel[j]` to year `y + j`. Memory use is
+    proportional to the number of input rows plus the number of (flow, year) results.
+
+    Returns
+    -------
+    A TimeSeries dataframe with the columns `date` (January 1st of each year), `amount`, `flow`, and
+    `activity` (always -1, as activities are summed).
+    """
+    flows, flow_codes = np.unique(np.asarray(flow), return_inverse=True)
+    years = np.asarray(date).astype("datetime64[Y]").astype(np.int64)
+    if not len(years):
+        first_year, num_years = 0, 0
+    else:
+        first_year = int(years.min())
+        num_years = int(years.max()) - first_year + len(kernel)
+    index = flow_codes * num_years + (years - first_year)
+    forcing = np.zeros(len(flows) * num_years)
+    for step, multiplier in enumerate(kernel):
+        if multiplier:
+            forcing += np.bincount(
+                index + step, weights=amount * multiplier, minlength=len(forcing)
+            )
+    return pd.DataFrame(
+        {
+            "date": pd.Series(
+                data=np.tile(np.arange(num_years) + first_year, len(flows))
+                .astype("datetime64[Y]")
+                .astype("datetime64[s]"),
+                dtype="datetime64[s]",
+            ),
+            "amount": pd.Series(data=forcing, dtype="float64"),
+            "flow": pd.Series(data=np.repeat(flows, num_years), dtype="int64"),
+            "activity": pd.Series(data=np.full(len(forcing), -1), dtype="int64"),
+        }
+    )
+
+
+def _characterize_vectorized(
+    gas: str,
+    date: np.ndarray,
+    amount: np.ndarray,
+    flow: np.ndarray,
+    activity: np.ndarray,
+    period: int,
+    cumulative: bool,
+    per_year: bool,
+):
+    kernel = radiative_forcing_kernel(gas, period, bool(cumulative))
+    if per_year:
+        return characterize_per_year(date, amount, flow, kernel)
+    return broadcast_multipliers(date, amount, flow, activity, kernel)
+
+
+@vectorized
+def characterize_co2_vectorized(
+    date: np.ndarray,
+    amount: np.ndarray,
+    flow: np.ndarray,
+    activity: np.ndarray,
+    period: int | None = 100,
+    cumulative: bool | None = False,
+    per_year: bool | None = False,
+):
+    """
+    Array version of `characterize_co2`, characterizing all rows at once with a cached forcing kernel.
+
+    See `bw_temporalis.characterization.vectorized` for the calling convention.
+
+    Parameters
+    ----------
+    period : int, optional
+        Time period for calculation (number of years), by default 100
+    cumulative : bool, optional
+        Should the RF amounts be summed over time?
+    per_year : bool, optional
+        Return the forcing summed per flow and calendar year instead of per row and year; see
+        `characterize_per_year`.
+    """
+    return _characterize_vectorized(
+        "co2", date, amount, flow, activity, period, cumulative, per_year
+    )
+
+
+@vectorized
+def characterize_methane_vectorized(
+    date: np.ndarray,
+    amount: np.ndarray,
+    flow: np.ndarray,
+    activity: np.ndarray,
+    period: int | None = 100,
+    cumulative: bool | None = False,
+    per_year: bool | None = False,
+):
+    """
+    Array version of `characterize_methane`, characterizing all rows at once with a cached forcing kernel.
+
+    See `characterize_co2_vectorized` for the parameters.
+    """
+    return _characterize_vectorized(
+        "ch4", date, amount, flow, activity, period, cumulative, per_year
+    )
+
 
 def characterize_co2(
     series,
@@ -33,29 +196,12 @@ def characterize_co2(
     characterize_methane: The same function for CH4
     """
 
-    # functional variables and units (from publications listed in docstring)
-    RE = 1.76e-15  # Radiative forcing (W/m2/kg)
-    alpha_0, alpha_1, alpha_2, alpha_3 = 0.2173, 0.2240, 0.2824, 0.2763
-    tau_1, tau_2, tau_3 = 394.4, 36.54, 4.304
-    decay_term = lambda year, alpha, tau: alpha * tau * (1 - np.exp(-year / tau))
-
     date_beginning: np.datetime64 = series["date"].to_numpy()
     date_characterized: np.ndarray = date_beginning + np.arange(
         start=0, stop=period, dtype="timedelta64[Y]"
     ).astype("timedelta64[s]")
 
-    decay_multipliers: np.ndarray = np.array(
-        [
-            RE
-            * (
-                alpha_0 * year
-                + decay_term(year, alpha_1, tau_1)
-                + decay_term(year, alpha_2, tau_2)
-                + decay_term(year, alpha_3, tau_3)
-            )
-            for year in range(period)
-        ]
-    )
+    decay_multipliers: np.ndarray = radiative_forcing_kernel("co2", period, True)
 
     forcing = pd.Series(data=series.amount * decay_multipliers, dtype="float64")
     if not cumulative:
@@ -107,23 +253,12 @@ def characterize_methane(series, period: int = 100, cumulative=False) -> pd.Data
     characterize_co2: The same function for CO2
     """
 
-    # functional variables and units (from publications listed in docstring)
-    f1 = 0.5  # Unitless
-    f2 = 0.15  # Unitless
-    alpha = 1.27e-13  # Radiative forcing (W/m2/kg)
-    tau = 12.4  # Lifetime (years)
-
     date_beginning: np.datetime64 = series["date"].to_numpy()
     date_characterized: np.ndarray = date_beginning + np.arange(
         start=0, stop=period, dtype="timedelta64[Y]"
     ).astype("timedelta64[s]")
 
-    decay_multipliers: list = np.array(
-        [
-            (1 + f1 + f2) * alpha * tau * (1 - np.exp(-year / tau))
-            for year in range(period)
-        ]
-    )
+    decay_multipliers: np.ndarray = radiative_forcing_kernel("ch4", period, True)
 
     forcing = pd.Series(data=series.amount * decay_multipliers, dtype="float64")
     if not cumulative:
@@ -0,0 +1,119 @@
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from .lca import TemporalisLCA
+from .sinks import CharacterizedAccumulator, characterization_kernel
+
+
+def monte_carlo_timeline(
+    tlca: TemporalisLCA,
+    characterization_functions: dict[int, Callable],
+    iterations: int = 100,
+    quantiles: tuple[float, ...] = (0.05, 0.5, 0.95),
+    jitter: float | None = None,
+    seed: int | None = None,
+    characterize: bool | None = True,
+    **build_timeline_kwargs: Any,
+) -> pd.DataFrame:
+    """
+    Monte Carlo temporal LCA which reuses the graph traversal of `tlca`.
+
+    Each iteration draws new matrix values with `TemporalisLCA.resample`, and builds the timeline
+    into a `CharacterizedAccumulator`. The supply chain graph, the exchange lookups, the
+    deserialized temporal distributions, and the characterization kernels are shared between
+    iterations, so only the propagation is repeated. The `wavefront` scheduler is used unless another is given, as it multiplies all
+    numeric edges of a depth level in one vectorized operation.
+
+    The `LCA` object of `tlca` must be created with `use_distributions=True`, and is left at the
+    values of the last iteration.
+
+    Parameters
+    ----------
+    tlca : TemporalisLCA
+        Instance whose graph traversal is reused.
+    characterization_functions : dict[int, Callable]
+        Row-wise characterization function for each biosphere flow id. See `CharacterizedAccumulator`.
+    iterations : int
+        Number of Monte Carlo iterations.
+    quantiles : tuple[float, ...]
+        Quantiles to report for each year.
+    jitter : float, optional
+        Standard deviation, in seconds, of a random shift of the dates of each exchange temporal
+        distribution, drawn anew in each iteration. See `TemporalisLCA.resample`.
+    seed : int, optional
+        Seed for the `jitter` random number generator.
+    characterize : bool
+        Report characterized amounts. If `False`, report the inventory amounts per year instead,
+        without a total over flows, as flows can have different units.
+    build_timeline_kwargs
+        Other arguments for `TemporalisLCA.build_timeline`, e.g. `propagation_cutoff`.
+
+    Returns
+    -------
+    A Pandas DataFrame with one row per year and flow, with the columns `date` (January 1st of the
+    year), `flow`, `mean`, and one column per quantile, e.g. `q0.05`. If `characterize`, rows with
+    `flow` -1 are the sum over all flows, calculated per iteration.
+
+    """
+    rng = np.random.default_rng(seed)
+    build_timeline_kwargs.setdefault("scheduler", "wavefront")
+
+    kernels = (
+        {
+            flow: characterization_kernel(function, flow)
+            for flow, function in characterization_functions.items()
+        }
+        if characterize
+        else None
+    )
+
+    samples = []
+    for _ in range(iterations):
+        tlca.resample(rng=rng, jitter=jitter)
+        sink = CharacterizedAccumulator(characterization_functions, kernels=kernels)
+        tlca.build_timeline(sink=sink, **build_timeline_kwargs)
+        samples.append(
+            (sink.first_year, sink.characterize() if characterize else sink.emissions)
+        )
+
+    flows = list(characterization_functions)
+    filled = [(year, array) for year, array in samples if year is not None]
+    if not filled:
+        first_year, num_years = 1970, 0
+    else:
+        first_year = min(year for year, _ in filled)
+        num_years = max(year + array.shape[1] for year, array in filled) - first_year
+
+    # Iterations without any emissions are all zeros
+    flow_column = flows + [-1] if characterize else flows
+    stacked = np.zeros((iterations, len(flow_column), num_years))
+    for index, (year, array) in enumerate(samples):
+        if year is not None:
+            start = year - first_year
+            stacked[index, : len(flows), start : start + array.shape[1]] = array
+    if characterize:
+        stacked[:, -1] = stacked[:, :-1].sum(axis=1)
+
+    years = (np.arange(num_years) + first_year - 1970).astype("datetime64[Y]")
+    df = pd.DataFrame(
+        {
+            "date": pd.Series(
+                data=np.tile(years, len(flow_column)).astype("datetime64[s]"),
+                dtype="datetime64[s]",
+            ),
+            "flow": pd.Series(
+                data=np.repeat(np.array(flow_column, dtype=np.int64), num_years),
+                dtype="int64",
+            ),
+            "mean": stacked.mean(axis=0).ravel(),
+        }
+    )
+    for quantile, values in zip(
+        quantiles, np.quantile(stacked, quantiles, axis=0).reshape(len(quantiles), -1)
+    ):
+        df[f"q{quantile}"] = values
+    df.sort_values(by=["date", "flow"], ascending=True, inplace=True)
+    df.reset_index(drop=True, inplace=True)
+    return df
@@ -0,0 +1,404 @@
+import copy
+from collections import defaultdict
+from itertools import count
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from .arrow import (
+    check_partition_by,
+    prepare_dataset_directory,
+    timeline_record_batch,
+    timeline_schema,
+    write_partitioned_batches,
+)
+from .characterization import convolve_kernel, is_vectorized
+from .temporal_distribution import TemporalDistribution
+
+# Emission date used to evaluate characterization functions for a unit emission.
+# Mid-year, so that yearly steps of `timedelta64[Y]` (365.2425 days) stay in
+# consecutive calendar years.
+KERNEL_ORIGIN = pd.Timestamp("2000-07-01")
+
+
+class TimelineSink:
+    """
+    Base class for objects which receive biosphere flow temporal distributions instead of `Timeline.data`.
+
+    Pass an instance as `sink` to `TemporalisLCA.build_timeline`. Child classes must implement
+    `add_flow_temporal_distribution`; they should also implement `spawn` and `merge` to support
+    parallel timeline construction.
+    """
+
+    def add_flow_temporal_distribution(
+        self, td: TemporalDistribution, flow: int, activity: int
+    ) -> None:
+        raise NotImplementedError("Must be defined in child classes")
+
+    def spawn(self) -> "TimelineSink":
+        """Return a new, empty sink with the same settings, for a partial timeline built by a worker"""
+        raise NotImplementedError(
+            f"{type(self).__name__} doesn't support parallel timeline construction"
+        )
+
+    def merge(self, other: "TimelineSink") -> None:
+        """Add the contents of a sink created by `spawn`"""
+        raise NotImplementedError(
+            f"{type(self).__name__} doesn't support parallel timeline construction"
+        )
+
+
+def characterization_kernel(
+    characterization_function: Callable, flow: int
+) -> np.ndarray:
+    """
+    Characterized amount per calendar year after a unit emission of `flow`.
+
+    Evaluates a row-wise or vectorized characterization function (see
+    `Timeline.characterize_dataframe`) once, for an emission of one unit at `KERNEL_ORIGIN`.
+    """
+    if is_vectorized(characterization_function):
+        df = pd.DataFrame(
+            characterization_function(
+                date=np.array([KERNEL_ORIGIN.to_datetime64()], dtype="datetime64[s]"),
+                amount=np.ones(1),
+                flow=np.array([flow], dtype=np.int64),
+                activity=np.array([-1], dtype=np.int64),
+            )
+        )
+    else:
+        df = characterization_function(
+            pd.Series(
+                {"date": KERNEL_ORIGIN, "amount": 1.0, "flow": flow, "activity": -1}
+            )
+        )
+    offsets = df["date"].to_numpy().astype("datetime64[Y]").astype(
+        np.int64
+    ) - np.datetime64(KERNEL_ORIGIN, "Y").astype(np.int64)
+    if len(offsets) and offsets.min() < 0:
+        raise ValueError("Characterization function result starts before emission")
+    kernel = np.zeros(offsets.max() + 1 if len(offsets) else 0)
+    np.add.at(kernel, offsets, df["amount"].to_numpy(dtype=np.float64))
+    return kernel
+
+
+class CharacterizedAccumulator(TimelineSink):
+    """
+    Characterized time series per flow, accumulated while the timeline is built.
+
+    Each incoming distribution is binned by calendar year into a dense `(flow, year)` array, so
+    memory only depends on the number of characterized flows and the time span, not on the
+    number of supply chain nodes. Characterization is linear in the emitted amount, so the binned
+    emissions are convolved (by FFT) with a per-flow kernel once, when the result is requested.
+
+    Emissions are binned by calendar year, and an emission in year `y` contributes `kernel[j]` (see
+    `characterization_kernel`) to year `y + j`; this is the same as
+    `bw_temporalis.characterization.characterize_binned` with yearly kernels. It is not the same as
+    `Timeline.characterize_dataframe` summed per calendar year, even for emissions on January 1st:
+    row-wise functions step `j` times 365.2425 days from the emission date, which can land in the
+    previous calendar year. For example, the first year of forcing after a CO2 emission on 2020-01-01
+    falls on 2020-12-31, so it is in year 2020 of the dataframe but year 2021 here. Only the totals
+    per flow are the same.
+
+    Characterization is assumed to be time-invariant: each flow has one kernel, which only depends
+    on the time since emission. Functions whose result also depends on the emission date itself,
+    e.g. through a changing background concentration, need `Timeline.characterize_dataframe`.
+
+    Parameters
+    ----------
+    characterization_functions : dict[int, Callable]
+        Row-wise characterization function for each biosphere flow id, e.g.
+        `{co2_id: characterize_co2, ch4_id: characterize_methane}`. Flows without a function are
+        counted in `uncharacterized_amounts` and otherwise ignored.
+    kernels : dict[int, numpy.ndarray], optional
+        Result of `characterization_kernel` for each flow, if already calculated, e.g. to reuse them
+        over Monte Carlo iterations. Otherwise calculated by the first call of `characterize`.
+
+    Attributes
+    ----------
+    flows : list[int]
+        Row order of `emissions`.
+    first_year : int | None
+        Calendar year of the first column of `emissions`.
+    emissions : numpy.ndarray
+        Emitted amounts binned by flow and year.
+    uncharacterized_amounts : dict[int, float]
+        Summed amount of each flow without a characterization function. Flows can have different
+        units, so they aren't added together.
+    """
+
+    def __init__(
+        self,
+        characterization_functions: dict[int, Callable],
+        kernels: dict[int, np.ndarray] | None = None,
+    ):
+        self.characterization_functions = characterization_functions
+        self.kernels = kernels
+        self.flows = list(characterization_functions)
+        self.rows = {flow: index for index, flow in enumerate(self.flows)}
+        self.first_year = None
+        self.emissions = np.zeros((len(self.flows), 0))
+        self.uncharacterized_amounts = defaultdict(float)
+
+    def _add_years(self, years: np.ndarray) -> np.ndarray:
+        """Grow `emissions` to cover `years`, and return their column indices"""
+        start, end = int(years.min()), int(years.max()) + 1
+        if self.first_year is None:
+            self.first_year = start
+            self.emissions = np.zeros((len(self.flows), end - start))
+        else:
+            last_year = self.first_year + self.emissions.shape[1]
+            before, after = max(self.first_year - start, 0), max(end - last_year, 0)
+            if before or after:
+                self.emissions = np.pad(self.emissions, ((0, 0), (before, after)))
+                self.first_year -= before
+        return years - self.first_year
+
+    def add_flow_temporal_distribution(
+        self, td: TemporalDistribution, flow: int, activity: int
+    ) -> None:
+        if flow not in self.rows:
+            self.uncharacterized_amounts[flow] += float(td.amount.sum())
+            return
+        if not len(td):
+            return
+        years = td.date.astype("datetime64[Y]").astype(np.int64) + 1970
+        columns = self._add_years(years)
+        self.emissions[self.rows[flow]] += np.bincount(
+            columns, weights=td.amount, minlength=self.emissions.shape[1]
+        )
+
+    def spawn(self) -> "CharacterizedAccumulator":
+        return CharacterizedAccumulator(
+            self.characterization_functions, kernels=self.kernels
+        )
+
+    def merge(self, other: "CharacterizedAccumulator") -> None:
+        for flow, amount in other.uncharacterized_amounts.items():
+            self.uncharacterized_amounts[flow] += amount
+        if other.first_year is None:
+            return
+        last_year = other.first_year + other.emissions.shape[1] - 1
+        columns = self._add_years(np.array([other.first_year, last_year]))
+        self.emissions[:, columns[0] : columns[1] + 1] += other.emissions
+
+    def characterize(self) -> np.ndarray:
+        """
+        Characterized amounts with shape `(len(flows), number of years)`.
+
+        The first column is `first_year`; the time span is extended to the end of the longest
+        characterization kernel.
+        """
+        if self.kernels is None:
+            self.kernels = {
+                flow: characterization_kernel(function, flow)
+                for flow, function in self.characterization_functions.items()
+            }
+        kernels = [self.kernels[flow] for flow in self.flows]
+        num_years = self.emissions.shape[1]
+        length = num_years + max((len(k) for k in kernels), default=1) - 1
+        result = np.zeros((len(self.flows), max(length, 0)))
+        if not num_years:
+            return result
+        for row, kernel in enumerate(kernels):
+            if len(kernel):
+                characterized = convolve_kernel(self.emissions[row], kernel)
+                result[row, : len(characterized)] = characterized
+        return result
+
+    def dataframe(self, cumsum: bool | None = True) -> pd.DataFrame:
+        """
+        Characterized result as a Pandas DataFrame, sorted by date, with the columns:
+
+        - date: datetime64[s]; January 1st of each year
+        - amount: float64
+        - flow: int
+        - amount_sum: float64; only if `cumsum`
+        """
+        characterized = self.characterize()
+        num_flows, num_years = characterized.shape
+        years = np.arange(num_years) + (self.first_year or 1970) - 1970
+        df = pd.DataFrame(
+            {
+                "date": pd.Series(
+                    data=np.tile(years.astype("datetime64[Y]"), num_flows).astype(
+                        "datetime64[s]"
+                    ),
+                    dtype="datetime64[s]",
+                ),
+                "amount": pd.Series(data=characterized.ravel(), dtype="float64"),
+                "flow": pd.Series(
+                    data=np.repeat(np.array(self.flows, dtype=np.int64), num_years),
+                    dtype="int64",
+                ),
+            }
+        )
+        df.sort_values(by=["date", "flow"], ascending=True, inplace=True)
+        df.reset_index(drop=True, inplace=True)
+        if cumsum:
+            df["amount_sum"] = df["amount"].cumsum()
+        return df
+
+
+class MemorySink(TimelineSink):
+    """
+    Keep `(flow, activity, TemporalDistribution)` records in a list.
+
+    Attributes
+    ----------
+    records : list[tuple[int, int, TemporalDistribution]]
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def add_flow_temporal_distribution(
+        self, td: TemporalDistribution, flow: int, activity: int
+    ) -> None:
+        self.records.append((flow, activity, td))
+
+    def spawn(self) -> "MemorySink":
+        return MemorySink()
+
+    def merge(self, other: "MemorySink") -> None:
+        self.records.extend(other.records)
+
+
+class ParquetSink(TimelineSink):
+    """
+    Write flow temporal distributions to a Parquet file while the timeline is built.
+
+    Points are buffered and written as a row group every `batch_size` points, so memory use is
+    bounded by the batch size. The file has the same columns as `Timeline.build_dataframe`:
+    `date` (timestamp in seconds), `amount`, `flow`, and `activity`. Rows are in the order they
+    were produced, not sorted by date. Call `close` (or use as a context manager) when done. Read
+    the result with `bw_temporalis.arrow.read_timeline`.
+
+    With `max_workers`, each worker thread writes to its own part file next to `filepath` (or, with
+    `partition_by`, to its own files in the dataset directory). Part files are copied into
+    `filepath` and deleted when the partial timelines are merged. The `"process"` executor is not
+    supported.
+
+    Requires `pyarrow`.
+
+    Parameters
+    ----------
+    filepath : Path | str
+        Parquet file to write, or directory if `partition_by` is given.
+    batch_size : int
+        Number of points per row group.
+    partition_by : str, optional
+        Write a Hive-partitioned dataset with one directory per `"year"` or `"flow"`; see
+        `bw_temporalis.arrow.write_partitioned_batches`.
+    overwrite : bool
+        With `partition_by`, delete the directory if it isn't empty instead of raising `ValueError`,
+        so that no files of an earlier run are left. A single Parquet file is always replaced.
+    """
+
+    def __init__(
+        self,
+        filepath: Path | str,
+        batch_size: int = 1_000_000,
+        partition_by: str | None = None,
+        overwrite: bool = False,
+    ):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("`pyarrow` required for this function")
+
+        check_partition_by(partition_by)
+        self.pa = pa
+        self.filepath = Path(filepath)
+        self.batch_size = batch_size
+        self.partition_by = partition_by
+        self.schema = timeline_schema(pa)
+        if partition_by is None:
+            self.writer = pq.ParquetWriter(self.filepath, self.schema)
+        else:
+            prepare_dataset_directory(self.filepath, overwrite=overwrite)
+            self.writer = None
+        self.buffer = []
+        self.buffered = 0
+        self.num_rows = 0
+        self.num_flushes = 0
+        self.basename = "part"
+        self._spawn_ids = count(1)
+
+    def add_flow_temporal_distribution(
+        self, td: TemporalDistribution, flow: int, activity: int
+    ) -> None:
+        self.buffer.append((flow, activity, td))
+        self.buffered += len(td)
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered points as a row group"""
+        if not self.buffered:
+            return
+        lengths = [len(td) for _, _, td in self.buffer]
+        batch = timeline_record_batch(
+            self.pa,
+            np.hstack([td.date for _, _, td in self.buffer]),
+            np.hstack([td.amount for _, _, td in self.buffer]),
+            np.repeat([flow for flow, _, _ in self.buffer], lengths).astype(np.int64),
+            np.repeat([activity for _, activity, _ in self.buffer], lengths).astype(
+                np.int64
+            ),
+            partition_by=self.partition_by,
+        )
+        if self.writer is None:
+            write_partitioned_batches(
+                [batch],
+                self.filepath,
+                self.partition_by,
+                basename=f"{self.basename}-{self.num_flushes}",
+            )
+        else:
+            self.writer.write_batch(batch)
+        self.num_flushes += 1
+        self.num_rows += self.buffered
+        self.buffer, self.buffered = [], 0
+
+    def spawn(self) -> "ParquetSink":
+        child = copy.copy(self)
+        child.buffer, child.buffered = [], 0
+        child.num_rows = child.num_flushes = 0
+        child.basename = f"{self.basename}-{next(self._spawn_ids)}"
+        child._spawn_ids = count(1)
+        if self.writer is not None:
+            import pyarrow.parquet as pq
+
+            child.filepath = self.filepath.with_name(
+                f"{self.filepath.name}.{child.basename}"
+            )
+            child.writer = pq.ParquetWriter(child.filepath, self.schema)
+        return child
+
+    def merge(self, other: "ParquetSink") -> None:
+        other.close()
+        if self.writer is not None:
+            import pyarrow.parquet as pq
+
+            part = pq.ParquetFile(other.filepath)
+            for index in range(part.num_row_groups):
+                self.writer.write_table(part.read_row_group(index))
+            part.close()
+            other.filepath.unlink()
+        self.num_rows += other.num_rows
+        self.num_flushes += other.num_flushes
+
+    def close(self) -> None:
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self) -> "ParquetSink":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
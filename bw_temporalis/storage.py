@@ -0,0 +1,336 @@
+import dataclasses
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+from bw_graph_tools.graph_traversal import Edge, Flow, Node
+
+from .temporal_distribution import FixedTD, TemporalDistribution
+from .timeline import FlowTD, Timeline
+
+# Classes which can be stored as plain `(date, amount)` arrays
+DISTRIBUTION_CLASSES = {
+    "TemporalDistribution": TemporalDistribution,
+    "FixedTD": FixedTD,
+}
+DATE_DTYPES = [np.dtype("datetime64[s]"), np.dtype("timedelta64[s]")]
+
+CHECKPOINT_VERSION = 2
+
+# Format of `save_cached_traversal`; versioned separately from checkpoints
+TRAVERSAL_CACHE_VERSION = 1
+
+
+def dataclasses_to_arrays(objs: list, cls: type, prefix: str) -> dict[str, np.ndarray]:
+    """Store a list of dataclass instances as one array per field.
+
+    Fields with `None` values get an additional boolean `{prefix}{field}__isnone` array.
+    """
+    arrays = {}
+    for field in dataclasses.fields(cls):
+        values = [getattr(obj, field.name) for obj in objs]
+        is_none = np.array([value is None for value in values], dtype=bool)
+        if is_none.any():
+            arrays[f"{prefix}{field.name}__isnone"] = is_none
+            values = [0 if value is None else value for value in values]
+        arrays[f"{prefix}{field.name}"] = np.array(values)
+    return arrays
+
+
+def dataclasses_from_arrays(
+    arrays: dict[str, np.ndarray], cls: type, prefix: str
+) -> list:
+    columns = {}
+    for field in dataclasses.fields(cls):
+        values = arrays[f"{prefix}{field.name}"].tolist()
+        if f"{prefix}{field.name}__isnone" in arrays:
+            values = [
+                None if is_none else value
+                for value, is_none in zip(
+                    values, arrays[f"{prefix}{field.name}__isnone"]
+                )
+            ]
+        columns[field.name] = values
+    return [cls(**dict(zip(columns, row))) for row in zip(*columns.values())]
+
+
+def traversal_to_arrays(
+    nodes: dict[int, Node], edges: list[Edge], flows: list[Flow]
+) -> dict[str, np.ndarray]:
+    """Columnar form of the `nodes`, `edges`, and `flows` returned by graph traversal"""
+    return {
+        **dataclasses_to_arrays(list(nodes.values()), Node, "node_"),
+        **dataclasses_to_arrays(edges, Edge, "edge_"),
+        **dataclasses_to_arrays(flows, Flow, "flow_"),
+    }
+
+
+def traversal_from_arrays(
+    arrays: dict[str, np.ndarray]
+) -> tuple[dict[int, Node], list[Edge], list[Flow]]:
+    nodes = dataclasses_from_arrays(arrays, Node, "node_")
+    return (
+        {node.unique_id: node for node in nodes},
+        dataclasses_from_arrays(arrays, Edge, "edge_"),
+        dataclasses_from_arrays(arrays, Flow, "flow_"),
+    )
+
+
+def is_storable(td) -> bool:
+    """Can `td` be stored by `distributions_to_arrays`?
+
+    Subclasses can have other attributes or constructor arguments, so only the exact classes in
+    `DISTRIBUTION_CLASSES` are storable."""
+    return (
+        DISTRIBUTION_CLASSES.get(type(td).__name__) is type(td)
+        and td.date.dtype in DATE_DTYPES
+    )
+
+
+def distributions_to_arrays(
+    distributions: list[TemporalDistribution], prefix: str
+) -> dict[str, np.ndarray]:
+    """Concatenate the `date` and `amount` arrays of many distributions, with offsets"""
+    classes = list(DISTRIBUTION_CLASSES)
+    for td in distributions:
+        if not is_storable(td):
+            raise ValueError(f"Can't store temporal distribution of type {type(td)}")
+    return {
+        f"{prefix}date": np.hstack(
+            [np.zeros(0, dtype=np.int64)]
+            + [td.date.astype(np.int64) for td in distributions]
+        ),
+        f"{prefix}amount": np.hstack(
+            [np.zeros(0)] + [td.amount for td in distributions]
+        ),
+        f"{prefix}offsets": np.cumsum([0] + [len(td) for td in distributions]),
+        f"{prefix}date_dtype": np.array(
+            [DATE_DTYPES.index(td.date.dtype) for td in distributions], dtype=np.int8
+        ),
+        f"{prefix}class": np.array(
+            [classes.index(type(td).__name__) for td in distributions], dtype=np.int8
+        ),
+    }
+
+
+def distributions_from_arrays(
+    arrays: dict[str, np.ndarray], prefix: str
+) -> list[TemporalDistribution]:
+    classes = list(DISTRIBUTION_CLASSES.values())
+    date, amount, offsets = (
+        arrays[f"{prefix}date"],
+        arrays[f"{prefix}amount"],
+        arrays[f"{prefix}offsets"],
+    )
+    return [
+        classes[class_code](
+            date=date[start:end].astype(DATE_DTYPES[dtype_code]),
+            amount=amount[start:end],
+        )
+        for start, end, dtype_code, class_code in zip(
+            offsets[:-1],
+            offsets[1:],
+            arrays[f"{prefix}date_dtype"],
+            arrays[f"{prefix}class"],
+        )
+    ]
+
+
+# Per element columns of `Timeline.columns` stored in checkpoints; point `flow` and `activity` are
+# rebuilt from the offsets
+TIMELINE_ELEMENT_COLUMNS = (
+    "offsets",
+    "element_flow",
+    "element_activity",
+    "num_flows",
+    "num_flows_td",
+)
+
+
+def timeline_to_arrays(timeline: Timeline) -> dict[str, np.ndarray]:
+    """Store the columns of `timeline` (see `Timeline.columns`), without building `Timeline.data`"""
+    columns = timeline.columns
+    return {
+        "timeline_columns_date": columns["date"].view(np.int64),
+        "timeline_columns_amount": columns["amount"],
+        **{
+            f"timeline_columns_{label}": columns[label]
+            for label in TIMELINE_ELEMENT_COLUMNS
+        },
+        **distributions_to_arrays(
+            [o.distribution for o in timeline.remainder], "remainder_"
+        ),
+        "remainder_activity": np.array(
+            [o.activity for o in timeline.remainder], dtype=np.int64
+        ),
+        "timeline_aggregate": np.array(timeline.aggregate or ""),
+        "timeline_complete": np.array(timeline.complete),
+        "timeline_unexplored_score": np.array(timeline.unexplored_score),
+        "timeline_outside_horizon_score": np.array(timeline.outside_horizon_score),
+    }
+
+
+def timeline_from_arrays(arrays: dict[str, np.ndarray]) -> Timeline:
+    timeline = Timeline.from_columns(
+        {
+            "date": arrays["timeline_columns_date"].view("datetime64[s]"),
+            "amount": arrays["timeline_columns_amount"],
+            **{
+                label: arrays[f"timeline_columns_{label}"]
+                for label in TIMELINE_ELEMENT_COLUMNS
+            },
+        },
+        aggregate=str(arrays["timeline_aggregate"]) or None,
+    )
+    timeline.complete = bool(arrays["timeline_complete"])
+    timeline.unexplored_score = float(arrays["timeline_unexplored_score"])
+    timeline.outside_horizon_score = float(arrays["timeline_outside_horizon_score"])
+    timeline.remainder = [
+        FlowTD(distribution=td, flow=-1, activity=activity)
+        for td, activity in zip(
+            distributions_from_arrays(arrays, "remainder_"),
+            arrays["remainder_activity"].tolist(),
+        )
+    ]
+    return timeline
+
+
+def save_arrays(filepath: Path | str, arrays: dict[str, np.ndarray]) -> None:
+    """Write `arrays` to a `.npz` file atomically; a crash while writing leaves any previous file intact."""
+    filepath = Path(filepath)
+    tmp_filepath = filepath.with_name(filepath.name + ".tmp")
+    with open(tmp_filepath, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_filepath, filepath)
+
+
+def load_arrays(filepath: Path | str) -> dict[str, np.ndarray]:
+    with np.load(filepath, allow_pickle=False) as data:
+        return dict(data)
+
+
+def save_checkpoint(filepath: Path | str, tlca, node_timeline: bool) -> None:
+    """Write the traversal tables, the unfinished heap in `tlca.frontier`, and
+    the partial `tlca.timeline` of the `TemporalisLCA` instance `tlca` to `filepath`."""
+    heap = tlca.frontier
+    save_arrays(
+        filepath,
+        {
+            "version": np.array(CHECKPOINT_VERSION),
+            "unique_id": np.array(tlca.unique_id),
+            "node_timeline": np.array(node_timeline),
+            "convolution_count": np.array(tlca.convolution_count),
+            "calculation_count": np.array(tlca.calculation_count),
+            "end_datetime": np.array(
+                (
+                    np.datetime64("NaT")
+                    if tlca.end_datetime is None
+                    else tlca.end_datetime
+                ),
+                dtype="datetime64[s]",
+            ),
+            **distributions_to_arrays([tlca.t0], "t0_"),
+            **traversal_to_arrays(tlca.nodes, tlca.edges, tlca.flows),
+            "heap_priority": np.array([entry[0] for entry in heap], dtype=np.float64),
+            "heap_counter": np.array([entry[1] for entry in heap], dtype=np.int64),
+            "heap_node": np.array(
+                [entry[3].unique_id for entry in heap], dtype=np.int64
+            ),
+            **distributions_to_arrays([entry[2] for entry in heap], "heap_"),
+            **timeline_to_arrays(tlca.timeline),
+        },
+    )
+
+
+def load_checkpoint(filepath: Path | str) -> dict:
+    """Load a checkpoint written by `save_checkpoint`.
+
+    Returns a dictionary with the keys `unique_id`, `node_timeline`,
+    `convolution_count`, `calculation_count`, `end_datetime`, `t0`, `nodes`, `edges`,
+    `flows`, `heap`, and `timeline`."""
+    arrays = load_arrays(filepath)
+    if int(arrays["version"]) != CHECKPOINT_VERSION:
+        raise ValueError(
+            "Checkpoint version {} not supported".format(int(arrays["version"]))
+        )
+    nodes, edges, flows = traversal_from_arrays(arrays)
+    end_datetime = arrays["end_datetime"]
+    heap = [
+        (priority, counter, td, nodes[node_id])
+        for priority, counter, node_id, td in zip(
+            arrays["heap_priority"].tolist(),
+            arrays["heap_counter"].tolist(),
+            arrays["heap_node"].tolist(),
+            distributions_from_arrays(arrays, "heap_"),
+        )
+    ]
+    return {
+        "unique_id": int(arrays["unique_id"]),
+        "node_timeline": bool(arrays["node_timeline"]),
+        "convolution_count": int(arrays["convolution_count"]),
+        "calculation_count": int(arrays["calculation_count"]),
+        "end_datetime": None if np.isnat(end_datetime) else end_datetime[()],
+        "t0": distributions_from_arrays(arrays, "t0_")[0],
+        "nodes": nodes,
+        "edges": edges,
+        "flows": flows,
+        # Saved in heap order, which is still a valid heap
+        "heap": heap,
+        "timeline": timeline_from_arrays(arrays),
+    }
+
+
+def hash_matrix(matrix) -> str:
+    """Hash the structure and values of a scipy sparse matrix"""
+    matrix = matrix.tocsr()
+    digest = hashlib.sha256()
+    for array in (matrix.data, matrix.indices, matrix.indptr):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(str(matrix.shape).encode())
+    return digest.hexdigest()
+
+
+def save_cached_traversal(
+    cache_dir: Path, key: str, state: str, traversal: dict
+) -> Path:
+    """Store the output of graph traversal in `cache_dir`.
+
+    `key` identifies the calculation (functional unit, method, traversal
+    settings), and `state` the data it was calculated from. Entries for the same
+    `key` with a different `state` are out of date and are deleted."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for filepath in cache_dir.glob(f"{key}-*.npz"):
+        filepath.unlink()
+    filepath = cache_dir / f"{key}-{state}.npz"
+    save_arrays(
+        filepath,
+        {
+            "version": np.array(TRAVERSAL_CACHE_VERSION),
+            "calculation_count": np.array(traversal["calculation_count"]),
+            **traversal_to_arrays(
+                traversal["nodes"], traversal["edges"], traversal["flows"]
+            ),
+        },
+    )
+    return filepath
+
+
+def load_cached_traversal(cache_dir: Path, key: str, state: str) -> dict | None:
+    """Load graph traversal output stored by `save_cached_traversal`.
+
+    Returns `None` if there is no valid cache entry."""
+    filepath = Path(cache_dir) / f"{key}-{state}.npz"
+    if not filepath.exists():
+        return None
+    arrays = load_arrays(filepath)
+    if int(arrays["version"]) != TRAVERSAL_CACHE_VERSION:
+        return None
+    nodes, edges, flows = traversal_from_arrays(arrays)
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "flows": flows,
+        "calculation_count": int(arrays["calculation_count"]),
+    }
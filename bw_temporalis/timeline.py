@@ -1,11 +1,23 @@
+from collections.abc import MutableSequence
 from dataclasses import dataclass
-from typing import Callable, List
+from itertools import islice
+from typing import Callable, Iterable, List
 
 import bw2data as bd
 import numpy as np
 import pandas as pd
+from bw2data.backends import ActivityDataset as AD
 
+from .characterization import (
+    broadcast_multipliers,
+    characterize_binned,
+    is_vectorized,
+    rowwise_adapter,
+)
+from .convolution import datetime_type
+from .cube import TimelineCube
 from .temporal_distribution import TemporalDistribution
+from .utils import chunks
 
 
 class EmptyTimeline(Exception):
@@ -60,18 +72,226 @@ class NodeTD:
     num_flows_td: int
 
 
+class TimelineData(MutableSequence):
+    """
+    List-like view of the elements of a `Timeline`, stored in its columns.
+
+    Each element is built as a `FlowTD` or `NodeTD` when it is accessed; its distribution arrays are read-only
+    views of the columns, and changes to its attributes are not stored. `append`, item assignment, and `del`
+    change the timeline through `Timeline.append`, `Timeline.replace`, and `Timeline.remove`.
+    """
+
+    def __init__(self, timeline: "Timeline"):
+        self._timeline = timeline
+
+    def __len__(self) -> int:
+        return len(self._timeline)
+
+    def _index(self, index: int) -> int:
+        length = len(self)
+        if not -length <= index < length:
+            raise IndexError("Timeline index out of range")
+        return index % length
+
+    def __getitem__(self, index: int | slice) -> FlowTD | NodeTD | list:
+        if isinstance(index, slice):
+            return [
+                self._timeline._element(i) for i in range(*index.indices(len(self)))
+            ]
+        return self._timeline._element(self._index(index))
+
+    def __iter__(self):
+        timeline = self._timeline
+        if timeline.aggregate is not None:
+            for key, entry in list(timeline._aggregated.items()):
+                yield timeline._aggregated_element(key, entry)
+        else:
+            for index in range(len(self)):
+                yield timeline._element(index)
+
+    def __setitem__(self, index: int | slice, value) -> None:
+        if isinstance(index, slice):
+            elements = list(self)
+            elements[index] = value
+            self._timeline.data = elements
+        else:
+            self._timeline.replace(self._index(index), value)
+
+    def __delitem__(self, index: int | slice) -> None:
+        if isinstance(index, slice):
+            elements = list(self)
+            del elements[index]
+            self._timeline.data = elements
+        else:
+            self._timeline.remove(self._index(index))
+
+    def insert(self, index: int, value: FlowTD | NodeTD) -> None:
+        if index >= len(self):
+            self._timeline.append(value)
+        else:
+            elements = list(self)
+            elements.insert(index, value)
+            self._timeline.data = elements
+
+    def append(self, value: FlowTD | NodeTD) -> None:
+        self._timeline.append(value)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (TimelineData, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return "TimelineData({!r})".format(list(self))
+
+
+# Aggregation levels of `Timeline`, and the `(flow, activity)` key of each incoming distribution
+AGGREGATION_LEVELS = {
+    "flow": lambda flow, activity: (flow, -1),
+    "activity": lambda flow, activity: (-1, activity),
+    "flow+activity": lambda flow, activity: (flow, activity),
+}
+
+# Minimum number of pending points of an aggregated `Timeline` key before they are merged
+CONSOLIDATE_THRESHOLD = 10_000
+
+# Calendar bins for `Timeline.resample`
+RESAMPLE_FREQUENCIES = ("Y", "Q", "M", "D")
+
+# Largest number of possible group keys summed with a dense `np.bincount` in `Timeline.resample`
+DENSE_GROUP_LIMIT = 50_000_000
+
+
+def truncate_dates(date: np.ndarray, freq: str) -> np.ndarray:
+    """
+    Truncate `datetime64` values to the start of their calendar year (`"Y"`), quarter (`"Q"`), month (`"M"`), or
+    day (`"D"`), without going through Pandas datetime accessors.
+
+    Returns
+    -------
+    Numpy array with dtype `datetime64[s]`.
+    """
+    if freq not in RESAMPLE_FREQUENCIES:
+        raise ValueError(
+            f"Unknown frequency {freq}; must be one of {RESAMPLE_FREQUENCIES}"
+        )
+    if freq == "Q":
+        months = np.asarray(date).astype("datetime64[M]").astype(np.int64)
+        return (months - months % 3).astype("datetime64[M]").astype("datetime64[s]")
+    return np.asarray(date).astype(f"datetime64[{freq}]").astype("datetime64[s]")
+
+
+def fetch_node_fields(ids: Iterable[int], fields: list[str]) -> dict[int, dict]:
+    """
+    Look up `fields` of the nodes with the given database ids, in batched queries.
+
+    Returns
+    -------
+    Dictionary from node id to a dictionary of the requested fields; missing fields are `None`.
+    Unknown ids are left out.
+    """
+    ids = sorted(set(int(x) for x in ids))
+    result = {}
+    for chunk in chunks(ids):
+        for node_id, data in AD.select(AD.id, AD.data).where(AD.id << chunk).tuples():
+            result[node_id] = {field: data.get(field) for field in fields}
+    return result
+
+
+class GrowableArray:
+    """One-dimensional array with amortized constant time appends, by doubling its capacity"""
+
+    def __init__(self, dtype: np.dtype, capacity: int = 256):
+        self.array = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def _reserve(self, size: int) -> None:
+        if size > len(self.array):
+            array = np.empty(max(size, 2 * len(self.array)), dtype=self.array.dtype)
+            array[: self.size] = self.array[: self.size]
+            self.array = array
+
+    def extend(self, values: np.ndarray) -> None:
+        end = self.size + len(values)
+        self._reserve(end)
+        self.array[self.size : end] = values
+        self.size = end
+
+    def fill(self, value, count: int) -> None:
+        """Append `value` `count` times"""
+        end = self.size + count
+        self._reserve(end)
+        self.array[self.size : end] = value
+        self.size = end
+
+    def append(self, value) -> None:
+        self.fill(value, 1)
+
+    def view(self) -> np.ndarray:
+        """The filled part of the array; not a copy"""
+        return self.array[: self.size]
+
+    def __len__(self) -> int:
+        return self.size
+
+
 class Timeline:
     """
     Sum and group elements over time.
     Timeline calculations produce a list of [(datetime, amount)] tuples.
 
+    Elements are stored in columns of contiguous, growable arrays: per point `date`, `amount`, `flow`, and
+    `activity`, and per element `offsets` into the point columns, `flow`, `activity`, `num_flows`, and
+    `num_flows_td` (-1 for `FlowTD` elements). See `Timeline.columns`.
+
     Attributes
     ----------
-    self.data : list[FlowTD]
+    self.data : TimelineData
+        List-like view of the elements as `FlowTD` or `NodeTD` objects, for compatibility. Elements are built
+        one at a time when accessed; their distribution arrays are not writeable, and changes to their attributes
+        are not stored. Use `append`, item assignment, or `del` on the view, or `append`, `replace`, and
+        `remove` on the timeline to change the elements, or assign a new sequence to replace all of them.
+    self.complete : bool
+        `False` if this timeline was built with a budget which ran out before the supply chain was fully explored.
+    self.unexplored_score : float
+        Sum of the cumulative LCIA scores of the supply chain nodes which weren't explored.
+    self.remainder : list[FlowTD]
+        LCIA scores of supply chains skipped by the `propagation_cutoff` of `TemporalisLCA.build_timeline`,
+        at the time of their consumer. `flow` is always -1.
+    self.outside_horizon_score : float
+        LCIA score of emissions after the `end_datetime` of `TemporalisLCA`, which were left out of this timeline.
+    self.sink : TimelineSink | None
+        If given, flow temporal distributions are passed to this sink instead of being stored in `self.data`.
+    self.aggregate : str | None
+        If given, one of `"flow"`, `"activity"`, or `"flow+activity"`. Incoming flow temporal distributions
+        are summed into one distribution per flow, per activity, or per `(flow, activity)` pair, and `self.data`
+        has one `FlowTD` per key. The aggregated-away attribute is -1.
+    self.points_added : int
+        Number of `(date, amount)` points passed to this timeline, before any aggregation.
     """
 
-    def __init__(self, data: list[FlowTD] | None = None):
-        self.data = data or []
+    def __init__(
+        self, data: list[FlowTD] | None = None, sink=None, aggregate: str | None = None
+    ):
+        if aggregate is not None and aggregate not in AGGREGATION_LEVELS:
+            raise ValueError(f"Unknown aggregation level {aggregate}")
+        if aggregate is not None and sink is not None:
+            raise ValueError("Can't aggregate a timeline with a `sink`")
+        self.aggregate = aggregate
+        # Aggregated keys map to `[list of date arrays, list of amount arrays, number of pending points]`
+        self._aggregated = {}
+        self.sink = sink
+        self.points_added = 0
+        self._clear()
+        if aggregate is None:
+            self.data = data or []
+        else:
+            for o in data or []:
+                self.add_flow_temporal_distribution(o.distribution, o.flow, o.activity)
+        self.complete = True
+        self.unexplored_score = 0.0
+        self.remainder = []
+        self.outside_horizon_score = 0.0
 
     def add_flow_temporal_distribution(
         self, td: TemporalDistribution, flow: int, activity: int
@@ -92,9 +312,25 @@ class Timeline:
         --------
         bw_temporalis.temporal_distribution.TemporalDistribution: A container for a series of values spread over time.
         """
-        self.data.append(
-            FlowTD(distribution=td.nonzero(), flow=flow, activity=activity)
-        )
+        self.points_added += len(td)
+        if self.sink is not None:
+            self.sink.add_flow_temporal_distribution(
+                td=td.nonzero(), flow=flow, activity=activity
+            )
+            return
+        if self.aggregate is not None:
+            td = td.nonzero()
+            key = AGGREGATION_LEVELS[self.aggregate](flow, activity)
+            if key not in self._aggregated:
+                self._aggregated[key] = [[], [], 0]
+            entry = self._aggregated[key]
+            entry[0].append(td.date.astype("datetime64[s]"))
+            entry[1].append(td.amount)
+            entry[2] += len(td)
+            if entry[2] > max(CONSOLIDATE_THRESHOLD, len(entry[0][0])):
+                self._consolidate(entry)
+            return
+        self._append(td.nonzero(), flow=flow, activity=activity)
 
     def add_node_temporal_distribution(
         self, td: TemporalDistribution, activity: int, num_flows: int, num_flows_td: int
@@ -117,63 +353,384 @@ class Timeline:
         --------
         bw_temporalis.temporal_distribution.TemporalDistribution: A container for a series of values spread over time.
         """
-        self.data.append(
-            NodeTD(
-                distribution=td.nonzero(),
-                flow=-1,
+        self.points_added += len(td)
+        self._append(
+            td.nonzero(),
+            flow=-1,
+            activity=activity,
+            num_flows=num_flows,
+            num_flows_td=num_flows_td,
+        )
+
+    def _clear(self) -> None:
+        self._date = GrowableArray(np.int64)
+        self._amount = GrowableArray(np.float64)
+        self._point_flow = GrowableArray(np.int64)
+        self._point_activity = GrowableArray(np.int64)
+        self._offsets = GrowableArray(np.int64)
+        self._offsets.append(0)
+        self._flow = GrowableArray(np.int64)
+        self._activity = GrowableArray(np.int64)
+        self._num_flows = GrowableArray(np.int64)
+        self._num_flows_td = GrowableArray(np.int64)
+        # Number of points already sorted into `self.df`
+        self._df_points = 0
+
+    def _append(
+        self,
+        td: TemporalDistribution,
+        flow: int,
+        activity: int,
+        num_flows: int = -1,
+        num_flows_td: int = -1,
+    ) -> None:
+        count = len(td)
+        self._date.extend(td.date.astype("datetime64[s]").astype(np.int64))
+        self._amount.extend(td.amount)
+        self._point_flow.fill(flow, count)
+        self._point_activity.fill(activity, count)
+        self._offsets.append(self._offsets.array[self._offsets.size - 1] + count)
+        self._flow.append(flow)
+        self._activity.append(activity)
+        self._num_flows.append(num_flows)
+        self._num_flows_td.append(num_flows_td)
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        """
+        The timeline columns, without copying.
+
+        Returns
+        -------
+        Dictionary with the per point arrays `date` (datetime64[s]), `amount`, `flow`, and `activity`, and the
+        per element arrays `offsets` (one longer than the number of elements), `element_flow`,
+        `element_activity`, `num_flows`, and `num_flows_td`.
+        """
+        if self.aggregate is not None:
+            data = self.data
+            return {
+                "date": np.hstack(
+                    [np.zeros(0, dtype="datetime64[s]")]
+                    + [o.distribution.date for o in data]
+                ),
+                "amount": np.hstack(
+                    [np.zeros(0)] + [o.distribution.amount for o in data]
+                ),
+                "flow": np.hstack(
+                    [np.zeros(0, dtype=np.int64)]
+                    + [
+                        np.full(len(o.distribution), o.flow, dtype=np.int64)
+                        for o in data
+                    ]
+                ),
+                "activity": np.hstack(
+                    [np.zeros(0, dtype=np.int64)]
+                    + [
+                        np.full(len(o.distribution), o.activity, dtype=np.int64)
+                        for o in data
+                    ]
+                ),
+                "offsets": np.cumsum([0] + [len(o.distribution) for o in data]),
+                "element_flow": np.array([o.flow for o in data], dtype=np.int64),
+                "element_activity": np.array(
+                    [o.activity for o in data], dtype=np.int64
+                ),
+                "num_flows": np.full(len(data), -1, dtype=np.int64),
+                "num_flows_td": np.full(len(data), -1, dtype=np.int64),
+            }
+        return {
+            "date": self._date.view().view("datetime64[s]"),
+            "amount": self._amount.view(),
+            "flow": self._point_flow.view(),
+            "activity": self._point_activity.view(),
+            "offsets": self._offsets.view(),
+            "element_flow": self._flow.view(),
+            "element_activity": self._activity.view(),
+            "num_flows": self._num_flows.view(),
+            "num_flows_td": self._num_flows_td.view(),
+        }
+
+    @classmethod
+    def from_columns(
+        cls, columns: dict[str, np.ndarray], aggregate: str | None = None
+    ) -> "Timeline":
+        """
+        Create a timeline from the per element arrays of `Timeline.columns` and the point arrays `date`
+        and `amount`. The per point `flow` and `activity` arrays are optional.
+        """
+        timeline = cls(aggregate=aggregate)
+        date = np.asarray(columns["date"]).astype("datetime64[s]")
+        amount = np.asarray(columns["amount"], dtype=np.float64)
+        offsets = np.asarray(columns["offsets"], dtype=np.int64)
+        flow = np.asarray(columns["element_flow"], dtype=np.int64)
+        activity = np.asarray(columns["element_activity"], dtype=np.int64)
+        if aggregate is not None:
+            for start, end, f, a in zip(
+                offsets[:-1].tolist(),
+                offsets[1:].tolist(),
+                flow.tolist(),
+                activity.tolist(),
+            ):
+                timeline.add_flow_temporal_distribution(
+                    TemporalDistribution(
+                        date=date[start:end], amount=amount[start:end]
+                    ),
+                    flow=f,
+                    activity=a,
+                )
+            return timeline
+        counts = np.diff(offsets)
+        timeline._date.extend(date.view(np.int64))
+        timeline._amount.extend(amount)
+        timeline._point_flow.extend(np.repeat(flow, counts))
+        timeline._point_activity.extend(np.repeat(activity, counts))
+        timeline._offsets.extend(offsets[1:] - offsets[0])
+        timeline._flow.extend(flow)
+        timeline._activity.extend(activity)
+        timeline._num_flows.extend(columns["num_flows"])
+        timeline._num_flows_td.extend(columns["num_flows_td"])
+        return timeline
+
+    @staticmethod
+    def _consolidate(entry: list) -> None:
+        """Sum the pending date and amount arrays of an aggregated key"""
+        if len(entry[0]) > 1:
+            date, inverse = np.unique(np.hstack(entry[0]), return_inverse=True)
+            amount = np.bincount(inverse, weights=np.hstack(entry[1]))
+            entry[0], entry[1] = [date], [amount]
+        entry[2] = 0
+
+    @staticmethod
+    def _read_only_distribution(date: np.ndarray, amount: np.ndarray):
+        # Not through `__init__`, which copies the arrays
+        td = TemporalDistribution.__new__(TemporalDistribution)
+        td.date = date.view()
+        td.amount = amount.view()
+        td.base_time_type = datetime_type
+        td.date.flags.writeable = False
+        td.amount.flags.writeable = False
+        return td
+
+    @property
+    def data(self) -> TimelineData:
+        return TimelineData(self)
+
+    @data.setter
+    def data(self, value: Iterable) -> None:
+        if self.aggregate is not None:
+            raise ValueError("Can't set `data` of an aggregated timeline")
+        elements = list(value)
+        self._clear()
+        for o in elements:
+            self.append(o)
+
+    def _element(self, index: int) -> FlowTD | NodeTD:
+        """Element `index` of `Timeline.data`, with read-only views of the columns as distribution"""
+        if self.aggregate is not None:
+            return self._aggregated_element(
+                *next(islice(self._aggregated.items(), index, None))
+            )
+        start, end = self._offsets.array[index : index + 2].tolist()
+        td = self._read_only_distribution(
+            self._date.array[start:end].view("datetime64[s]"),
+            self._amount.array[start:end],
+        )
+        flow, activity, num_flows, num_flows_td = (
+            int(self._flow.array[index]),
+            int(self._activity.array[index]),
+            int(self._num_flows.array[index]),
+            int(self._num_flows_td.array[index]),
+        )
+        if num_flows >= 0:
+            return NodeTD(
+                distribution=td,
+                flow=flow,
                 activity=activity,
                 num_flows=num_flows,
                 num_flows_td=num_flows_td,
             )
+        return FlowTD(distribution=td, flow=flow, activity=activity)
+
+    def _aggregated_element(self, key: tuple[int, int], entry: list) -> FlowTD:
+        self._consolidate(entry)
+        return FlowTD(
+            distribution=self._read_only_distribution(entry[0][0], entry[1][0]),
+            flow=key[0],
+            activity=key[1],
+        )
+
+    def append(self, element: FlowTD | NodeTD) -> None:
+        """
+        Append a `FlowTD` or `NodeTD` element, without removing its zero amounts.
+
+        Parameters
+        ----------
+        element : FlowTD | NodeTD
+            Element to add. Its distribution is copied into the timeline columns.
+        """
+        if self.aggregate is not None:
+            raise ValueError(
+                "Use `add_flow_temporal_distribution` on an aggregated timeline"
+            )
+        self._append(
+            element.distribution,
+            flow=element.flow,
+            activity=element.activity,
+            num_flows=getattr(element, "num_flows", -1),
+            num_flows_td=getattr(element, "num_flows_td", -1),
+        )
+
+    def replace(self, index: int, element: FlowTD | NodeTD) -> None:
+        """
+        Replace element `index` of `Timeline.data` with `element`. Rebuilds the timeline columns.
+        """
+        if self.aggregate is not None:
+            raise ValueError("Can't replace elements of an aggregated timeline")
+        elements = list(self.data)
+        elements[index] = element
+        self.data = elements
+
+    def remove(self, index: int) -> None:
+        """
+        Remove element `index` of `Timeline.data`. Rebuilds the timeline columns.
+        """
+        if self.aggregate is not None:
+            raise ValueError("Can't remove elements of an aggregated timeline")
+        elements = list(self.data)
+        del elements[index]
+        self.data = elements
+
+    def add_remainder_temporal_distribution(
+        self, td: TemporalDistribution, activity: int
+    ) -> None:
+        """
+        Append a TemporalDistribution object of LCIA scores to the Timeline.remainder object.
+
+        Parameters
+        ----------
+        td : TemporalDistribution
+            Temporal distribution of the skipped LCIA score.
+        activity : int
+            Activity whose supply chain was skipped.
+        """
+        self.remainder.append(
+            FlowTD(distribution=td.nonzero(), flow=-1, activity=activity)
         )
 
+    @property
+    def remainder_score(self) -> float:
+        """Total LCIA score in `Timeline.remainder`"""
+        return float(sum(o.distribution.total for o in self.remainder))
+
+    def extend(self, other: "Timeline") -> None:
+        """
+        Append all elements of `other` to this Timeline.
+
+        Parameters
+        ----------
+        other : Timeline
+            Timeline to merge into this one. Not modified.
+        """
+        if self.aggregate is None and other.aggregate is None:
+            columns = other.columns
+            self._date.extend(columns["date"].view(np.int64))
+            self._amount.extend(columns["amount"])
+            self._point_flow.extend(columns["flow"])
+            self._point_activity.extend(columns["activity"])
+            self._offsets.extend(
+                columns["offsets"][1:] + self._offsets.array[self._offsets.size - 1]
+            )
+            self._flow.extend(columns["element_flow"])
+            self._activity.extend(columns["element_activity"])
+            self._num_flows.extend(columns["num_flows"])
+            self._num_flows_td.extend(columns["num_flows_td"])
+            self.points_added += other.points_added
+        elif self.aggregate is None:
+            for o in other.data:
+                self.append(o)
+            self.points_added += other.points_added
+        else:
+            for o in other.data:
+                self.add_flow_temporal_distribution(o.distribution, o.flow, o.activity)
+        self.remainder.extend(other.remainder)
+        self.outside_horizon_score += other.outside_horizon_score
+        if (
+            self.sink is not None
+            and other.sink is not None
+            and other.sink is not self.sink
+        ):
+            self.sink.merge(other.sink)
+
     def __len__(self):
-        return len(self.data)
+        if self.aggregate is None:
+            return self._flow.size
+        return len(self._aggregated)
 
-    def build_dataframe(self) -> None:
+    def build_dataframe(self) -> pd.DataFrame:
         """
-        Build a Pandas DataFrame from the Timeline.data object and store it as a Timeline.pd object.
+        Build a Pandas DataFrame from the Timeline.data object and store it as `Timeline.df`.
+
+        Rows are sorted by date; rows with the same date keep the order in which they were added. Calling this
+        again after adding elements only sorts the new rows, and merges them into the previously sorted rows.
+        Aggregated timelines are always rebuilt, as adding elements changes existing rows.
 
         Returns
         -------
-        None, creates class attribute Pandas DataFrame `df` with the following columns:
+        The Pandas DataFrame of all rows, also stored as `df`, with the following columns:
         - date: datetime64[s]
         - amount: float64
         - flow: int
         - activity: int
         """
-        if not len(self.data):
+        if not len(self):
             raise EmptyTimeline("No `FlowTD` elements present")
 
-        date = np.hstack([o.distribution.date for o in self.data])
+        columns = self.columns
 
         # Not really testable; `TemporalDistribution` will raise an error with an
         # empty array. But our users are creative...
-        if not len(date):
+        if not len(columns["date"]):
             raise EmptyTimeline(
                 "This timeline is empty; element: {}".format(
-                    [len(x) for x in self.data]
+                    np.diff(columns["offsets"]).tolist()
                 )
             )
 
-        amount = np.hstack([o.distribution.amount for o in self.data])
-        flow = np.hstack([o.flow * np.ones(len(o.distribution), dtype=np.int64) for o in self.data])
-        activity = np.hstack(
-            [o.activity * np.ones(len(o.distribution), dtype=np.int64) for o in self.data]
-        )
+        start = self._df_points if self.aggregate is None else 0
+        new = {
+            label: columns[label][start:]
+            for label in ("date", "amount", "flow", "activity")
+        }
+        order = np.argsort(new["date"], kind="stable")
+        new = {label: array[order] for label, array in new.items()}
+
+        if not start:
+            self._df_columns = new
+        else:
+            # New rows go after existing rows with the same date, like a stable sort of all rows
+            old = self._df_columns
+            positions = np.searchsorted(
+                old["date"], new["date"], side="right"
+            ) + np.arange(len(new["date"]))
+            is_old = np.ones(len(old["date"]) + len(new["date"]), dtype=bool)
+            is_old[positions] = False
+            merged = {}
+            for label, array in new.items():
+                merged[label] = np.empty(len(is_old), dtype=array.dtype)
+                merged[label][positions] = array
+                merged[label][is_old] = old[label]
+            self._df_columns = merged
+        self._df_points = len(columns["date"])
 
+        # `self.df` can be changed by the caller, so the sorted columns are copied
         self.df = pd.DataFrame(
             {
-                "date": pd.Series(
-                    data=date.astype("datetime64[s]"), dtype="datetime64[s]"
-                ),
-                "amount": pd.Series(data=amount, dtype="float64"),
-                "flow": pd.Series(data=flow, dtype="int64"),
-                "activity": pd.Series(data=activity, dtype="int64"),
+                "date": pd.Series(data=self._df_columns["date"], dtype="datetime64[s]"),
+                "amount": pd.Series(data=self._df_columns["amount"], dtype="float64"),
+                "flow": pd.Series(data=self._df_columns["flow"], dtype="int64"),
+                "activity": pd.Series(data=self._df_columns["activity"], dtype="int64"),
             }
         )
-        self.df.sort_values(by="date", ascending=True, inplace=True)
-        self.df.reset_index(drop=True, inplace=True)
         return self.df
 
     def characterize_dataframe(
@@ -208,6 +765,10 @@ class Timeline:
         The `characterization_function` is applied to each row of the input Timeline for a given `period` of days.
         The new rows are appended to the Timeline Pandas DataFrame.
 
+        Functions marked with `bw_temporalis.characterization.vectorized` are instead called once, with the
+        `date`, `amount`, `flow`, and `activity` columns of all selected rows as Numpy arrays, and return the
+        result columns. Row-wise functions are wrapped with `rowwise_adapter`.
+
         Parameters
         ----------
         characterization_function : Callable
@@ -229,14 +790,21 @@ class Timeline:
         if not hasattr(self, "df"):
             raise ValueError("Call `.build_dataframe()` first")
 
-        df = self.df.copy()
+        mask = np.ones(len(self.df), dtype=bool)
         if activity:
-            df = df.loc[self.df["activity"].isin(activity)]
+            mask &= self.df["activity"].isin(activity).to_numpy()
         if flow:
-            df = df.loc[self.df["flow"].isin(flow)]
-        df.reset_index(drop=True, inplace=True)
-        result_df = pd.concat(
-            [characterization_function(row) for _, row in df.iterrows()]
+            mask &= self.df["flow"].isin(flow).to_numpy()
+
+        if not is_vectorized(characterization_function):
+            characterization_function = rowwise_adapter(characterization_function)
+        result_df = pd.DataFrame(
+            characterization_function(
+                date=self.df["date"].to_numpy()[mask],
+                amount=self.df["amount"].to_numpy()[mask],
+                flow=self.df["flow"].to_numpy()[mask],
+                activity=self.df["activity"].to_numpy()[mask],
+            )
         )
         if "date" in result_df.columns:
             result_df.sort_values(by="date", ascending=True, inplace=True)
@@ -245,6 +813,129 @@ class Timeline:
             result_df["amount_sum"] = result_df["amount"].cumsum()
         return result_df
 
+    def characterize_flows(
+        self,
+        characterization_functions: dict[int | str, Callable | np.ndarray],
+        cumsum: bool | None = True,
+    ) -> pd.DataFrame:
+        """
+        Characterizes each flow of the Timeline Pandas DataFrame with its own characterization function, in one pass.
+
+        The rows are grouped by flow once, and each group is passed to the function for its flow. This replaces
+        calling `characterize_dataframe` once per flow with a `flow` filter.
+
+        Parameters
+        ----------
+        characterization_functions : dict
+            Keys are flow ids, or values of the `temporalis code` attribute of flow nodes (e.g. `"co2"`), which
+            are looked up in the database. A flow id key takes precedence over the code of that flow. Values are
+            row-wise or vectorized characterization functions (see `characterize_dataframe`), or Numpy arrays
+            with the characterized amount per unit emission for each year after the emission (e.g.
+            `bw_temporalis.lcia.radiative_forcing_kernel("co2", 100)`). Flows without a function are left out.
+        cumsum : bool
+            Add the `amount_sum` column.
+
+        Returns
+        -------
+        A Pandas DataFrame, sorted by date, with the columns `date`, `amount`, `flow`, `activity`, and
+        `amount_sum` (only if `cumsum`).
+
+        """
+        if not hasattr(self, "df"):
+            raise ValueError("Call `.build_dataframe()` first")
+
+        flow = self.df["flow"].to_numpy()
+        flows, flow_codes = np.unique(flow, return_inverse=True)
+        order = np.argsort(flow_codes, kind="stable")
+        bounds = np.cumsum(np.bincount(flow_codes, minlength=len(flows)))
+
+        codes = {}
+        if any(isinstance(key, str) for key in characterization_functions):
+            codes = {
+                node_id: data["temporalis code"]
+                for node_id, data in fetch_node_fields(
+                    flows.tolist(), ["temporalis code"]
+                ).items()
+            }
+
+        columns = {
+            label: self.df[label].to_numpy()[order]
+            for label in ("date", "amount", "flow", "activity")
+        }
+        results = []
+        for index, flow_id in enumerate(flows.tolist()):
+            function = characterization_functions.get(flow_id)
+            if function is None and codes.get(flow_id) is not None:
+                function = characterization_functions.get(codes[flow_id])
+            if function is None:
+                continue
+            group = slice(bounds[index - 1] if index else 0, bounds[index])
+            arrays = {label: array[group] for label, array in columns.items()}
+            if isinstance(function, np.ndarray):
+                result = broadcast_multipliers(multipliers=function, **arrays)
+            else:
+                if not is_vectorized(function):
+                    function = rowwise_adapter(function)
+                result = function(**arrays)
+            results.append(pd.DataFrame(result))
+
+        if not results:
+            result_df = pd.DataFrame(
+                {
+                    "date": pd.Series(dtype="datetime64[s]"),
+                    "amount": pd.Series(dtype="float64"),
+                    "flow": pd.Series(dtype="int64"),
+                    "activity": pd.Series(dtype="int64"),
+                }
+            )
+        else:
+            result_df = pd.concat(results, ignore_index=True)
+            result_df.sort_values(
+                by="date", ascending=True, inplace=True, kind="stable"
+            )
+            result_df.reset_index(drop=True, inplace=True)
+        if cumsum:
+            result_df["amount_sum"] = result_df["amount"].cumsum()
+        return result_df
+
+    def characterize_binned(
+        self,
+        kernels: dict[int, np.ndarray],
+        resolution: str = "Y",
+        method: str = "fft",
+        cumsum: bool | None = True,
+    ) -> pd.DataFrame:
+        """
+        Characterizes the Timeline Pandas DataFrame by convolving binned emissions with a kernel per flow.
+
+        Much faster than `characterize_dataframe` for linear, time-invariant characterization such as
+        radiative forcing, e.g. `{co2_id: bw_temporalis.lcia.radiative_forcing_kernel("co2", 100)}`. See
+        `bw_temporalis.characterization.characterize_binned` for the parameters.
+
+        Returns
+        -------
+        A Pandas DataFrame with the following columns:
+        - date: datetime64[s]; start of each time bin
+        - amount: float64
+        - flow: int
+        - amount_sum: float64; only if `cumsum`
+
+        """
+        if not hasattr(self, "df"):
+            raise ValueError("Call `.build_dataframe()` first")
+
+        result_df = characterize_binned(
+            date=self.df["date"].to_numpy(),
+            amount=self.df["amount"].to_numpy(),
+            flow=self.df["flow"].to_numpy(),
+            kernels=kernels,
+            resolution=resolution,
+            method=method,
+        )
+        if cumsum:
+            result_df["amount_sum"] = result_df["amount"].cumsum()
+        return result_df
+
     def sum_days_to_years(self) -> pd.DataFrame:
         """
         Sums the day-resolution `amount` of the Timeline Pandas DataFrame to years.
@@ -288,30 +979,183 @@ class Timeline:
 
         return result_df
 
+    def resample(
+        self, freq: str = "Y", by: tuple[str, ...] | list[str] = ("flow", "activity")
+    ) -> pd.DataFrame:
+        """
+        Sums the `amount` of the Timeline Pandas DataFrame per calendar bin and per `flow` and/or `activity`.
+
+        Dates are truncated with `truncate_dates`, and each grouping column is converted to integer codes, so
+        the amounts are summed with a single `np.bincount` over the combined codes, instead of a Pandas groupby
+        on timestamps.
+
+        Parameters
+        ----------
+        freq : str
+            One of `"Y"` (year), `"Q"` (quarter), `"M"` (month), or `"D"` (day).
+        by : tuple[str, ...]
+            Columns to group by in addition to the date; any combination of `"flow"` and `"activity"`, including
+            none.
+
+        Returns
+        -------
+        A Pandas DataFrame, sorted by date and then the `by` columns, with the columns `date` (datetime64[s];
+        start of each bin), the `by` columns, and `amount`. Only bins and groups with at least one row are
+        present.
+
+        """
+        if not hasattr(self, "df"):
+            raise ValueError("Call `.build_dataframe()` first")
+        by = list(by)
+        if not set(by).issubset({"flow", "activity"}) or len(set(by)) != len(by):
+            raise ValueError(
+                f"`by` must be a combination of `flow` and `activity`; got {by}"
+            )
+
+        bins = truncate_dates(self.df["date"].to_numpy(), freq).astype(np.int64)
+        uniques, combined, size = [], np.zeros(len(bins), dtype=np.int64), 1
+        for values in [bins] + [self.df[label].to_numpy() for label in by]:
+            # `pd.factorize` is hash based and linear; sorting the (few) uniques keeps the output ordered
+            codes, unique = pd.factorize(values, sort=True)
+            combined = combined * len(unique) + codes
+            uniques.append(unique)
+            size *= len(unique)
+
+        if size <= DENSE_GROUP_LIMIT:
+            amount = np.bincount(
+                combined, weights=self.df["amount"].to_numpy(), minlength=size
+            )
+            keys = np.flatnonzero(np.bincount(combined, minlength=size))
+            amount = amount[keys]
+        else:
+            keys, inverse = np.unique(combined, return_inverse=True)
+            amount = np.bincount(inverse, weights=self.df["amount"].to_numpy())
+
+        columns = {}
+        for label, unique in zip(reversed(["date"] + by), reversed(uniques)):
+            columns[label] = unique[keys % len(unique)]
+            keys = keys // len(unique)
+
+        return pd.DataFrame(
+            {
+                "date": pd.Series(
+                    data=columns["date"].astype("datetime64[s]"), dtype="datetime64[s]"
+                ),
+                **{
+                    label: pd.Series(data=columns[label], dtype="int64") for label in by
+                },
+                "amount": pd.Series(data=amount, dtype="float64"),
+            }
+        )
+
+    def to_cube(self, freq: str = "Y") -> "TimelineCube":
+        """
+        Sparse time bin × flow × activity cube of the Timeline Pandas DataFrame amounts.
+
+        Parameters
+        ----------
+        freq : str
+            Time bin; see `resample`.
+
+        Returns
+        -------
+        A `bw_temporalis.cube.TimelineCube`.
+
+        """
+        return TimelineCube.from_dataframe(self.resample(freq, by=("flow", "activity")))
+
     def add_metadata_to_dataframe(
         self,
-        database_labels: list[str],
+        database_labels: list[str] | None = None,
         fields: List[str] = ["name", "unit", "location", "categories"],
+        categorical: bool | None = False,
     ) -> pd.DataFrame:
         """
         Add additional columns with metadata to the dataframe. Returns a new dataframe.
 
         Parameters
         ----------
-        database_labels : list[str]
-            List of all databases to load and add metadata from
+        database_labels : list[str], optional
+            List of all databases to load and add metadata from. If not given, only the flows and activities
+            present in the dataframe are looked up, in batched queries, and their metadata is cached in the
+            timeline for later calls. This is much faster for large databases.
         fields : list[str]
             Metadata fields to add.
+        categorical : bool
+            Return the metadata columns as Pandas categoricals.
 
         """
         if not hasattr(self, "df"):
             raise ValueError("Call `.build_dataframe()` first")
 
+        if database_labels is None:
+            return self._add_cached_metadata(fields, categorical)
+        df = self._add_database_metadata(database_labels, fields)
+        if categorical:
+            for kind in ("activity", "flow"):
+                for field in fields:
+                    label = "{}_{}".format(kind, field)
+                    try:
+                        df[label] = df[label].astype("category")
+                    except TypeError:
+                        # Unhashable values, like lists, can't be categories
+                        pass
+        return df
+
+    def _add_cached_metadata(
+        self, fields: List[str], categorical: bool
+    ) -> pd.DataFrame:
+        if not hasattr(self, "metadata_cache"):
+            self.metadata_cache = {}
+
+        codes, uniques = {}, {}
+        for kind in ("activity", "flow"):
+            codes[kind], uniques[kind] = pd.factorize(self.df[kind].to_numpy())
+        ids = set(uniques["activity"].tolist()) | set(uniques["flow"].tolist())
+        missing = [
+            node_id
+            for node_id in ids
+            if not all(
+                field in self.metadata_cache.get(node_id, {}) for field in fields
+            )
+        ]
+        fetched = fetch_node_fields(missing, fields)
+        for node_id in missing:
+            # Unknown ids are cached too, so they aren't queried again
+            self.metadata_cache.setdefault(node_id, {}).update(
+                fetched.get(node_id, dict.fromkeys(fields))
+            )
+
+        df = self.df.copy()
+        for kind in ("activity", "flow"):
+            for field in fields:
+                values = [
+                    self.metadata_cache[node_id][field]
+                    for node_id in uniques[kind].tolist()
+                ]
+                try:
+                    values = pd.Categorical(values)
+                except TypeError:
+                    # Unhashable values, like lists, can't be categories
+                    column = pd.Series(values + [None], dtype=object).to_numpy()[
+                        codes[kind]
+                    ]
+                else:
+                    column = pd.Categorical.from_codes(
+                        values.codes[codes[kind]], values.categories
+                    )
+                    if not categorical:
+                        column = column.astype(object)
+                df["{}_{}".format(kind, field)] = column
+        return df
+
+    def _add_database_metadata(
+        self, database_labels: list[str], fields: List[str]
+    ) -> pd.DataFrame:
         db = pd.concat(
             [bd.Database(label).nodes_to_dataframe() for label in database_labels]
         )
         db.drop(
-            axis=1,
             columns=[label for label in db.columns if label not in ["id"] + fields],
             inplace=True,
         )
@@ -322,7 +1166,6 @@ class Timeline:
             process_db, how="left", left_on="activity", right_on="id", validate="m:1"
         )
         df.drop(
-            axis=1,
             columns=["id"],
             inplace=True,
         )
@@ -333,7 +1176,6 @@ class Timeline:
             flow_db, how="left", left_on="flow", right_on="id", validate="m:1"
         )
         df.drop(
-            axis=1,
             columns=["id"],
             inplace=True,
         )
@@ -1,6 +1,7 @@
 import importlib.metadata
 import math
 import warnings
+from collections.abc import Iterator
 from numbers import Number
 from typing import Union
 
@@ -12,6 +13,9 @@ from tqdm import tqdm
 
 from .temporal_distribution import TemporalDistribution
 
+# Maximum number of values in one SQL `IN` clause
+SQL_CHUNK_SIZE = 500
+
 
 class IncongruentDistribution(Exception):
     """The sum of `TemporalDistribution` values is different than the exchange"""
@@ -249,6 +253,12 @@ def check_database_exchanges(database_label: str) -> None:
                     )
 
 
+def chunks(values: list, size: int = SQL_CHUNK_SIZE) -> Iterator[list]:
+    """Split `values` into consecutive slices of at most `size` elements, e.g. for SQL `IN` clauses"""
+    for index in range(0, len(values), size):
+        yield values[index : index + size]
+
+
 def get_version_tuple() -> tuple:
     def as_integer(x: str) -> Union[int, str]:
         try:
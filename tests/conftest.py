@@ -1,3 +1,122 @@
 """Fixtures for bw_temporalis"""
 
-# import pytest
+import bw2data as bd
+import pytest
+from bw2data.tests import bw2test
+
+from bw_temporalis import easy_timedelta_distribution
+
+
+def write_basic_db(
+    with_d: bool = True, n2o: bool = False, uncertain: bool = False
+) -> bd.Database:
+    """
+    Write the test database `db` and the method `("m",)`.
+
+    The functional unit `A` consumes `B` over five years; `B` consumes `C` and `D` and
+    emits `CO2`; `C` emits `CH4` and `D` emits `CO2`.
+
+    Parameters
+    ----------
+    with_d : bool
+        Include `D` and its edge from `B`.
+    n2o : bool
+        Add a `N2O` emission of `B`, characterized in the method.
+    uncertain : bool
+        Give the edge from `C` to `B` a normal distribution.
+    """
+    bd.projects.set_current("__test_fixture__")
+
+    b_exchanges = [
+        {"amount": 2, "input": ("db", "C"), "type": "technosphere"},
+        {
+            "amount": 8,
+            "input": ("db", "CO2"),
+            "type": "biosphere",
+            "temporal_distribution": easy_timedelta_distribution(
+                10, 17, steps=4, resolution="Y"
+            ),
+        },
+    ]
+    if uncertain:
+        b_exchanges[0].update({"uncertainty type": 3, "loc": 2, "scale": 0.2})
+    if with_d:
+        b_exchanges.insert(
+            1, {"amount": 4, "input": ("db", "D"), "type": "technosphere"}
+        )
+    if n2o:
+        b_exchanges.append({"amount": 1, "input": ("db", "N2O"), "type": "biosphere"})
+
+    data = {
+        ("db", "CO2"): {
+            "type": "emission",
+            "name": "carbon dioxide",
+        },
+        ("db", "CH4"): {
+            "type": "emission",
+            "name": "methane",
+        },
+        ("db", "A"): {
+            "name": "Functional Unit",
+            "exchanges": [
+                {
+                    "amount": 5,
+                    "input": ("db", "B"),
+                    "temporal_distribution": easy_timedelta_distribution(
+                        0, 4, resolution="Y", steps=5
+                    ),
+                    "type": "technosphere",
+                },
+            ],
+        },
+        ("db", "B"): {
+            "exchanges": b_exchanges,
+            "name": "B",
+        },
+        ("db", "C"): {
+            "exchanges": [
+                {
+                    "amount": 0.5,
+                    "input": ("db", "CH4"),
+                    "type": "biosphere",
+                },
+            ],
+            "name": "C",
+        },
+    }
+    if with_d:
+        data[("db", "D")] = {
+            "exchanges": [
+                {
+                    "amount": 2,
+                    "input": ("db", "CO2"),
+                    "type": "biosphere",
+                    "temporal_distribution": easy_timedelta_distribution(
+                        -8, -5, steps=4, resolution="Y"
+                    ),
+                },
+            ],
+            "name": "D",
+        }
+    if n2o:
+        data[("db", "N2O")] = {"type": "emission", "name": "nitrous oxide"}
+
+    db = bd.Database("db")
+    db.write(data)
+    cfs = [(("db", "CO2"), 1), (("db", "CH4"), 25)]
+    if n2o:
+        cfs.append((("db", "N2O"), 300))
+    bd.Method(("m",)).write(cfs)
+    return db
+
+
+@pytest.fixture
+@bw2test
+def basic_db(request):
+    """
+    Test database from `write_basic_db` in a temporary project.
+
+    Variants are selected with indirect parametrization, e.g.
+    `pytest.mark.parametrize("basic_db", [{"n2o": True}], indirect=True)`.
+    """
+    return write_basic_db(**getattr(request, "param", {}))
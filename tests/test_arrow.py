@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bw_temporalis import ParquetSink, read_timeline, write_timeline
+from bw_temporalis.temporal_distribution import TemporalDistribution
+from bw_temporalis.timeline import Timeline
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def timeline():
+    rng = np.random.default_rng(3)
+    tl = Timeline()
+    for flow, activity in [(1, 10), (2, 10), (1, 11), (3, 12)]:
+        tl.add_flow_temporal_distribution(
+            TemporalDistribution(
+                date=np.datetime64("2020-01-01", "s")
+                + rng.integers(0, 5 * 365 * 86400, size=20).astype("timedelta64[s]"),
+                amount=rng.random(20),
+            ),
+            flow,
+            activity,
+        )
+    return tl
+
+
+def select(df, start=None, end=None, flow=None, activity=None):
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None:
+        mask &= df["date"] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df["date"] < pd.Timestamp(end)
+    if flow is not None:
+        mask &= df["flow"].isin(flow)
+    if activity is not None:
+        mask &= df["activity"].isin(activity)
+    return df[mask].reset_index(drop=True)
+
+
+def sort(df):
+    return df.sort_values(by=["date", "flow", "activity"]).reset_index(drop=True)
+
+
+@pytest.mark.parametrize(
+    "filename, partition_by",
+    [
+        ("timeline.parquet", None),
+        ("timeline.arrow", None),
+        ("by_year", "year"),
+        ("by_flow", "flow"),
+    ],
+)
+def test_write_read_timeline(timeline, tmp_path, filename, partition_by):
+    write_timeline(
+        timeline, tmp_path / filename, partition_by=partition_by, batch_size=7
+    )
+    expected = timeline.build_dataframe()
+
+    pd.testing.assert_frame_equal(
+        sort(read_timeline(tmp_path / filename)), sort(expected)
+    )
+    for kwargs, query in [
+        (
+            {"date": ("2021-06-01", "2023-01-01")},
+            {"start": "2021-06-01", "end": "2023-01-01"},
+        ),
+        ({"date": (None, "2021-01-01")}, {"end": "2021-01-01"}),
+        ({"flow": [1]}, {"flow": [1]}),
+        (
+            {"flow": [1, 3], "activity": [11, 12]},
+            {"flow": [1, 3], "activity": [11, 12]},
+        ),
+    ]:
+        given = read_timeline(tmp_path / filename, **kwargs)
+        assert given["date"].is_monotonic_increasing
+        pd.testing.assert_frame_equal(sort(given), sort(select(expected, **query)))
+
+
+def test_write_timeline_errors(timeline, tmp_path):
+    with pytest.raises(ValueError):
+        write_timeline(timeline, tmp_path / "foo", partition_by="activity")
+
+
+def test_partitioned_rerun_replaces_dataset(timeline, tmp_path):
+    directory = tmp_path / "sink"
+    with ParquetSink(directory, batch_size=1, partition_by="flow") as sink:
+        for o in timeline.data:
+            sink.add_flow_temporal_distribution(o.distribution, o.flow, o.activity)
+    assert sink.num_flushes > 2
+
+    with pytest.raises(ValueError):
+        ParquetSink(directory, partition_by="flow")
+    first = timeline.data[0]
+    with ParquetSink(directory, partition_by="flow", overwrite=True) as sink:
+        sink.add_flow_temporal_distribution(
+            first.distribution, first.flow, first.activity
+        )
+    assert len(read_timeline(directory)) == len(first.distribution)
+
+    with pytest.raises(ValueError):
+        write_timeline(timeline, directory, partition_by="year")
+    write_timeline(timeline, directory, partition_by="year", overwrite=True)
+    pd.testing.assert_frame_equal(
+        sort(read_timeline(directory)), sort(timeline.build_dataframe())
+    )
+
+
+def test_parquet_sink_partitioned(timeline, tmp_path):
+    with ParquetSink(tmp_path / "sink", batch_size=30, partition_by="year") as sink:
+        for o in timeline.data:
+            sink.add_flow_temporal_distribution(o.distribution, o.flow, o.activity)
+    assert sink.num_flushes == 2
+    pd.testing.assert_frame_equal(
+        sort(read_timeline(tmp_path / "sink")), sort(timeline.build_dataframe())
+    )
+    assert len(read_timeline(tmp_path / "sink", date=("2022-01-01", "2023-01-01")))
+
+
+def test_read_partitioned_large_ids(tmp_path):
+    # Database ids in recent Brightway versions don't fit in 53 bits
+    flow = 370430935054684160
+    tl = Timeline()
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2020-01-01", "2021-01-01"], dtype="datetime64[s]"),
+            amount=np.array([1.0, 2.0]),
+        ),
+        flow,
+        flow + 1,
+    )
+    write_timeline(tl, tmp_path / "sink", partition_by="flow")
+    df = read_timeline(tmp_path / "sink", flow=[flow])
+    assert df["flow"].tolist() == [flow, flow]
+    assert df["activity"].tolist() == [flow + 1, flow + 1]
@@ -0,0 +1,277 @@
+from functools import partial
+
+import bw2data as bd
+import numpy as np
+import pandas as pd
+import pytest
+from bw2data.tests import bw2test
+
+from bw_temporalis.characterization import (
+    broadcast_multipliers,
+    characterize_binned,
+    convolve_kernel,
+    is_vectorized,
+    rowwise_adapter,
+    vectorized,
+)
+from bw_temporalis.lcia import (
+    characterize_co2_vectorized,
+    characterize_methane_vectorized,
+    radiative_forcing_kernel,
+)
+from bw_temporalis.sinks import characterization_kernel
+from bw_temporalis.temporal_distribution import TemporalDistribution
+from bw_temporalis.timeline import Timeline
+
+
+def rowwise_halving(series: pd.Series, period: int = 3) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "date": pd.Series(
+                data=series["date"].to_numpy()
+                + np.arange(period, dtype="timedelta64[Y]").astype("timedelta64[s]"),
+                dtype="datetime64[s]",
+            ),
+            "amount": series["amount"] * 0.5 ** np.arange(period),
+            "flow": series["flow"],
+            "activity": series["activity"],
+        }
+    )
+
+
+@vectorized
+def vectorized_halving(date, amount, flow, activity, period: int = 3):
+    return broadcast_multipliers(date, amount, flow, activity, 0.5 ** np.arange(period))
+
+
+@pytest.fixture
+def timeline():
+    tl = Timeline()
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2020-01-01", "2024-01-01"], dtype="datetime64[D]"),
+            amount=np.array([4.0, 8.0]),
+        ),
+        1,
+        10,
+    )
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2021-06-01"], dtype="datetime64[D]"),
+            amount=np.array([2.0]),
+        ),
+        2,
+        11,
+    )
+    tl.build_dataframe()
+    return tl
+
+
+def test_is_vectorized():
+    assert is_vectorized(vectorized_halving)
+    assert is_vectorized(partial(vectorized_halving, period=2))
+    assert is_vectorized(rowwise_adapter(rowwise_halving))
+    assert not is_vectorized(rowwise_halving)
+    assert not is_vectorized(partial(rowwise_halving, period=2))
+
+
+def test_broadcast_multipliers():
+    result = broadcast_multipliers(
+        np.array(["2020-01-01"], dtype="datetime64[s]"),
+        np.array([2.0]),
+        np.array([1]),
+        np.array([5]),
+        np.array([1.0, 0.5]),
+    )
+    assert result["amount"].tolist() == [2.0, 1.0]
+    assert result["flow"].tolist() == [1, 1]
+    assert result["activity"].tolist() == [5, 5]
+    assert result["date"][1] == np.datetime64("2020-01-01", "s") + np.timedelta64(
+        1, "Y"
+    ).astype("timedelta64[s]")
+
+
+@pytest.mark.parametrize("flow", [None, {1}])
+def test_characterize_dataframe_vectorized_matches_rowwise(timeline, flow):
+    expected = timeline.characterize_dataframe(
+        partial(rowwise_halving, period=4), flow=flow
+    )
+    given = timeline.characterize_dataframe(
+        partial(vectorized_halving, period=4), flow=flow
+    )
+    pd.testing.assert_frame_equal(
+        given.sort_values(["date", "flow"]).reset_index(drop=True)[
+            ["date", "amount", "flow", "activity"]
+        ],
+        expected.sort_values(["date", "flow"]).reset_index(drop=True)[
+            ["date", "amount", "flow", "activity"]
+        ],
+        check_dtype=False,
+    )
+    assert given["amount_sum"].iloc[-1] == pytest.approx(
+        expected["amount_sum"].iloc[-1]
+    )
+
+
+def test_characterize_dataframe_empty_selection(timeline):
+    df = timeline.characterize_dataframe(vectorized_halving, flow={99})
+    assert not len(df)
+
+
+def test_characterization_kernel_vectorized():
+    assert np.allclose(
+        characterization_kernel(vectorized_halving, 1),
+        characterization_kernel(rowwise_halving, 1),
+    )
+
+
+def test_convolve_kernel():
+    emissions = np.array([1.0, 0.0, 2.0])
+    kernel = np.array([0.5, 0.25])
+    assert np.allclose(
+        convolve_kernel(emissions, kernel), np.convolve(emissions, kernel)
+    )
+    assert np.array_equal(
+        convolve_kernel(emissions, kernel, method="direct"),
+        np.convolve(emissions, kernel),
+    )
+    assert len(convolve_kernel(np.zeros(0), kernel)) == 0
+
+
+def test_characterize_binned_matches_per_year(timeline):
+    kernels = {
+        1: radiative_forcing_kernel("co2", 30),
+        2: radiative_forcing_kernel("ch4", 30),
+    }
+    given = timeline.characterize_binned(kernels)
+    expected = pd.concat(
+        [
+            timeline.characterize_dataframe(
+                partial(function, period=30, per_year=True), flow={flow}, cumsum=False
+            )
+            for flow, function in [
+                (1, characterize_co2_vectorized),
+                (2, characterize_methane_vectorized),
+            ]
+        ]
+    )
+    expected = expected.groupby(["date", "flow"])["amount"].sum().reset_index()
+    merged = given.merge(expected, on=["date", "flow"], how="outer").fillna(0)
+    assert len(merged) == len(given)
+    assert np.allclose(merged["amount_x"], merged["amount_y"], rtol=1e-9, atol=1e-25)
+    assert given["amount_sum"].iloc[-1] == pytest.approx(given["amount"].sum())
+
+
+@pytest.mark.parametrize("method", ["fft", "direct"])
+def test_characterize_binned_vs_characterize_dataframe(method):
+    kernel = np.array([0.0, 1.0, 2.0, 2.0, 1.0])
+
+    @vectorized
+    def rowwise_kernel(date, amount, flow, activity):
+        return broadcast_multipliers(date, amount, flow, activity, kernel)
+
+    def compare(dates):
+        tl = Timeline()
+        tl.add_flow_temporal_distribution(
+            TemporalDistribution(
+                date=np.array(dates, dtype="datetime64[D]"),
+                amount=np.ones(len(dates)),
+            ),
+            1,
+            10,
+        )
+        tl.build_dataframe()
+        binned = tl.characterize_binned({1: kernel}, method=method)
+        rowwise = tl.characterize_dataframe(rowwise_kernel, cumsum=False)
+        rowwise = rowwise.groupby(rowwise["date"].dt.year)["amount"].sum()
+        binned = binned.set_index(binned["date"].dt.year)["amount"]
+        return binned, rowwise.reindex(binned.index, fill_value=0)
+
+    # Yearly steps from the middle of a year stay in consecutive calendar years
+    binned, rowwise = compare(["2020-07-01", "2030-07-01"])
+    assert binned.tolist() == pytest.approx(rowwise.tolist())
+    # Empty bins are exactly zero, without FFT round-off noise
+    assert binned.loc[2020] == 0 and binned.loc[2025:2030].eq(0).all()
+
+    # Steps of 365.2425 days from the start of a year can end in the previous year
+    binned, rowwise = compare(["2020-01-01"])
+    assert binned.to_dict() == {2020: 0, 2021: 1, 2022: 2, 2023: 2, 2024: 1}
+    assert rowwise.to_dict() != binned.to_dict()
+    assert binned.sum() == pytest.approx(rowwise.sum())
+
+
+def test_characterize_binned_resolution_and_missing_flows(timeline):
+    df = characterize_binned(
+        date=timeline.df["date"].to_numpy(),
+        amount=timeline.df["amount"].to_numpy(),
+        flow=timeline.df["flow"].to_numpy(),
+        kernels={2: np.array([1.0, 1.0]), 99: np.ones(3)},
+        resolution="M",
+    )
+    assert df["flow"].unique().tolist() == [2]
+    assert df["date"].tolist() == [
+        pd.Timestamp("2021-06-01"),
+        pd.Timestamp("2021-07-01"),
+    ]
+    assert df["amount"].tolist() == pytest.approx([2.0, 2.0])
+
+
+@bw2test
+def test_characterize_flows():
+    db = bd.Database("flows")
+    db.write(
+        {
+            ("flows", "CO2"): {"type": "emission", "temporalis code": "co2"},
+            ("flows", "CH4"): {"type": "emission", "temporalis code": "ch4"},
+            ("flows", "N2O"): {"type": "emission"},
+        }
+    )
+    co2, ch4, n2o = (bd.get_node(code=code).id for code in ("CO2", "CH4", "N2O"))
+
+    tl = Timeline()
+    for flow, dates, amounts in [
+        (co2, ["2020-01-01", "2022-01-01"], [1.0, 2.0]),
+        (ch4, ["2021-01-01"], [3.0]),
+        (n2o, ["2020-01-01"], [4.0]),
+        (co2, ["2021-01-01"], [5.0]),
+    ]:
+        tl.add_flow_temporal_distribution(
+            TemporalDistribution(
+                date=np.array(dates, dtype="datetime64[D]"),
+                amount=np.array(amounts),
+            ),
+            flow,
+            7,
+        )
+    tl.build_dataframe()
+
+    given = tl.characterize_flows(
+        {
+            "co2": partial(characterize_co2_vectorized, period=10),
+            "ch4": partial(rowwise_halving, period=3),
+            n2o: np.array([1.0, 2.0]),
+        }
+    )
+    expected = pd.concat(
+        [
+            tl.characterize_dataframe(
+                partial(characterize_co2_vectorized, period=10), flow={co2}
+            ),
+            tl.characterize_dataframe(partial(rowwise_halving, period=3), flow={ch4}),
+        ]
+    )
+    assert sorted(given["flow"].unique()) == sorted([co2, ch4, n2o])
+    assert given["date"].is_monotonic_increasing
+    for flow in (co2, ch4):
+        assert given.loc[given["flow"] == flow, "amount"].sum() == pytest.approx(
+            expected.loc[expected["flow"] == flow, "amount"].sum()
+        )
+    assert given.loc[given["flow"] == n2o, "amount"].tolist() == [4.0, 8.0]
+    assert given["amount_sum"].iloc[-1] == pytest.approx(given["amount"].sum())
+
+    # Flow id takes precedence over code
+    df = tl.characterize_flows({co2: np.ones(1), "co2": np.zeros(1)}, cumsum=False)
+    assert df["amount"].sum() == 8.0
+    assert "amount_sum" not in df
+
+    assert not len(tl.characterize_flows({"foo": np.ones(1)}))
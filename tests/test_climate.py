@@ -0,0 +1,89 @@
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bw_temporalis.lcia import (
+    characterize_co2,
+    characterize_co2_vectorized,
+    characterize_methane,
+    characterize_methane_vectorized,
+    radiative_forcing_kernel,
+)
+from bw_temporalis.temporal_distribution import TemporalDistribution
+from bw_temporalis.timeline import Timeline
+
+
+@pytest.fixture
+def timeline():
+    tl = Timeline()
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2020-01-01", "2022-03-01"], dtype="datetime64[D]"),
+            amount=np.array([4.0, 8.0]),
+        ),
+        1,
+        10,
+    )
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2021-01-01"], dtype="datetime64[D]"),
+            amount=np.array([2.0]),
+        ),
+        1,
+        11,
+    )
+    tl.build_dataframe()
+    return tl
+
+
+def test_radiative_forcing_kernel():
+    kernel = radiative_forcing_kernel("co2", 10, True)
+    assert kernel is radiative_forcing_kernel("co2", 10, True)
+    assert not kernel.flags.writeable
+    assert kernel[0] == 0
+    marginal = radiative_forcing_kernel("co2", 10, False)
+    assert np.allclose(np.cumsum(marginal), kernel)
+    with pytest.raises(ValueError):
+        radiative_forcing_kernel("n2o", 10)
+
+
+@pytest.mark.parametrize(
+    "rowwise, array",
+    [
+        (characterize_co2, characterize_co2_vectorized),
+        (characterize_methane, characterize_methane_vectorized),
+    ],
+)
+@pytest.mark.parametrize("cumulative", [False, True])
+def test_vectorized_climate_matches_rowwise(timeline, rowwise, array, cumulative):
+    columns = ["date", "amount", "flow", "activity"]
+    expected = timeline.characterize_dataframe(
+        partial(rowwise, period=20, cumulative=cumulative)
+    )
+    given = timeline.characterize_dataframe(
+        partial(array, period=20, cumulative=cumulative)
+    )
+    expected = expected.sort_values(["date", "activity"]).reset_index(drop=True)
+    given = given.sort_values(["date", "activity"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(
+        given[columns], expected[columns], check_dtype=False, rtol=1e-12
+    )
+
+
+def test_characterize_per_year(timeline):
+    df = timeline.characterize_dataframe(
+        partial(characterize_co2_vectorized, period=20, per_year=True), cumsum=False
+    )
+    rows = timeline.characterize_dataframe(
+        partial(characterize_co2_vectorized, period=20), cumsum=False
+    )
+    # Emissions from 2020 to 2022, characterized for 20 years
+    assert len(df) == 22
+    assert (df["activity"] == -1).all()
+    assert df["date"].iloc[0] == pd.Timestamp("2020-01-01")
+    assert df["amount"].sum() == pytest.approx(rows["amount"].sum())
+    assert df.loc[df["date"] == pd.Timestamp("2021-01-01"), "amount"].iloc[
+        0
+    ] == pytest.approx(4 * radiative_forcing_kernel("co2", 20)[1])
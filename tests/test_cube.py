@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from bw_temporalis import TimelineCube
+from bw_temporalis.temporal_distribution import TemporalDistribution
+from bw_temporalis.timeline import Timeline
+
+
+@pytest.fixture
+def timeline():
+    tl = Timeline()
+    for dates, amounts, flow, activity in [
+        (["2020-01-01", "2020-06-01", "2022-01-01"], [1.0, 2.0, 3.0], 1, 10),
+        (["2021-01-01"], [4.0], 2, 10),
+        (["2020-03-01", "2022-05-01"], [5.0, 6.0], 1, 11),
+    ]:
+        tl.add_flow_temporal_distribution(
+            TemporalDistribution(
+                date=np.array(dates, dtype="datetime64[D]"),
+                amount=np.array(amounts),
+            ),
+            flow,
+            activity,
+        )
+    tl.build_dataframe()
+    return tl
+
+
+def test_timeline_to_cube(timeline):
+    cube = timeline.to_cube()
+    assert cube.shape == (3, 2, 2)
+    assert cube.nnz == 5
+    assert cube.labels[0].astype("datetime64[Y]").astype(int).tolist() == [50, 51, 52]
+    assert cube.labels[1].tolist() == [1, 2]
+    assert cube.labels[2].tolist() == [10, 11]
+    assert cube.sum() == 21.0
+    by_flow_activity = cube.sum("date")
+    assert sparse.issparse(by_flow_activity)
+    assert by_flow_activity.nnz == 3
+    assert by_flow_activity.toarray().tolist() == [[6.0, 11.0], [4.0, 0.0]]
+    assert cube.sum(("flow", "activity")).tolist() == [8.0, 4.0, 9.0]
+    assert cube.sum([0, 1, 2]) == 21.0
+
+    dense = cube.to_dense()
+    assert np.allclose(dense.sum(axis=1), cube.sum(1).toarray())
+    assert np.allclose(dense.sum(axis=(0, 2)), cube.sum((0, 2)))
+    assert cube.matrix(0).toarray().tolist() == [[3.0, 5.0], [0.0, 0.0]]
+
+    pd.testing.assert_frame_equal(
+        cube.to_dataframe()[["date", "flow", "activity", "amount"]],
+        timeline.resample("Y")[["date", "flow", "activity", "amount"]],
+    )
+
+
+def test_cube_select(timeline):
+    cube = timeline.to_cube()
+    subset = cube.select(date=slice("2021-01-01", None), flow=[1])
+    assert subset.shape == cube.shape
+    assert subset.sum() == 9.0
+    assert subset.sum(("date", "flow")).tolist() == [3.0, 6.0]
+    assert cube.select(activity=[11]).sum("activity").toarray().tolist() == [
+        [5.0, 0.0],
+        [0.0, 0.0],
+        [6.0, 0.0],
+    ]
+
+
+def test_cube_from_dataframe_sums_duplicates():
+    df = pd.DataFrame(
+        {
+            "date": pd.Series(
+                np.array(["2020-01-01", "2020-01-01"], dtype="datetime64[s]")
+            ),
+            "flow": [1, 1],
+            "activity": [2, 2],
+            "amount": [1.0, 2.0],
+        }
+    )
+    cube = TimelineCube.from_dataframe(df)
+    assert cube.nnz == 1
+    assert cube.amount.tolist() == [3.0]
+    assert TimelineCube.from_dataframe(df.iloc[:0]).sum() == 0
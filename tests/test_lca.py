@@ -1,87 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
 import bw2data as bd
 import numpy as np
 import pandas as pd
 import pytest
 from bw2calc import LCA
+from bw2data.backends import sqlite3_lci_db
 from bw2data.tests import bw2test
 from bw_graph_tools.testing import flow_equal_dict, node_equal_dict
 
+import bw_temporalis.lca as bwt_lca
+from bw_temporalis import (
+    LookupCache,
+    MemorySink,
+)
 from bw_temporalis import TemporalDistribution as TD
-from bw_temporalis import TemporalisLCA, easy_timedelta_distribution
+from bw_temporalis import TemporalisLCA, build_timelines, easy_timedelta_distribution
 from bw_temporalis.lca import MultipleTechnosphereExchanges
-
-
-@pytest.fixture
-@bw2test
-def basic_db():
-    bd.projects.set_current("__test_fixture__")
-
-    db = bd.Database("db")
-    db.write(
-        {
-            ("db", "CO2"): {
-                "type": "emission",
-                "name": "carbon dioxide",
-            },
-            ("db", "CH4"): {
-                "type": "emission",
-                "name": "methane",
-            },
-            ("db", "A"): {
-                "name": "Functional Unit",
-                "exchanges": [
-                    {
-                        "amount": 5,
-                        "input": ("db", "B"),
-                        "temporal_distribution": easy_timedelta_distribution(
-                            0, 4, resolution="Y", steps=5
-                        ),
-                        "type": "technosphere",
-                    },
-                ],
-            },
-            ("db", "B"): {
-                "exchanges": [
-                    {"amount": 2, "input": ("db", "C"), "type": "technosphere"},
-                    {"amount": 4, "input": ("db", "D"), "type": "technosphere"},
-                    {
-                        "amount": 8,
-                        "input": ("db", "CO2"),
-                        "type": "biosphere",
-                        "temporal_distribution": easy_timedelta_distribution(
-                            10, 17, steps=4, resolution="Y"
-                        ),
-                    },
-                ],
-                "name": "B",
-            },
-            ("db", "C"): {
-                "exchanges": [
-                    {
-                        "amount": 0.5,
-                        "input": ("db", "CH4"),
-                        "type": "biosphere",
-                    },
-                ],
-                "name": "C",
-            },
-            ("db", "D"): {
-                "exchanges": [
-                    {
-                        "amount": 2,
-                        "input": ("db", "CO2"),
-                        "type": "biosphere",
-                        "temporal_distribution": easy_timedelta_distribution(
-                            -8, -5, steps=4, resolution="Y"
-                        ),
-                    },
-                ],
-                "name": "D",
-            },
-        }
-    )
-    bd.Method(("m",)).write([(("db", "CO2"), 1), (("db", "CH4"), 25)])
-    return db
+from bw_temporalis.timeline import Timeline
 
 
 def test_temporalis_lca(basic_db):
@@ -553,6 +490,7 @@ def test_lca_provide_static_activity_indices(basic_db):
     with pytest.raises(TypeError):
         TemporalisLCA(lca_object=lca, static_activity_indices=1001)
 
+
 def test_multiple_technosphere_exchanges_error(basic_db):
     EXPECTED = "Found 2 exchanges for link between (db|C|C) and (db|B|B)"
     # add a second exchange of C to activity B
@@ -570,4 +508,795 @@ def test_multiple_technosphere_exchanges_error(basic_db):
     dlca = TemporalisLCA(lca)
     with pytest.raises(MultipleTechnosphereExchanges) as exc:
         dlca.build_timeline()
-    assert str(exc.value) == EXPECTED
\ No newline at end of file
+    assert str(exc.value) == EXPECTED
+
+
+def _sorted_frame(timeline):
+    return (
+        timeline.build_dataframe()
+        .sort_values(by=["date", "flow", "activity"])
+        .reset_index(drop=True)
+    )
+
+
+def test_build_timeline_wavefront_scheduler(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    heap = tlca.build_timeline()
+    wavefront = tlca.build_timeline(scheduler="wavefront")
+
+    assert len(heap) == len(wavefront) == 3
+    pd.testing.assert_frame_equal(_sorted_frame(heap), _sorted_frame(wavefront))
+
+
+def test_propagate_level_batches_whole_level(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+
+    B = next(
+        node
+        for node in tlca.nodes.values()
+        if node.activity_datapackage_id == bd.get_node(code="B").id
+    )
+    level = [
+        (
+            TD(
+                date=np.array([0, 2], dtype="timedelta64[Y]"),
+                amount=np.array([1.0, 2.0]),
+            ),
+            B,
+        ),
+        (
+            TD(date=np.array([5], dtype="timedelta64[Y]"), amount=np.array([3.0])),
+            B,
+        ),
+    ]
+    given = tlca._propagate_level(list(level))
+    expected = [child for td, node in level for child in tlca._propagate(td, node)]
+
+    assert [node.unique_id for _, node in given] == [
+        node.unique_id for _, node in expected
+    ]
+    for (given_td, _), (expected_td, _) in zip(given, expected):
+        assert np.array_equal(given_td.date, expected_td.date)
+        assert np.allclose(given_td.amount, expected_td.amount)
+
+
+def test_build_timeline_unknown_scheduler(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    with pytest.raises(ValueError):
+        tlca.build_timeline(scheduler="foo")
+
+
+@pytest.mark.parametrize("memory_budget", [None, 1])
+@pytest.mark.parametrize("memory_overflow", ["spill", "simplify"])
+def test_build_timeline_depth_first_scheduler(basic_db, memory_budget, memory_overflow):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    heap = tlca.build_timeline()
+    depth_first = tlca.build_timeline(
+        scheduler="depth_first",
+        memory_budget=memory_budget,
+        memory_overflow=memory_overflow,
+    )
+
+    assert len(heap) == len(depth_first) == 3
+    pd.testing.assert_frame_equal(_sorted_frame(heap), _sorted_frame(depth_first))
+
+
+class ScaledTD(TD):
+    """Distribution with an extra constructor argument, which can't be stored"""
+
+    def __init__(self, date, amount, scale):
+        super().__init__(date=date, amount=amount * scale)
+        self.scale = scale
+
+
+def test_spill_stack_keeps_unstorable_distributions(tmp_path):
+    date = np.array(["2020-01-01", "2021-01-01"], dtype="datetime64[s]")
+    plain = TD(date=date, amount=np.array([1.0, 2.0]))
+    scaled = ScaledTD(date=date, amount=np.array([1.0, 2.0]), scale=3)
+    stack = [(plain, 1), (scaled, 2), (plain, 3), (plain, 4)]
+
+    live = sum(bwt_lca._td_nbytes(td) for td, _ in stack)
+    bwt_lca.TemporalisLCA._spill_stack(
+        stack, live=live, target=0, dirpath=tmp_path, counter=count()
+    )
+    # The top of the stack and the unstorable distribution stay in memory
+    assert isinstance(stack[0], bwt_lca.SpilledDistributions)
+    assert stack[1] == (scaled, 2)
+    assert isinstance(stack[2], bwt_lca.SpilledDistributions)
+    assert stack[3] == (plain, 4)
+
+    loaded = stack[0].load() + stack[2].load()
+    assert [node for _, node in loaded] == [1, 3]
+    for td, _ in loaded:
+        assert type(td) is TD
+        assert np.array_equal(td.date, date)
+        assert np.array_equal(td.amount, [1.0, 2.0])
+    assert not list(tmp_path.iterdir())
+
+
+def test_build_timeline_memory_budget_requires_depth_first(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    with pytest.raises(ValueError):
+        tlca.build_timeline(memory_budget=100)
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+@pytest.mark.parametrize("scheduler", ["heap", "depth_first"])
+def test_build_timeline_parallel(basic_db, executor, scheduler, monkeypatch):
+    # Stop expanding at two subtrees (C and D) so that both workers get work
+    monkeypatch.setattr(bwt_lca, "SUBTREES_PER_WORKER", 1)
+
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    serial = tlca.build_timeline()
+    serial_convolutions = tlca.convolution_count
+    partitions = tlca._partition_frontier(
+        tlca._functional_unit_frontier(),
+        num_partitions=2,
+        timeline=Timeline(),
+        node_timeline=False,
+    )
+    assert [len(partition) for partition in partitions] == [1, 1]
+
+    start = tlca.convolution_count
+    parallel = tlca.build_timeline(
+        max_workers=2, executor=executor, scheduler=scheduler
+    )
+
+    assert len(parallel) == 3
+    # Counters of process workers are merged back
+    assert tlca.convolution_count - start == serial_convolutions
+    pd.testing.assert_frame_equal(_sorted_frame(serial), _sorted_frame(parallel))
+
+
+def test_process_executor_unavailable(basic_db, monkeypatch):
+    monkeypatch.setattr(bwt_lca.sys, "platform", "linux")
+    assert bwt_lca._process_executor_unavailable(None) is None
+    assert bwt_lca._process_executor_unavailable(MemorySink())
+    # Forking isn't safe from a worker thread
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        assert pool.submit(bwt_lca._process_executor_unavailable, None).result()
+    with sqlite3_lci_db.atomic():
+        assert bwt_lca._process_executor_unavailable(None)
+    # System frameworks on macOS aren't safe to fork
+    monkeypatch.setattr(bwt_lca.sys, "platform", "darwin")
+    assert bwt_lca._process_executor_unavailable(None)
+
+
+def test_build_timeline_thread_fallback_warns(basic_db, monkeypatch):
+    monkeypatch.setattr(bwt_lca.sys, "platform", "darwin")
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    with pytest.warns(UserWarning, match="threads"):
+        tlca.build_timeline(max_workers=2)
+
+
+def test_build_timeline_process_in_transaction(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    with sqlite3_lci_db.atomic():
+        with pytest.raises(ValueError):
+            tlca.build_timeline(max_workers=2, executor="process")
+    # The connection is usable after the workers have exited
+    tlca.build_timeline(max_workers=2, executor="process")
+    assert not sqlite3_lci_db.db.is_closed()
+    assert bd.get_node(code="A")
+
+
+def _write_wide_db(num_producers: int = 8) -> None:
+    """Database `wide` whose functional unit `F` has `num_producers` independent suppliers,
+    so that parallel timeline construction gives each worker some subtrees"""
+    producers = [f"P{index}" for index in range(num_producers)]
+    data = {
+        ("wide", code): {
+            "name": code,
+            "exchanges": [
+                {
+                    "amount": index + 1,
+                    "input": ("db", "CO2"),
+                    "type": "biosphere",
+                    "temporal_distribution": easy_timedelta_distribution(
+                        0, 3, resolution="Y", steps=4
+                    ),
+                },
+            ],
+        }
+        for index, code in enumerate(producers)
+    }
+    data[("wide", "F")] = {
+        "name": "F",
+        "exchanges": [
+            {"amount": 1, "input": ("wide", code), "type": "technosphere"}
+            for code in producers
+        ],
+    }
+    bd.Database("wide").write(data)
+
+
+def test_build_timeline_parallel_concurrent_calls(basic_db):
+    _write_wide_db()
+    lca = LCA({("wide", "F"): 1}, ("m",))
+    lca.lci()
+    lca.lcia()
+    expected = _sorted_frame(
+        TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01").build_timeline()
+    )
+
+    def build():
+        tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+        return tlca.build_timeline(max_workers=2)
+
+    # Called from worker threads, so `build_timeline` can't fork
+    with pytest.warns(UserWarning, match="threads"):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(build) for _ in range(2)]
+            results = [future.result(timeout=120) for future in futures]
+    for timeline in results:
+        pd.testing.assert_frame_equal(_sorted_frame(timeline), expected)
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_jitter_independent_between_workers(basic_db, executor):
+    _write_wide_db()
+    lca = LCA({("wide", "F"): 1}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    tlca.resample(rng=np.random.default_rng(1), jitter=30 * 24 * 3600)
+    serial = tlca.build_timeline()
+    serial_shifts = dict(tlca.jitter_shifts)
+    # One shift per producer emission, and no two producers share a shift
+    assert len(serial_shifts) == 8
+    assert len(set(serial_shifts.values())) == 8
+
+    tlca.resample(rng=np.random.default_rng(1), jitter=30 * 24 * 3600)
+    parallel = tlca.build_timeline(max_workers=2, executor=executor)
+    assert tlca.jitter_shifts == serial_shifts
+    pd.testing.assert_frame_equal(_sorted_frame(serial), _sorted_frame(parallel))
+
+
+def test_build_timeline_budget_and_resume(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    full = tlca.build_timeline()
+    assert full.complete
+    assert full.unexplored_score == 0
+
+    # Processing A needs one convolution for the edge to B
+    partial = tlca.build_timeline(max_convolutions=1)
+    assert not partial.complete
+    assert not len(partial)
+    assert np.isclose(partial.unexplored_score, 410)
+    assert len(tlca.frontier) == 1
+
+    # B has one flow and two edges
+    partial = tlca.build_timeline(max_convolutions=3, resume=True)
+    assert not partial.complete
+    assert len(partial) == 1
+    assert np.isclose(partial.unexplored_score, 250 + 80)
+
+    resumed = tlca.build_timeline(resume=True)
+    assert resumed is partial
+    assert resumed.complete
+    assert resumed.unexplored_score == 0
+    assert tlca.frontier is None
+    pd.testing.assert_frame_equal(_sorted_frame(full), _sorted_frame(resumed))
+
+    with pytest.raises(ValueError):
+        tlca.build_timeline(resume=True)
+
+
+def test_build_timeline_heap_order(basic_db):
+    # `X` has the largest score, and its supplier `Xc` a larger score than `Y`
+    bd.Database("order").write(
+        {
+            ("order", "F"): {
+                "exchanges": [
+                    {"amount": 1, "input": ("order", "X"), "type": "technosphere"},
+                    {"amount": 1, "input": ("order", "Y"), "type": "technosphere"},
+                ],
+            },
+            ("order", "X"): {
+                "exchanges": [
+                    {"amount": 1, "input": ("order", "Xc"), "type": "technosphere"},
+                    {"amount": 1, "input": ("db", "CO2"), "type": "biosphere"},
+                ],
+            },
+            ("order", "Xc"): {
+                "exchanges": [
+                    {"amount": 10, "input": ("db", "CO2"), "type": "biosphere"}
+                ],
+            },
+            ("order", "Y"): {
+                "exchanges": [
+                    {"amount": 5, "input": ("db", "CO2"), "type": "biosphere"}
+                ],
+            },
+        }
+    )
+    lca = LCA({("order", "F"): 1}, ("m",))
+    lca.lci()
+    lca.lcia()
+    codes = {
+        bd.get_node(database="order", code=code).id: code for code in ("X", "Xc", "Y")
+    }
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    # By the cumulative score of the consumer
+    assert [codes[o.activity] for o in tlca.build_timeline().data] == ["X", "Y", "Xc"]
+    # Budgeted builds go by contribution
+    assert [codes[o.activity] for o in tlca.build_timeline(max_points=1000).data] == [
+        "X",
+        "Xc",
+        "Y",
+    ]
+
+
+def test_build_timeline_max_points(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    partial = tlca.build_timeline(max_points=1)
+    assert len(partial) == 1
+    assert not partial.complete
+
+    with pytest.raises(ValueError):
+        tlca.build_timeline(max_seconds=1, scheduler="wavefront")
+
+
+def test_build_timeline_checkpoint_resume(basic_db, tmp_path):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    full = tlca.build_timeline()
+
+    filepath = tmp_path / "checkpoint.npz"
+    partial = tlca.build_timeline(
+        max_convolutions=3, checkpoint=filepath, checkpoint_interval=0
+    )
+    assert not partial.complete
+    assert len(partial) == 1
+    assert filepath.exists()
+
+    restored = TemporalisLCA.from_checkpoint(filepath, lca)
+    assert restored.calculation_count == tlca.calculation_count
+    assert restored.nodes == tlca.nodes
+    assert restored.edges == tlca.edges
+    assert restored.flows == tlca.flows
+    assert len(restored.timeline) == 1
+    assert len(restored.frontier) == 2
+
+    resumed = TemporalisLCA.resume(filepath, lca)
+    assert resumed.complete
+    assert not filepath.exists()
+    pd.testing.assert_frame_equal(_sorted_frame(full), _sorted_frame(resumed))
+
+
+def test_traversal_cache(basic_db, tmp_path, capsys):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    first = TemporalisLCA(lca_object=lca, cache_traversal=True, cache_dir=tmp_path)
+    assert "Starting graph traversal" in capsys.readouterr().out
+    assert len(list(tmp_path.iterdir())) == 1
+
+    second = TemporalisLCA(lca_object=lca, cache_traversal=True, cache_dir=tmp_path)
+    assert "Using cached graph traversal" in capsys.readouterr().out
+    assert second.nodes == first.nodes
+    assert second.edges == first.edges
+    assert second.flows == first.flows
+    assert second.calculation_count == first.calculation_count
+    pd.testing.assert_frame_equal(
+        _sorted_frame(first.build_timeline()), _sorted_frame(second.build_timeline())
+    )
+
+    # Different settings are cached separately
+    TemporalisLCA(lca_object=lca, cutoff=0.1, cache_traversal=True, cache_dir=tmp_path)
+    assert "Starting graph traversal" in capsys.readouterr().out
+    assert len(list(tmp_path.iterdir())) == 2
+
+    # Changing the database invalidates and replaces the cache entry
+    bd.databases.set_modified("db")
+    TemporalisLCA(lca_object=lca, cache_traversal=True, cache_dir=tmp_path)
+    assert "Starting graph traversal" in capsys.readouterr().out
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_traversal_cache_without_method(basic_db, tmp_path, capsys):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    del lca.method
+    TemporalisLCA(lca_object=lca, cache_traversal=True, cache_dir=tmp_path)
+
+    # Another characterization matrix, also without a method, gets its own entry
+    other = LCA({("db", "A"): 2}, ("m",))
+    other.lci()
+    other.lcia()
+    del other.method
+    other.characterization_matrix = other.characterization_matrix * 2
+    TemporalisLCA(lca_object=other, cache_traversal=True, cache_dir=tmp_path)
+    assert len(list(tmp_path.iterdir())) == 2
+    capsys.readouterr()
+
+    TemporalisLCA(lca_object=lca, cache_traversal=True, cache_dir=tmp_path)
+    assert "Using cached graph traversal" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_build_timelines_batch(basic_db, max_workers):
+    demands = [{("db", "A"): 2}, {("db", "B"): 1}, {bd.get_node(code="C"): 4}]
+
+    expected = []
+    for demand in demands:
+        lca = LCA(demand, ("m",))
+        lca.lci()
+        lca.lcia()
+        expected.append(
+            TemporalisLCA(lca, starting_datetime="2023-01-01").build_timeline()
+        )
+
+    given = build_timelines(
+        demands,
+        ("m",),
+        max_workers=max_workers,
+        starting_datetime="2023-01-01",
+    )
+    assert len(given) == 3
+    for a, b in zip(expected, given):
+        pd.testing.assert_frame_equal(_sorted_frame(a), _sorted_frame(b))
+
+
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_build_timelines_independent_databases(basic_db, max_workers):
+    bd.Database("other").write(
+        {
+            ("other", "N2O"): {"type": "emission", "name": "nitrous oxide"},
+            ("other", "X"): {
+                "name": "X",
+                "exchanges": [
+                    {
+                        "amount": 3,
+                        "input": ("other", "N2O"),
+                        "type": "biosphere",
+                        "temporal_distribution": easy_timedelta_distribution(
+                            0, 2, resolution="Y", steps=3
+                        ),
+                    },
+                ],
+            },
+        }
+    )
+    bd.Method(("m", "both")).write(
+        [(("db", "CO2"), 1), (("db", "CH4"), 25), (("other", "N2O"), 300)]
+    )
+    demands = [{("db", "A"): 2}, {("other", "X"): 1}]
+
+    expected = []
+    for demand in demands:
+        lca = LCA(demand, ("m", "both"))
+        lca.lci()
+        lca.lcia()
+        expected.append(
+            TemporalisLCA(lca, starting_datetime="2023-01-01").build_timeline()
+        )
+
+    given = build_timelines(
+        demands,
+        ("m", "both"),
+        max_workers=max_workers,
+        starting_datetime="2023-01-01",
+    )
+    for a, b in zip(expected, given):
+        pd.testing.assert_frame_equal(_sorted_frame(a), _sorted_frame(b))
+
+
+def test_score_copied_from_lca(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci(factorize=True)
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    assert tlca.score == 410
+    threshold = tlca._propagation_threshold(0.1)
+
+    # The shared `LCA` object is recalculated for the next demand in `build_timelines`
+    lca.lcia(demand={bd.get_id(("db", "C")): 1})
+    assert tlca._propagation_threshold(0.1) == threshold == 41
+
+
+def test_lookup_cache_shared(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    cache = LookupCache()
+    first = TemporalisLCA(lca, lookup_cache=cache)
+    first.build_timeline()
+    assert cache.static_activity_indices[2] == set()
+    assert len(cache.exchanges) == 6
+
+    second = TemporalisLCA(lca, lookup_cache=cache)
+    assert second.lookup_cache is cache
+    second.build_timeline()
+    assert len(cache.exchanges) == 6
+
+
+def test_static_activity_ids_per_project(basic_db):
+    bd.databases["db"]["static"] = True
+    bd.databases.flush()
+    modified = bd.databases["db"]["modified"]
+    first = bwt_lca.static_activity_ids()
+
+    bd.projects.set_current("__test_other_project__")
+    # Same name and timestamp, but different nodes
+    bd.Database("db").write(
+        {("db", code): {"name": code} for code in ("P", "Q", "R", "S", "T", "U", "V")}
+    )
+    bd.databases["db"]["static"] = True
+    bd.databases["db"]["modified"] = modified
+    bd.databases.flush()
+
+    second = bwt_lca.static_activity_ids()
+    assert second.tolist() == sorted(x.id for x in bd.Database("db"))
+    assert second.tolist() != first.tolist()
+
+
+def test_static_activity_ids_cached(basic_db):
+    assert len(bwt_lca.static_activity_ids()) == 0
+
+    bd.databases["db"]["static"] = True
+    bd.databases.flush()
+    expected = sorted(x.id for x in basic_db)
+    ids = bwt_lca.static_activity_ids()
+    assert ids.tolist() == expected
+    assert bwt_lca.static_activity_ids() is ids
+
+    bd.databases.set_modified("db")
+    assert bwt_lca.static_activity_ids() is not ids
+    assert bwt_lca.static_activity_ids().tolist() == expected
+
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    cache = LookupCache()
+    tlca = TemporalisLCA(lca, lookup_cache=cache)
+    assert cache.static_activity_indices[2] == {
+        lca.dicts.activity[x] for x in expected if x in lca.dicts.activity
+    }
+    assert tlca.nodes.keys() == {-1, 0}
+
+
+@pytest.mark.parametrize("scheduler", ["heap", "wavefront", "depth_first"])
+def test_build_timeline_propagation_cutoff(basic_db, scheduler):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    d = bd.get_node(code="D").id
+
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    full = tlca.build_timeline(scheduler=scheduler)
+    assert not full.remainder
+    assert d in {o.activity for o in full.data}
+
+    # The supply chain of D has a score of 80 out of 410
+    timeline = tlca.build_timeline(scheduler=scheduler, propagation_cutoff=0.25)
+    assert d not in {o.activity for o in timeline.data}
+    assert len(timeline.remainder) == 1
+    assert timeline.remainder[0].activity == d
+    assert timeline.remainder_score == pytest.approx(80)
+    # At the time of the consumer B
+    expected = tlca.t0 * easy_timedelta_distribution(0, 4, resolution="Y", steps=5)
+    assert np.array_equal(timeline.remainder[0].distribution.date, expected.date)
+
+
+def test_static_remainder_zero_total(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    producer = next(iter(tlca.nodes.values()))
+
+    td = TD(
+        date=np.array(["2024-01-01", "2021-01-01"], dtype="datetime64[s]"),
+        amount=np.array([1.0, -1.0]),
+    )
+    timeline = Timeline()
+    tlca._add_static_remainder(td, 2.5, producer, timeline)
+    assert timeline.remainder_score == pytest.approx(2.5)
+    assert timeline.remainder[0].activity == producer.activity_datapackage_id
+    assert timeline.remainder[0].distribution.date.tolist() == [
+        np.datetime64("2021-01-01", "s").item()
+    ]
+
+
+@pytest.mark.parametrize("scheduler", ["heap", "wavefront", "depth_first"])
+def test_end_datetime_horizon(basic_db, scheduler):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    cfs = {bd.get_node(code="CO2").id: 1, bd.get_node(code="CH4").id: 25}
+    c = bd.get_node(code="C").id
+
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01", end_datetime="2020-01-01")
+    timeline = tlca.build_timeline(scheduler=scheduler)
+    df = timeline.build_dataframe()
+    assert (df["date"] <= pd.Timestamp("2020-01-01")).all()
+    # C only emits from 2023 onwards, so it isn't expanded
+    assert c not in set(df["activity"])
+    score = float((df["amount"] * df["flow"].map(cfs)).sum())
+    assert score + timeline.outside_horizon_score == pytest.approx(410)
+    assert timeline.outside_horizon_score > 250
+
+    # Earliest emission in the supply chain of B is from D, eight years earlier
+    b = [
+        n
+        for n in tlca.nodes.values()
+        if n.activity_datapackage_id == bd.get_node(code="B").id
+    ][0]
+    expected = easy_timedelta_distribution(-8, -5, steps=4, resolution="Y").date.min()
+    assert tlca.subtree_offsets[b.unique_id] == expected.astype(np.int64)
+
+
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_build_timeline_aggregate(basic_db, max_workers):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    df = tlca.build_timeline().build_dataframe()
+    expected = df.groupby(["date", "flow"])["amount"].sum()
+
+    timeline = tlca.build_timeline(aggregate="flow", max_workers=max_workers)
+    assert len(timeline.data) == 2
+    assert {o.activity for o in timeline.data} == {-1}
+    given = timeline.build_dataframe().set_index(["date", "flow"])["amount"]
+    pd.testing.assert_series_equal(given.sort_index(), expected.sort_index())
+
+
+def test_node_flow_counts(basic_db, monkeypatch):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+
+    expected = {}
+    for node in tlca.nodes.values():
+        num_flows, num_flows_td = 0, 0
+        for flow in tlca.flow_mapping.get(node.unique_id, []):
+            for exchange in tlca.get_biosphere_exchanges(
+                flow.flow_datapackage_id, node.activity_datapackage_id
+            ):
+                num_flows += 1
+                num_flows_td += bool(exchange.data.get("temporal_distribution"))
+        expected[node.unique_id] = [num_flows, num_flows_td]
+
+    counts = tlca._node_flow_counts()
+    assert {uid: counts[uid].tolist() for uid in expected if uid >= 0} == {
+        uid: value for uid, value in expected.items() if uid >= 0
+    }
+    assert counts.sum(axis=0).tolist() == [3, 2]
+
+    # No database access while building the node timeline
+    monkeypatch.setattr(
+        tlca, "get_biosphere_exchanges", lambda *args: pytest.fail("database access")
+    )
+    with pytest.warns(UserWarning):
+        timeline = tlca.build_timeline(node_timeline=True)
+    assert {(o.num_flows, o.num_flows_td) for o in timeline.data} == {
+        (0, 0),
+        (1, 0),
+        (1, 1),
+    }
+
+
+def test_resume_with_node_timeline_argument(basic_db, tmp_path):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    full = tlca.build_timeline()
+
+    filepath = tmp_path / "checkpoint.npz"
+    tlca.build_timeline(max_convolutions=3, checkpoint=filepath, checkpoint_interval=0)
+
+    with pytest.raises(ValueError):
+        TemporalisLCA.resume(filepath, lca, node_timeline=True)
+    resumed = TemporalisLCA.resume(filepath, lca, node_timeline=False)
+    pd.testing.assert_frame_equal(_sorted_frame(full), _sorted_frame(resumed))
+
+
+def test_resume_rejects_sink_and_aggregate(basic_db, tmp_path):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    full = tlca.build_timeline(aggregate="flow")
+
+    filepath = tmp_path / "checkpoint.npz"
+    tlca.build_timeline(
+        max_convolutions=3,
+        checkpoint=filepath,
+        checkpoint_interval=0,
+        aggregate="flow",
+    )
+
+    with pytest.raises(ValueError, match="when resuming"):
+        TemporalisLCA.resume(filepath, lca, aggregate="activity")
+    with pytest.raises(ValueError, match="when resuming"):
+        TemporalisLCA.resume(filepath, lca, checkpoint=None, sink=MemorySink())
+    with pytest.raises(ValueError, match="when resuming"):
+        tlca.build_timeline(resume=True, aggregate="flow")
+    assert filepath.exists()
+
+    lookup_cache = LookupCache()
+    restored = TemporalisLCA.from_checkpoint(filepath, lca, lookup_cache=lookup_cache)
+    assert restored.lookup_cache is lookup_cache
+    resumed = TemporalisLCA.resume(filepath, lca, lookup_cache=lookup_cache)
+    assert resumed.complete
+    assert lookup_cache.exchanges
+    pd.testing.assert_frame_equal(_sorted_frame(full), _sorted_frame(resumed))
+
+
+def test_checkpoint_rejects_unstorable_distributions(basic_db, tmp_path, monkeypatch):
+    class CustomTD(TD):
+        pass
+
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+
+    tlca = TemporalisLCA(lca_object=lca, starting_datetime="2023-01-01")
+    edge_values = tlca._edge_values
+
+    def custom_edge_values(node):
+        for value, producer in edge_values(node):
+            if isinstance(value, TD):
+                value = CustomTD(date=value.date, amount=value.amount)
+            yield value, producer
+
+    monkeypatch.setattr(tlca, "_edge_values", custom_edge_values)
+    filepath = tmp_path / "checkpoint.npz"
+    with pytest.raises(ValueError, match="Can't checkpoint"):
+        tlca.build_timeline(
+            max_convolutions=3, checkpoint=filepath, checkpoint_interval=0
+        )
+    assert tlca.convolution_count == 0
+    assert not filepath.exists()
@@ -0,0 +1,130 @@
+from functools import partial
+
+import bw2data as bd
+import numpy as np
+import pytest
+from bw2calc import LCA
+
+from bw_temporalis import (
+    TemporalisLCA,
+    monte_carlo_timeline,
+)
+from bw_temporalis.lcia import characterize_co2, characterize_methane
+
+# `basic_db` without `D`, and with an uncertain edge from `C` to `B`
+UNCERTAIN_DB = pytest.mark.parametrize(
+    "basic_db", [{"with_d": False, "uncertain": True}], indirect=True
+)
+
+
+@UNCERTAIN_DB
+def test_resample_keeps_traversal(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",), use_distributions=True, seed_override=42)
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    nodes = tlca.nodes
+    ch4 = bd.get_node(code="CH4").id
+
+    totals = set()
+    for _ in range(5):
+        tlca.resample()
+        assert tlca.nodes is nodes
+        timeline = tlca.build_timeline()
+        totals.add(
+            round(sum(o.distribution.total for o in timeline.data if o.flow == ch4), 6)
+        )
+    assert len(totals) == 5
+
+
+@UNCERTAIN_DB
+def test_resample_jitter(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    expected = tlca.build_timeline().build_dataframe()
+
+    tlca.resample(rng=np.random.default_rng(1), jitter=30 * 24 * 3600)
+    given = tlca.build_timeline().build_dataframe()
+    # Amounts are unchanged without uncertainty, only dates shift
+    assert given["amount"].sum() == pytest.approx(expected["amount"].sum())
+    assert not given["date"].equals(expected["date"])
+
+
+@UNCERTAIN_DB
+def test_monte_carlo_timeline(basic_db):
+    co2, ch4 = bd.get_node(code="CO2").id, bd.get_node(code="CH4").id
+    functions = {
+        co2: partial(characterize_co2, period=20),
+        ch4: partial(characterize_methane, period=20),
+    }
+    calls = []
+
+    def counted(function):
+        return lambda series: calls.append(series) or function(series)
+
+    lca = LCA({("db", "A"): 2}, ("m",), use_distributions=True, seed_override=42)
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+
+    df = monte_carlo_timeline(
+        tlca, {flow: counted(f) for flow, f in functions.items()}, iterations=3
+    )
+    # Kernels are calculated once, not per iteration
+    assert len(calls) == 2
+
+    df = monte_carlo_timeline(
+        tlca, functions, iterations=50, quantiles=(0.05, 0.5, 0.95), seed=1
+    )
+    assert list(df.columns) == ["date", "flow", "mean", "q0.05", "q0.5", "q0.95"]
+    assert set(df["flow"]) == {co2, ch4, -1}
+    assert (df["q0.05"] <= df["q0.5"]).all()
+    assert (df["q0.5"] <= df["q0.95"]).all()
+    # Only the methane supply chain is uncertain
+    methane = df[df["flow"] == ch4]
+    assert (methane["q0.95"] - methane["q0.05"]).max() > 0
+    carbon = df[df["flow"] == co2]
+    assert np.allclose(carbon["q0.95"], carbon["q0.05"])
+
+    total = df[df["flow"] == -1].set_index("date")["mean"]
+    by_flow = df[df["flow"] != -1].groupby("date")["mean"].sum()
+    assert np.allclose(total.sort_index(), by_flow.sort_index())
+
+    # Inventory amounts of different flows aren't added up
+    df = monte_carlo_timeline(tlca, functions, iterations=5, seed=1, characterize=False)
+    assert set(df["flow"]) == {co2, ch4}
+
+
+@UNCERTAIN_DB
+def test_resample_updates_scores(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",), use_distributions=True, seed_override=42)
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    first = {node.unique_id: node.cumulative_score for node in tlca.nodes.values()}
+    tlca.resample()
+    assert any(
+        node.cumulative_score != pytest.approx(first[node.unique_id])
+        for node in tlca.nodes.values()
+    )
+
+    # A new traversal of the same sample
+    expected = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    given = sorted(tlca.nodes.values(), key=lambda node: node.unique_id)
+    for node, other in zip(
+        given, sorted(expected.nodes.values(), key=lambda node: node.unique_id)
+    ):
+        assert node.activity_index == other.activity_index
+        for attribute in (
+            "supply_amount",
+            "cumulative_score",
+            "direct_emissions_score",
+            "remaining_cumulative_score_outside_specific_flows",
+        ):
+            assert getattr(node, attribute) == pytest.approx(getattr(other, attribute))
+    for edge, other in zip(tlca.edges, expected.edges):
+        assert edge.amount == pytest.approx(other.amount)
+    for flow, other in zip(tlca.flows, expected.flows):
+        assert flow.score == pytest.approx(other.score)
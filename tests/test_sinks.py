@@ -0,0 +1,228 @@
+from functools import partial
+
+import bw2data as bd
+import numpy as np
+import pandas as pd
+import pytest
+from bw2calc import LCA
+
+from bw_temporalis import (
+    CharacterizedAccumulator,
+    MemorySink,
+    ParquetSink,
+)
+from bw_temporalis import TemporalDistribution as TD
+from bw_temporalis import TemporalisLCA, TimelineSink, read_timeline
+from bw_temporalis.characterization import characterize_binned
+from bw_temporalis.lcia import characterize_co2, characterize_methane
+from bw_temporalis.sinks import characterization_kernel
+from bw_temporalis.timeline import Timeline
+
+# `basic_db` without `D`, and with a `N2O` emission
+SINK_DB = pytest.mark.parametrize(
+    "basic_db", [{"with_d": False, "n2o": True}], indirect=True
+)
+
+
+def test_characterization_kernel():
+    kernel = characterization_kernel(partial(characterize_co2, period=20), 1)
+    assert kernel.shape == (20,)
+    assert kernel[0] == 0
+    assert (kernel[1:] > 0).all()
+
+
+def test_timeline_sink_base_class():
+    with pytest.raises(NotImplementedError):
+        TimelineSink().spawn()
+
+
+@pytest.mark.parametrize("max_workers", [None, 2])
+@SINK_DB
+def test_characterized_accumulator(basic_db, max_workers):
+    co2, ch4 = bd.get_node(code="CO2").id, bd.get_node(code="CH4").id
+    functions = {
+        co2: partial(characterize_co2, period=30),
+        ch4: partial(characterize_methane, period=30),
+    }
+
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+
+    timeline = tlca.build_timeline()
+    timeline.build_dataframe()
+    expected = pd.concat(
+        [
+            timeline.characterize_dataframe(function, flow={flow}, cumsum=False)
+            for flow, function in functions.items()
+        ]
+    )
+    expected_years = expected.groupby(expected["date"].dt.year)["amount"].sum()
+
+    sink = CharacterizedAccumulator(functions)
+    result = tlca.build_timeline(sink=sink, max_workers=max_workers)
+    assert not result.data
+    assert sink.uncharacterized_amounts == {
+        bd.get_node(code="N2O").id: pytest.approx(10)
+    }
+    assert sink.first_year == 2023
+    # Inventory per flow is unchanged by binning
+    assert sink.emissions[sink.flows.index(co2)].sum() == pytest.approx(80)
+    assert sink.emissions[sink.flows.index(ch4)].sum() == pytest.approx(10)
+
+    df = sink.dataframe()
+    assert df["amount_sum"].iloc[-1] == pytest.approx(expected["amount"].sum())
+    for flow in functions:
+        assert df.loc[df["flow"] == flow, "amount"].sum() == pytest.approx(
+            expected.loc[expected["flow"] == flow, "amount"].sum()
+        )
+    # Row-wise characterization steps by 365.2425 days, so single years can
+    # shift, but running totals agree to within one year
+    given_years = df.groupby(df["date"].dt.year)["amount"].sum()
+    years = sorted(set(given_years.index) | set(expected_years.index))
+    given_cumsum = given_years.reindex(years, fill_value=0).cumsum().to_numpy()
+    expected_cumsum = expected_years.reindex(years, fill_value=0).cumsum().to_numpy()
+    assert np.all(given_cumsum[:-1] <= expected_cumsum[1:] * (1 + 1e-9))
+    assert np.all(expected_cumsum[:-1] <= given_cumsum[1:] * (1 + 1e-9))
+
+
+def test_characterized_accumulator_calendar_bins():
+    characterize = partial(characterize_co2, period=5)
+    td = TD(
+        date=np.array(["2020-01-01"], dtype="datetime64[D]"), amount=np.array([2.0])
+    )
+    sink = CharacterizedAccumulator({1: characterize})
+    sink.add_flow_temporal_distribution(td, 1, 3)
+    df = sink.dataframe(cumsum=False)
+
+    timeline = Timeline()
+    timeline.add_flow_temporal_distribution(td, 1, 3)
+    timeline.build_dataframe()
+    columns = timeline.columns
+    binned = characterize_binned(
+        columns["date"],
+        columns["amount"],
+        columns["flow"],
+        {1: characterization_kernel(characterize, 1)},
+    )
+    pd.testing.assert_frame_equal(df, binned)
+
+    rowwise = timeline.characterize_dataframe(characterize, cumsum=False)
+    # The first year of forcing is 2020-12-31 row-wise, but the 2021 bin here
+    assert rowwise["date"].dt.year.tolist() == [2020, 2020, 2021, 2022, 2023]
+    assert df["date"].dt.year.tolist() == [2020, 2021, 2022, 2023, 2024]
+    assert df["amount"].to_numpy()[1:] == pytest.approx(
+        rowwise["amount"].to_numpy()[1:]
+    )
+    assert df["amount"].sum() == pytest.approx(rowwise["amount"].sum())
+
+
+@SINK_DB
+def test_sink_not_compatible_with_node_timeline(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    with pytest.raises(ValueError):
+        tlca.build_timeline(sink=CharacterizedAccumulator({}), node_timeline=True)
+
+
+def _records(timeline):
+    return sorted(
+        (
+            o.flow,
+            o.activity,
+            o.distribution.date.tolist(),
+            o.distribution.amount.tolist(),
+        )
+        for o in timeline.data
+    )
+
+
+@pytest.mark.parametrize("scheduler", ["heap", "depth_first"])
+@SINK_DB
+def test_iter_timeline(basic_db, scheduler):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    expected = _records(tlca.build_timeline())
+
+    records = tlca.iter_timeline(scheduler=scheduler)
+    flow, activity, td = next(records)
+    assert isinstance(flow, int) and isinstance(activity, int)
+    given = [(flow, activity, td)] + list(records)
+    assert (
+        sorted((f, a, td.date.tolist(), td.amount.tolist()) for f, a, td in given)
+        == expected
+    )
+
+
+@SINK_DB
+def test_memory_sink(basic_db):
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    expected = _records(tlca.build_timeline())
+
+    sink = MemorySink()
+    assert not tlca.build_timeline(sink=sink, max_workers=2).data
+    assert (
+        sorted(
+            (f, a, td.date.tolist(), td.amount.tolist()) for f, a, td in sink.records
+        )
+        == expected
+    )
+
+
+@SINK_DB
+def test_parquet_sink(basic_db, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    timeline = tlca.build_timeline()
+    expected = timeline.build_dataframe()
+
+    with ParquetSink(tmp_path / "timeline.parquet", batch_size=5) as sink:
+        tlca.build_timeline(sink=sink)
+    given = pq.read_table(tmp_path / "timeline.parquet").to_pandas()
+    given["date"] = given["date"].astype("datetime64[s]")
+    given = given.sort_values(by=["date", "flow", "activity"]).reset_index(drop=True)
+    expected = expected.sort_values(by=["date", "flow", "activity"]).reset_index(
+        drop=True
+    )
+    pd.testing.assert_frame_equal(given, expected)
+
+
+@pytest.mark.parametrize("partition_by", [None, "flow"])
+@SINK_DB
+def test_parquet_sink_parallel(basic_db, tmp_path, partition_by):
+    pytest.importorskip("pyarrow")
+
+    lca = LCA({("db", "A"): 2}, ("m",))
+    lca.lci()
+    lca.lcia()
+    tlca = TemporalisLCA(lca, starting_datetime="2023-01-01")
+    expected = tlca.build_timeline().build_dataframe()
+
+    filepath = tmp_path / ("sink" if partition_by else "timeline.parquet")
+    with ParquetSink(filepath, batch_size=2, partition_by=partition_by) as sink:
+        with pytest.warns(UserWarning, match="threads"):
+            tlca.build_timeline(sink=sink, max_workers=2)
+    assert sink.num_rows == len(expected)
+    # Part files of the workers were merged
+    assert sorted(path.name for path in tmp_path.iterdir()) == [filepath.name]
+
+    def sort(df):
+        return df.sort_values(by=["date", "flow", "activity"]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(sort(read_timeline(filepath)), sort(expected))
+
+    with ParquetSink(tmp_path / "other.parquet") as sink:
+        with pytest.raises(ValueError):
+            tlca.build_timeline(sink=sink, max_workers=2, executor="process")
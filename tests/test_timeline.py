@@ -1,3 +1,5 @@
+from collections.abc import MutableSequence
+
 import bw2data as bd
 import numpy as np
 import pandas as pd
@@ -5,9 +7,10 @@ import pytest
 from bw2calc import LCA
 from bw2data.tests import bw2test
 
-from bw_temporalis import TemporalisLCA, easy_timedelta_distribution
+import bw_temporalis.timeline as bwt_timeline
+from bw_temporalis import TemporalisLCA, easy_timedelta_distribution, storage
 from bw_temporalis.temporal_distribution import TemporalDistribution
-from bw_temporalis.timeline import EmptyTimeline, Timeline
+from bw_temporalis.timeline import EmptyTimeline, FlowTD, NodeTD, Timeline
 
 
 def test_empty_timeline_build_dataframe_missing():
@@ -137,8 +140,12 @@ def test_characterization():
     pass
 
 
+@pytest.mark.parametrize(
+    "database_labels, categorical",
+    [(["db"], False), (["db"], True), (None, False), (None, True)],
+)
 @bw2test
-def test_add_metadata_to_dataframe():
+def test_add_metadata_to_dataframe(database_labels, categorical):
     bd.projects.set_current("__test_fixture__")
 
     db = bd.Database("db")
@@ -228,9 +235,14 @@ def test_add_metadata_to_dataframe():
     tl = tlca.build_timeline()
     tl.build_dataframe()
     df = tl.add_metadata_to_dataframe(
-        database_labels=["db"],
+        database_labels=database_labels,
         fields=["name", "unit", "weird", "categories"],
+        categorical=categorical,
     )
+    if categorical:
+        assert isinstance(df["flow_name"].dtype, pd.CategoricalDtype)
+    if database_labels is None:
+        assert set(tl.metadata_cache) == set(df.flow) | set(df.activity)
 
     co2 = bd.get_node(code="CO2").id
     ch4 = bd.get_node(code="CH4").id
@@ -257,3 +269,373 @@ def test_add_metadata_to_dataframe():
     assert df[df.activity == B].activity_unit.unique() == "Pfenning"
     assert np.isnan(df[df.activity == B].activity_categories.unique()[0])
     assert np.isnan(df[df.activity == B].activity_weird.unique()[0])
+
+
+@pytest.mark.parametrize(
+    "aggregate,keys",
+    [
+        ("flow", {(1, -1), (3, -1)}),
+        ("activity", {(-1, 2), (-1, 4)}),
+        ("flow+activity", {(1, 2), (1, 4), (3, 4)}),
+    ],
+)
+def test_timeline_aggregate(monkeypatch, aggregate, keys):
+    monkeypatch.setattr(bwt_timeline, "CONSOLIDATE_THRESHOLD", 2)
+
+    def td(days, amounts):
+        return TemporalDistribution(
+            date=np.array(days, dtype="datetime64[D]"), amount=np.array(amounts)
+        )
+
+    elements = [
+        (td(["2020-01-01", "2020-01-02"], [1.0, 2.0]), 1, 2),
+        (td(["2020-01-02", "2020-01-03"], [3.0, 4.0]), 1, 4),
+        (td(["2020-01-01"], [5.0]), 3, 4),
+        (td(["2020-01-03", "2020-01-04"], [6.0, 0.0]), 1, 2),
+    ]
+    expected = Timeline()
+    tl = Timeline(aggregate=aggregate)
+    for args in elements:
+        expected.add_flow_temporal_distribution(*args)
+        tl.add_flow_temporal_distribution(*args)
+
+    assert {(o.flow, o.activity) for o in tl.data} == keys
+    assert tl.points_added == 7
+    for o in tl.data:
+        assert len(np.unique(o.distribution.date)) == len(o.distribution)
+
+    columns = {"flow": ["flow"], "activity": ["activity"]}.get(
+        aggregate, ["flow", "activity"]
+    )
+    given = tl.build_dataframe().groupby(["date"] + columns)["amount"].sum()
+    df = expected.build_dataframe()
+    pd.testing.assert_series_equal(
+        given, df.groupby(["date"] + columns)["amount"].sum()
+    )
+
+
+def test_timeline_aggregate_errors():
+    with pytest.raises(ValueError):
+        Timeline(aggregate="foo")
+    with pytest.raises(ValueError):
+        Timeline(aggregate="flow").data = []
+
+
+def test_growable_array():
+    array = bwt_timeline.GrowableArray(np.int64, capacity=2)
+    array.extend(np.array([1, 2, 3]))
+    array.fill(4, 2)
+    array.append(5)
+    assert len(array) == 6
+    assert np.array_equal(array.view(), [1, 2, 3, 4, 4, 5])
+    assert np.shares_memory(array.view(), array.array)
+
+
+def test_timeline_columns():
+    first = TemporalDistribution(
+        date=np.array(["2020-01-01", "2021-01-01"], dtype="datetime64[D]"),
+        amount=np.array([1.0, 2.0]),
+    )
+    second = TemporalDistribution(
+        date=np.array(["2019-01-01"], dtype="datetime64[D]"), amount=np.array([3.0])
+    )
+    tl = Timeline()
+    tl.add_flow_temporal_distribution(first, 7, 11)
+    tl.add_node_temporal_distribution(second, 4, 2, 1)
+
+    columns = tl.columns
+    assert np.array_equal(columns["offsets"], [0, 2, 3])
+    assert np.array_equal(columns["flow"], [7, 7, -1])
+    assert np.array_equal(columns["activity"], [11, 11, 4])
+    assert np.array_equal(columns["num_flows"], [-1, 2])
+    assert columns["date"].dtype == np.dtype("datetime64[s]")
+    assert len(tl) == 2
+
+    data = tl.data
+    assert data[0].flow == 7 and data[0].activity == 11
+    assert np.array_equal(data[0].distribution.amount, [1.0, 2.0])
+    assert data[1].num_flows == 2 and data[1].num_flows_td == 1
+
+    copied = Timeline(data)
+    for key, value in copied.columns.items():
+        assert np.array_equal(value, columns[key])
+
+    df = tl.build_dataframe()
+    assert df["amount"].tolist() == [3.0, 1.0, 2.0]
+    assert df["flow"].tolist() == [-1, 7, 7]
+
+    tl.extend(copied)
+    assert len(tl) == 4
+    assert np.array_equal(tl.columns["offsets"], [0, 2, 3, 5, 6])
+    assert tl.data[3].num_flows == 2
+
+
+def test_timeline_data_view():
+    tl = Timeline()
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2020-01-01", "2021-01-01"], dtype="datetime64[D]"),
+            amount=np.array([1.0, 2.0]),
+        ),
+        7,
+        11,
+    )
+    data = tl.data
+    assert isinstance(data, MutableSequence)
+    first = data[0]
+    assert np.shares_memory(first.distribution.amount, tl.columns["amount"])
+    with pytest.raises(ValueError):
+        first.distribution.amount[0] = 5
+    first.flow = 99
+    assert tl.columns["flow"].tolist() == [7, 7]
+
+    td = TemporalDistribution(
+        date=np.array(["2019-01-01"], dtype="datetime64[D]"), amount=np.array([3.0])
+    )
+    data.append(FlowTD(distribution=td, flow=1, activity=2))
+    assert len(data) == len(tl) == 2
+    assert tl.columns["offsets"].tolist() == [0, 2, 3]
+
+    data[-1] = NodeTD(distribution=td, flow=-1, activity=3, num_flows=2, num_flows_td=1)
+    assert tl.columns["element_activity"].tolist() == [11, 3]
+    assert tl.columns["num_flows"].tolist() == [-1, 2]
+    assert tl.build_dataframe()["activity"].tolist() == [3, 11, 11]
+
+    del data[0]
+    assert len(data) == 1
+    assert isinstance(data[0], NodeTD)
+    assert tl.columns["element_activity"].tolist() == [3]
+    assert tl.build_dataframe()["activity"].tolist() == [3]
+    # Elements built earlier keep their values
+    assert first.distribution.amount.tolist() == [1.0, 2.0]
+    with pytest.raises(IndexError):
+        data[1]
+
+
+def test_timeline_data_indexing_builds_one_element(monkeypatch):
+    tl = Timeline()
+    td = TemporalDistribution(
+        date=np.array(["2020-01-01"], dtype="datetime64[D]"), amount=np.array([1.0])
+    )
+    for activity in range(100):
+        tl.add_flow_temporal_distribution(td, 1, activity)
+
+    built = []
+    element = Timeline._element
+    monkeypatch.setattr(
+        Timeline, "_element", lambda self, i: built.append(i) or element(self, i)
+    )
+    assert len(tl.data) == 100
+    assert tl.data[-3].activity == 97
+    assert built == [97]
+    assert [o.activity for o in tl.data[10:13]] == [10, 11, 12]
+
+
+def test_timeline_data_aggregated_read_only():
+    tl = Timeline(aggregate="flow")
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2020-01-01"], dtype="datetime64[D]"),
+            amount=np.array([1.0]),
+        ),
+        7,
+        11,
+    )
+    with pytest.raises(ValueError):
+        tl.append(tl.data[0])
+    with pytest.raises(ValueError):
+        tl.data[0].distribution.amount[0] = 99
+    with pytest.raises(ValueError):
+        tl.data = []
+
+
+def test_truncate_dates():
+    date = np.array(
+        ["2020-05-17T10:00:00", "2021-12-31T23:59:59"], dtype="datetime64[s]"
+    )
+    assert bwt_timeline.truncate_dates(date, "Q").tolist() == [
+        np.datetime64("2020-04-01T00:00:00").astype(object),
+        np.datetime64("2021-10-01T00:00:00").astype(object),
+    ]
+    assert bwt_timeline.truncate_dates(date, "M")[0] == np.datetime64("2020-05-01", "s")
+    assert bwt_timeline.truncate_dates(date, "Y")[1] == np.datetime64("2021-01-01", "s")
+    with pytest.raises(ValueError):
+        bwt_timeline.truncate_dates(date, "W")
+
+
+@pytest.mark.parametrize("freq", ["Y", "Q", "M", "D"])
+@pytest.mark.parametrize("by", [(), ("flow",), ("activity",), ("flow", "activity")])
+@pytest.mark.parametrize("dense", [True, False])
+def test_timeline_resample(monkeypatch, freq, by, dense):
+    if not dense:
+        monkeypatch.setattr(bwt_timeline, "DENSE_GROUP_LIMIT", 0)
+    rng = np.random.default_rng(42)
+    tl = Timeline()
+    for flow, activity in [(1, 10), (2, 10), (1, 11), (3, 12)]:
+        tl.add_flow_temporal_distribution(
+            TemporalDistribution(
+                date=np.datetime64("2020-01-01", "s")
+                + rng.integers(0, 3 * 365 * 86400, size=50).astype("timedelta64[s]"),
+                amount=rng.random(50),
+            ),
+            flow,
+            activity,
+        )
+    tl.build_dataframe()
+
+    given = tl.resample(freq, by=by)
+    expected = (
+        tl.df.assign(date=tl.df["date"].dt.to_period(freq).dt.start_time)
+        .groupby(["date"] + list(by))["amount"]
+        .sum()
+        .reset_index()
+    )
+    expected["date"] = expected["date"].astype("datetime64[s]")
+    pd.testing.assert_frame_equal(
+        given, expected[["date"] + list(by) + ["amount"]], check_dtype=False
+    )
+
+
+def test_timeline_resample_errors():
+    tl = Timeline()
+    with pytest.raises(ValueError):
+        tl.resample()
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2020-01-01"], dtype="datetime64[D]"),
+            amount=np.array([1.0]),
+        ),
+        1,
+        2,
+    )
+    tl.build_dataframe()
+    with pytest.raises(ValueError):
+        tl.resample(by=("location",))
+
+
+@pytest.mark.parametrize("database_labels", [["db"], None])
+@bw2test
+def test_add_metadata_to_dataframe_unhashable(database_labels):
+    db = bd.Database("db")
+    db.write(
+        {
+            ("db", "CO2"): {"type": "emission", "name": "carbon dioxide"},
+            ("db", "A"): {"name": "A", "synonyms": ["a", "alpha"]},
+        }
+    )
+    tl = Timeline()
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2020-01-01"], dtype="datetime64[D]"),
+            amount=np.array([1.0]),
+        ),
+        bd.get_node(code="CO2").id,
+        bd.get_node(code="A").id,
+    )
+    tl.build_dataframe()
+    df = tl.add_metadata_to_dataframe(
+        database_labels=database_labels,
+        fields=["name", "synonyms"],
+        categorical=True,
+    )
+    assert isinstance(df["activity_name"].dtype, pd.CategoricalDtype)
+    assert list(df["activity_synonyms"].iloc[0]) == ["a", "alpha"]
+
+
+@bw2test
+def test_add_metadata_to_dataframe_cached(monkeypatch):
+    tl = Timeline()
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2020-01-01", "2021-01-01"], dtype="datetime64[D]"),
+            amount=np.array([1.0, 2.0]),
+        ),
+        1001,
+        1002,
+    )
+    tl.build_dataframe()
+
+    queried = []
+    fetch = bwt_timeline.fetch_node_fields
+    monkeypatch.setattr(
+        bwt_timeline,
+        "fetch_node_fields",
+        lambda ids, fields: queried.append(sorted(ids)) or fetch(ids, fields),
+    )
+    df = tl.add_metadata_to_dataframe(fields=["name"])
+    assert df["flow_name"].isna().all()
+    assert queried == [[1001, 1002]]
+
+    tl.add_metadata_to_dataframe(fields=["name"], categorical=True)
+    assert queried == [[1001, 1002], []]
+    tl.add_metadata_to_dataframe(fields=["name", "unit"])
+    assert queried[-1] == [1001, 1002]
+
+
+def test_build_dataframe_incremental():
+    rng = np.random.default_rng(7)
+
+    def random_td(size):
+        return TemporalDistribution(
+            date=np.datetime64("2020-01-01", "D")
+            + rng.integers(0, 20, size=size).astype("timedelta64[D]"),
+            amount=rng.random(size),
+        )
+
+    tl = Timeline()
+    for batch in range(4):
+        for flow in range(3):
+            tl.add_flow_temporal_distribution(random_td(10), flow, batch)
+        df = tl.build_dataframe()
+        assert tl._df_points == 30 * (batch + 1)
+        # Built from scratch
+        pd.testing.assert_frame_equal(df, Timeline(tl.data).build_dataframe())
+        # Full rebuild from scratch, ties in insertion order
+        order = np.argsort(tl.columns["date"], kind="stable")
+        assert np.array_equal(df["amount"].to_numpy(), tl.columns["amount"][order])
+
+    df["amount"] = 0
+    assert tl.build_dataframe()["amount"].sum() > 0
+
+    tl.data = tl.data[:1]
+    assert len(tl.build_dataframe()) == 10
+
+
+@pytest.mark.parametrize("aggregate", [None, "flow"])
+def test_timeline_checkpoint_arrays(aggregate):
+    tl = Timeline(aggregate=aggregate)
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2020-01-01", "2021-01-01"], dtype="datetime64[D]"),
+            amount=np.array([1.0, 2.0]),
+        ),
+        7,
+        11,
+    )
+    tl.add_flow_temporal_distribution(
+        TemporalDistribution(
+            date=np.array(["2019-01-01"], dtype="datetime64[D]"),
+            amount=np.array([3.0]),
+        ),
+        8,
+        12,
+    )
+    if aggregate is None:
+        tl.add_node_temporal_distribution(
+            TemporalDistribution(
+                date=np.array(["2018-01-01"], dtype="datetime64[D]"),
+                amount=np.array([4.0]),
+            ),
+            4,
+            2,
+            1,
+        )
+    tl.unexplored_score = 1.5
+
+    arrays = storage.timeline_to_arrays(tl)
+    assert not any(key.startswith("timeline_class") for key in arrays)
+    restored = storage.timeline_from_arrays(arrays)
+    assert restored.aggregate == aggregate
+    assert restored.unexplored_score == 1.5
+    for key, value in tl.columns.items():
+        assert np.array_equal(restored.columns[key], value)